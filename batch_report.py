@@ -0,0 +1,141 @@
+import os
+import csv
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import stat_database
+
+
+def summarize_config(config_path):
+    """
+    compute the per-stage and full-game statistics of a config without any UI
+    :param config_path: the path to the config file
+    :return: a json-serializable report dict
+    """
+    database = stat_database.open_database(config_path)
+    try:
+        return summarize_database(config_path, database)
+    finally:
+        database.close()
+
+
+def summarize_database(config_path, database):
+    """
+    compute the per-stage and full-game statistics of an opened database
+    :param config_path: the path to the config file of the database
+    :param database: the StatDatabase
+    :return: a json-serializable report dict
+    """
+    config_stages = database.get_config_stage_dict()
+    (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate) = \
+        database.compute_advanced_summary_statistics()
+
+    stages = []
+    for stage_id, chapters_list in config_stages.items():
+        stage_idx = database.get_stage_idx_from_id(stage_id)
+        total_cap, total_attempt, total_rate = database.get_total_cap_rates(stage_id)
+        chapters = []
+        for i, chapter in enumerate(chapters_list):
+            chapters.append({
+                'Chapter': chapter,
+                'Captures': total_cap[i],
+                'Attempts': total_attempt[i],
+                'Rate': total_rate[i],
+            })
+        stages.append({
+            'Stage': stage_id,
+            'AverageMisses': level_misses_arr[stage_idx],
+            'NNRate': level_nn_rate_arr[stage_idx],
+            'Chapters': chapters,
+        })
+
+    return {
+        'ConfigPath': config_path,
+        'Name': database.config.get('Name', os.path.basename(config_path)),
+        'Sessions': database.get_session_count(),
+        'AverageMisses': total_misses,
+        'NNRate': total_nn_rate,
+        'Stages': stages,
+    }
+
+
+def safe_summarize_config(config_path):
+    """
+    summarize_config that reports a broken config instead of aborting the whole batch
+    """
+    try:
+        return summarize_config(config_path)
+    except Exception as e:
+        return {'ConfigPath': config_path, 'Error': f'{type(e).__name__}: {e}'}
+
+
+def build_reports(config_paths, jobs=None):
+    """
+    summarize many configs in parallel, one process per config
+    :param config_paths: a list of config paths
+    :param jobs: the number of worker processes, defaults to the number of cores
+    :return: a list of report dicts, in the order of config_paths
+    """
+    if jobs == 1 or len(config_paths) <= 1:
+        return [safe_summarize_config(config_path) for config_path in config_paths]
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(safe_summarize_config, config_paths))
+
+
+def write_json_report(reports, output_path):
+    with open(output_path, mode='w', encoding='UTF-8') as f:
+        json.dump(reports, f, indent=4, ensure_ascii=False)
+
+
+def write_csv_report(reports, output_path):
+    """
+    write one row per chapter of every config, with the stage and full-game summaries repeated on each row
+    """
+    with open(output_path, mode='w', encoding='UTF-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['config_path', 'name', 'game_average_misses', 'game_nn_rate',
+                         'stage', 'stage_average_misses', 'stage_nn_rate',
+                         'chapter_idx', 'chapter', 'captures', 'attempts', 'rate'])
+        for report in reports:
+            if 'Error' in report:
+                continue
+            for stage in report['Stages']:
+                for chapter_idx, chapter in enumerate(stage['Chapters']):
+                    writer.writerow([report['ConfigPath'], report['Name'], report['AverageMisses'], report['NNRate'],
+                                     stage['Stage'], stage['AverageMisses'], stage['NNRate'],
+                                     chapter_idx, chapter['Chapter'], chapter['Captures'], chapter['Attempts'],
+                                     chapter['Rate']])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Summarize the statistics of many thstat configs without the UI.',
+        epilog='Each config is opened the way the main program opens it, which can write next to it: '
+               'a missing data file and the aggregates sidecar are created, json data is migrated into '
+               'SQLite or binary storage when the config selects it, and a pending journal is compacted '
+               'into the data file.')
+    parser.add_argument('config_paths', nargs='+', help='paths to config files')
+    parser.add_argument('--json', dest='json_path', help='write the consolidated report as json')
+    parser.add_argument('--csv', dest='csv_path', help='write the consolidated report as csv, one row per chapter')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: all cores)')
+    args = parser.parse_args(argv)
+
+    reports = build_reports(args.config_paths, args.jobs)
+    if args.json_path:
+        write_json_report(reports, args.json_path)
+    if args.csv_path:
+        write_csv_report(reports, args.csv_path)
+    if not args.json_path and not args.csv_path:
+        json.dump(reports, sys.stdout, indent=4, ensure_ascii=False)
+        print()
+
+    failed = [report for report in reports if 'Error' in report]
+    for report in failed:
+        print(f'{report["ConfigPath"]}: {report["Error"]}', file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
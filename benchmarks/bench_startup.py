@@ -0,0 +1,119 @@
+"""
+measure how long thstat takes to start, each sample in a fresh interpreter
+    python benchmarks/bench_startup.py [-n 10] [--config path/to/config.json] [--json out.json]
+import: time to import main, and which heavy optional modules that import pulled in
+ready: time from interpreter start to the config selection window being finalized (needs a display)
+open: time to open the database of --config
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['matplotlib', 'numpy', 'sqlite3', 'asyncio']
+
+IMPORT_SNIPPET = '''
+import sys, time, json
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+''' % (HEAVY_MODULES,)
+
+READY_SNIPPET = '''
+import time, json
+start = time.perf_counter()
+import main
+import stat_ui_init
+main.sg.theme('Gray Gray Gray')
+window = main.create_config_window(stat_ui_init.UIHistory())
+window.finalize()
+elapsed = time.perf_counter() - start
+window.close()
+print(json.dumps({'seconds': elapsed}))
+'''
+
+OPEN_SNIPPET = '''
+import sys, time, json
+import stat_database
+start = time.perf_counter()
+database = stat_database.open_database(sys.argv[1])
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'sessions': database.get_session_count()}))
+'''
+
+
+def run_snippet(snippet, *args):
+    """
+    run a snippet in a fresh interpreter from the repository directory
+    :return: the json printed on the last line of its output, or None if it failed
+    """
+    completed = subprocess.run([sys.executable, '-c', snippet, *args], cwd=REPO_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        return None
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def sample(snippet, repeat, *args):
+    """
+    :return: (timing summary dict, last output) or (None, None) if the snippet failed
+    """
+    seconds = []
+    output = None
+    for _ in range(repeat):
+        output = run_snippet(snippet, *args)
+        if output is None:
+            return None, None
+        seconds.append(output['seconds'])
+    summary = {'min': min(seconds), 'median': statistics.median(seconds), 'max': max(seconds), 'samples': repeat}
+    return summary, output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the startup time of thstat.')
+    parser.add_argument('-n', '--repeat', type=int, default=10, help='samples per measurement')
+    parser.add_argument('--config', help='also time opening the database of this config')
+    parser.add_argument('--json', dest='json_path', help='write the results as json')
+    args = parser.parse_args(argv)
+
+    results = {'python': sys.version.split()[0]}
+    import_summary, import_output = sample(IMPORT_SNIPPET, args.repeat)
+    if import_summary is None:
+        print('importing main failed', file=sys.stderr)
+        return 1
+    results['import'] = import_summary
+    results['heavy_modules_loaded'] = import_output['loaded']
+
+    ready_summary, ready_output = sample(READY_SNIPPET, args.repeat)
+    results['ready'] = ready_summary  # None when no display is available
+
+    if args.config:
+        open_summary, open_output = sample(OPEN_SNIPPET, args.repeat, os.path.abspath(args.config))
+        results['open'] = open_summary
+        if open_output is not None:
+            results['open']['sessions'] = open_output['sessions']
+
+    for name in ['import', 'ready', 'open']:
+        if name not in results:
+            continue
+        summary = results[name]
+        if summary is None:
+            print(f'{name:>8}: skipped (failed, e.g. no display)')
+        else:
+            print(f'{name:>8}: median {summary["median"] * 1000:.1f} ms, '
+                  f'min {summary["min"] * 1000:.1f} ms, max {summary["max"] * 1000:.1f} ms')
+    print(f'heavy modules loaded by import: {", ".join(results["heavy_modules_loaded"]) or "none"}')
+
+    if args.json_path:
+        with open(args.json_path, mode='w', encoding='UTF-8') as f:
+            json.dump(results, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+time the main data paths of thstat on synthetic practice data of growing size
+    python benchmarks/bench_suite.py [--runs 1000 10000 100000] [--json out.json] [--compare old.json]
+every benchmark is repeated and reported as min/median seconds; --json saves the results so that runs
+of different versions can be compared with --compare
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import statistics
+import subprocess
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import stat_config
+import stat_database
+import synthetic
+
+
+def measure(function, repeat):
+    """
+    :param function: a function without arguments
+    :param repeat: the number of calls
+    :return: {'min', 'median', 'repeat'} in seconds
+    """
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return {'min': min(seconds), 'median': statistics.median(seconds), 'repeat': repeat}
+
+
+def get_git_revision():
+    try:
+        completed = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                   capture_output=True, text=True)
+    except OSError:
+        return None
+    return completed.stdout.strip() or None
+
+
+def bench_size(config_path, repeat, mutation_count):
+    """
+    run every benchmark on one synthetic config
+    :return: {benchmark name: timing}
+    """
+    results = {}
+    results['load_config'] = measure(lambda: stat_config.load_config(config_path), repeat)
+    config, data = stat_config.load_config(config_path)
+    results['save_config'] = measure(lambda: stat_config.save_config(config_path, config, data), repeat)
+    results['open_database'] = measure(lambda: stat_database.open_database(config_path), repeat)
+
+    database = stat_database.open_database(config_path)
+    config_stages = database.get_config_stage_dict()
+    results['aggregate_cap_rates'] = measure(
+        lambda: [database.aggregate_cap_rates(stage_id) for stage_id in config_stages], repeat)
+    results['compute_advanced_summary_statistics'] = measure(database.compute_advanced_summary_statistics, repeat)
+
+    session_ids = database.get_session_ids()
+    last_session_id = session_ids[-1]
+    try:
+        import stat_menu
+    except ImportError:  # PySimpleGUI is not installed
+        stat_menu = None
+    if stat_menu is not None:
+        results['create_session_text_statistics_layout'] = measure(
+            lambda: stat_menu.create_session_text_statistics_layout(database, last_session_id), repeat)
+
+    result = database.get_session_results(last_session_id)[0]
+    results['add_game_result'] = measure(lambda: database.add_game_result(last_session_id, result), mutation_count)
+    results['pop_game_result'] = measure(lambda: database.pop_game_result(last_session_id), mutation_count)
+    # removing the oldest sessions first, once the worst case for anything indexed by position
+    removal_count = min(mutation_count, database.get_session_count() - 1)
+    removed_ids = iter(session_ids[:removal_count])
+    results['remove_game_session'] = measure(lambda: database.remove_game_session(next(removed_ids)), removal_count)
+    database.close()
+    return results
+
+
+def print_results(report, baseline=None):
+    """
+    print a table of median times, with the ratio to the baseline report when given
+    """
+    baseline_sizes = {}
+    if baseline is not None:
+        baseline_sizes = {size['runs']: size['benchmarks'] for size in baseline['sizes']}
+    for size in report['sizes']:
+        print(f'{size["runs"]} runs, {size["sessions"]} sessions')
+        baseline_benchmarks = baseline_sizes.get(size['runs'], {})
+        for name, timing in size['benchmarks'].items():
+            line = f'    {name:<40} {timing["median"] * 1000:>10.3f} ms'
+            if name in baseline_benchmarks and baseline_benchmarks[name]['median'] > 0:
+                line += f'  x{timing["median"] / baseline_benchmarks[name]["median"]:.2f} vs baseline'
+            print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark thstat on synthetic practice data.')
+    parser.add_argument('--runs', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='total number of runs of each synthetic data set')
+    parser.add_argument('--stages', type=int, default=6, help='number of stages')
+    parser.add_argument('--chapters', type=int, default=10, help='number of chapters per stage')
+    parser.add_argument('--attributes', type=int, default=2, help='number of dropdown attributes')
+    parser.add_argument('--storage', default=None, help='the Storage config key, e.g. Journal, SQLite, Binary')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='repetitions of each benchmark')
+    parser.add_argument('--mutations', type=int, default=100, help='repetitions of each mutation benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='random seed of the generator')
+    parser.add_argument('--json', dest='json_path', help='write the results as json')
+    parser.add_argument('--compare', help='a json file written by an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    report = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': get_git_revision(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'parameters': {'stages': args.stages, 'chapters': args.chapters, 'attributes': args.attributes,
+                       'storage': args.storage, 'repeat': args.repeat, 'mutations': args.mutations,
+                       'seed': args.seed},
+        'sizes': [],
+    }
+    work_dir = tempfile.mkdtemp(prefix='thstat-bench-')
+    try:
+        for run_count in args.runs:
+            config_path = synthetic.write_synthetic(os.path.join(work_dir, str(run_count)), run_count,
+                                                    storage=args.storage, seed=args.seed,
+                                                    stage_count=args.stages, chapters_per_stage=args.chapters,
+                                                    attribute_count=args.attributes)
+            session_count = stat_database.open_database(config_path).get_session_count()
+            benchmarks = bench_size(config_path, args.repeat, args.mutations)
+            report['sizes'].append({'runs': run_count, 'sessions': session_count, 'benchmarks': benchmarks})
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, mode='r', encoding='UTF-8') as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    if args.json_path:
+        with open(args.json_path, mode='w', encoding='UTF-8') as f:
+            json.dump(report, f, indent=4)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+generate synthetic configs and practice data for the benchmarks
+the data imitates real practice: harder chapters are captured less often, a miss makes the player more
+likely to quit the run, and quitting truncates the run like the gameplay menu does
+"""
+import os
+import json
+import random
+import datetime
+
+import constants
+import stat_config
+
+
+def generate_config(stage_count=6, chapters_per_stage=10, attribute_count=2, values_per_attribute=4):
+    """
+    :return: a config dict with stage_count stages and attribute_count dropdown attributes
+    """
+    config = {'Name': f'synthetic {stage_count}x{chapters_per_stage}', constants.CONFIG_CHAPTERS: {}}
+    for stage in range(stage_count):
+        config[constants.CONFIG_CHAPTERS][f'stage {stage + 1}'] = \
+            [f'chapter {stage + 1}-{chapter + 1}' for chapter in range(chapters_per_stage)]
+    for attribute in range(attribute_count):
+        name = f'Attribute{attribute + 1}'
+        config[name] = {
+            'Type': 'SelectFromMainMenuDropdown',
+            'DisplayText': name,
+            'SaveKey': name,
+            'Values': [f'value {value + 1}' for value in range(values_per_attribute)],
+        }
+    return config
+
+
+def get_attribute_names(config):
+    return [key for key, value in config.items() if isinstance(value, dict) and
+            value.get('Type') == 'SelectFromMainMenuDropdown']
+
+
+def generate_data(config, run_count, runs_per_session=50, seed=0):
+    """
+    :param config: a config dict, as returned by generate_config
+    :param run_count: the total number of runs
+    :param runs_per_session: the average number of runs per session
+    :param seed: the random seed
+    :return: a data dict holding run_count runs
+    """
+    rng = random.Random(seed)
+    config_stages = config[constants.CONFIG_CHAPTERS]
+    capture_rates = {stage_id: [rng.uniform(0.4, 0.98) for _ in chapters_list]
+                     for stage_id, chapters_list in config_stages.items()}
+    attribute_names = get_attribute_names(config)
+    date = datetime.date(2020, 1, 1)
+
+    sessions = []
+    remaining = run_count
+    while remaining > 0:
+        session_run_count = min(remaining, max(1, int(rng.gauss(runs_per_session, runs_per_session / 4))))
+        remaining -= session_run_count
+        attributes = {name: rng.choice(config[name]['Values']) for name in attribute_names}
+        results = []
+        for _ in range(session_run_count):
+            result = {}
+            quit_run = False
+            for stage_id, rates in capture_rates.items():
+                outcomes = []
+                for rate in rates:
+                    if quit_run:
+                        break
+                    success = 1 if rng.random() < rate else 0
+                    outcomes.append(success)
+                    if success == 0 and rng.random() < 0.3:  # a miss often makes the player reset
+                        quit_run = True
+                    elif rng.random() < 0.005:
+                        quit_run = True
+                result[stage_id] = outcomes
+            results.append(result)
+        sessions.append({'Date': date.isoformat(), 'Attributes': attributes, constants.DATA_RESULT: results})
+        date += datetime.timedelta(days=rng.choice([0, 1, 1, 1, 2]))
+    return {constants.DATA_DATA: sessions}
+
+
+def write_synthetic(directory, run_count, storage=None, seed=0, **config_options):
+    """
+    write a synthetic config and its data file into a directory
+    :param directory: the directory, created if needed
+    :param run_count: the total number of runs
+    :param storage: the value of the Storage config key, None for the default
+    :param seed: the random seed
+    :param config_options: passed to generate_config
+    :return: the path to the config file
+    """
+    os.makedirs(directory, exist_ok=True)
+    config = generate_config(**config_options)
+    if storage is not None:
+        config[constants.CONFIG_STORAGE] = storage
+    config_path = os.path.join(directory, 'config.json')
+    with open(config_path, mode='w', encoding='UTF-8') as f:
+        json.dump(config, f, indent=4, ensure_ascii=False)
+    data = generate_data(config, run_count, seed=seed)
+    stat_config.write_file_atomic(stat_config.get_data_path(config_path), stat_config.serialize_data(data))
+    return config_path
@@ -2,10 +2,110 @@
 # hardcoded-config keys
 CONFIG_CHAPTERS = 'Chapters'
 
+# optional config keys
+CONFIG_STORAGE = 'Storage'
+CONFIG_COLUMNAR = 'Columnar'  # true to keep a numpy column layout of the results for vectorized aggregation
+CONFIG_ASYNC_COMMIT = 'AsyncCommit'  # true to write commits on a background thread (JSON and Journal storage)
+CONFIG_STREAMING = 'Streaming'  # true/false to force scanning the json data file session by session, see stat_stream
+CONFIG_CHART_RENDERER = 'ChartRenderer'  # how the statistics view draws its charts, one of the CHART_RENDERER values
+CONFIG_LIVE_FEED = 'LiveFeed'  # {"Source": one of the LIVE_SOURCE values, "Path": path} to record runs from a live feed
+
+# storage modes, selected by the CONFIG_STORAGE key
+STORAGE_JSON = 'JSON'  # rewrite the whole data file on every commit (default)
+STORAGE_JOURNAL = 'Journal'  # append each change to a journal, compact it into the data file from time to time
+STORAGE_SQLITE = 'SQLite'  # keep sessions, runs and chapter outcomes in indexed SQLite tables
+STORAGE_BINARY = 'Binary'  # bit-packed binary data file, memory-mapped and decoded lazily
+
+# chart renderers, selected by the CONFIG_CHART_RENDERER key
+CHART_RENDERER_NATIVE = 'Native'  # sg.Graph primitives, no matplotlib needed (default)
+CHART_RENDERER_MATPLOTLIB = 'Matplotlib'  # matplotlib images
+CHART_SIZE = (640, 480)  # pixels, the size of a default matplotlib figure
+
 # hardcoded-data keys
 DATA_DATA = 'Data'
 DATA_RESULT = 'Result'
+DATA_JOURNAL_SEQ = 'JournalSeq'
+DATA_SESSION_IDS = 'SessionIds'  # the persistent id of each session of Data, in the same order
+DATA_NEXT_SESSION_ID = 'NextSessionId'  # ids are never reused, even after the latest session is removed
+
+# journal record keys and operations
+JOURNAL_SEQ = 'seq'
+JOURNAL_OP = 'op'
+JOURNAL_SESSION_ID = 'session_id'
+JOURNAL_SESSION_IDX = 'session_idx'  # journals written before session ids address sessions by position
+JOURNAL_SESSION = 'session'
+JOURNAL_RESULT = 'result'
+JOURNAL_OP_ADD_SESSION = 'add_session'
+JOURNAL_OP_REMOVE_SESSION = 'remove_session'
+JOURNAL_OP_ADD_RESULT = 'add_result'
+JOURNAL_OP_POP_RESULT = 'pop_result'
+# number of journal records after which the journal is folded back into the data file
+JOURNAL_COMPACT_THRESHOLD = 256
+
+# streaming json data files, see stat_stream
+STREAMING_MIN_FILE_SIZE = 32 * 1024 * 1024  # data files at least this large are streamed unless the config says otherwise
+STREAMING_MATERIALIZED_SESSIONS = 20  # the latest sessions stay decoded, older ones are read back on demand
+STREAMING_CHUNK_SIZE = 1024 * 1024  # characters read from the data file at a time
+
+# confidence intervals, see stat_confidence
+CONFIDENCE_LEVEL = 0.95
+CONFIDENCE_Z = 1.959964  # the standard normal quantile of CONFIDENCE_LEVEL
+BOOTSTRAP_RESAMPLES = 10000  # the most resamples, drawn while they fit in BOOTSTRAP_TIME_BUDGET
+BOOTSTRAP_MIN_RESAMPLES = 1000  # the fewest resamples, 25 in each tail of a 95% interval
+BOOTSTRAP_TIME_BUDGET = 1.  # seconds the resamples of a history are expected to take
+# measured cost of a resample: drawing one run index, or one pattern of a multinomial; the cheaper way is used
+BOOTSTRAP_SECONDS_PER_RUN = 1e-8
+BOOTSTRAP_SECONDS_PER_PATTERN = 6e-8
+BOOTSTRAP_BATCH_CELLS = 4 * 1024 * 1024  # resamples x runs drawn at once, bounds the memory of a batch
+# resamples expected to take at least this long are split across processes, which take about 0.5s to start
+BOOTSTRAP_PROCESS_MIN_SECONDS = 2.
+BOOTSTRAP_PROCESSES = 4
+BOOTSTRAP_REFRESH_MS = 200  # how often a statistics view checks whether its bootstrap intervals are ready
+
+# seconds the background writer waits after a commit so that a burst of commits becomes a single write
+COMMIT_COALESCE_DELAY = 0.1
+
+# workspace of several configs, see stat_workspace
+WORKSPACE_MAX_LOADED = 4  # databases kept in memory, the least recently used one is closed beyond this
+WORKSPACE_LOAD_WORKERS = 4
+WORKSPACE_REFRESH_MS = 200  # how often the workspace window checks for finished loads
+
+# bytes of the data file hashed at a time to validate its aggregate sidecar, see stat_aggregates
+AGGREGATES_HASH_CHUNK_SIZE = 1024 * 1024
+
+# rows buffered before a write of the export, and the rows of a row group of the columnar export, see stat_export
+EXPORT_CHUNK_ROWS = 65536
+
+# live event feed written by a helper tool while the player practices, see stat_live
+LIVE_SOURCE_TAIL = 'Tail'  # a jsonl file the helper tool appends to
+LIVE_SOURCE_FIFO = 'FIFO'  # a named pipe, POSIX only
+LIVE_SOURCE_SOCKET = 'Socket'  # a unix socket the helper tool connects to, POSIX only
+LIVE_POLL_INTERVAL = 0.1  # seconds between two checks of a tailed file
+# live event keys and types
+LIVE_TYPE = 'type'
+LIVE_STAGE = 'stage'
+LIVE_CHAPTER = 'chapter'
+LIVE_CAPTURED = 'captured'
+LIVE_EVENT_CHAPTER = 'chapter'
+LIVE_EVENT_END = 'end'
+LIVE_EVENT_DISCARD = 'discard'
+
+# ui settings store, see stat_ui_init
+ENV_SETTINGS_DIR = 'THSTAT_SETTINGS_DIR'  # overrides the per-user settings directory
+SETTINGS_DIR_NAME = 'thstat'
+SETTINGS_FILE_NAME = 'settings.json'
+LEGACY_UI_HISTORY_FILE_NAME = 'ui.init'  # the line-based file of older versions, migrated once
+SETTINGS_WRITE_DELAY = 1.  # seconds a change waits so that a burst of changes becomes a single write
+SETTINGS_MAX_CONFIGS = 20  # configs whose ui state is remembered, the least recently used one is forgotten
+
+# profiling, see stat_profile
+ENV_PROFILE = 'THSTAT_PROFILE'
+PROFILE_MAX_TRACE_EVENTS = 100000  # later calls are still counted in the summary, but not traced
 
 # init_info keys
 KEY_CONFIG_PATH = 'config_path'
+KEY_WORKSPACE_CONFIG_PATHS = 'workspace_config_paths'  # a list of paths
+# per-config ui state keys
+KEY_LAST_SESSION_ID = 'last_session_id'
+KEY_LAST_TAB = 'last_tab'
 
@@ -1,19 +1,21 @@
 import PySimpleGUI as sg
-import stat_config
-from stat_database import StatDatabase
-import time
+import stat_database
 import stat_menu
 import stat_ui_init
 import ctypes
 import constants
-ctypes.windll.shcore.SetProcessDpiAwareness(2)
+if hasattr(ctypes, 'windll'):  # windows only
+    ctypes.windll.shcore.SetProcessDpiAwareness(2)
 
 
-def ask_for_config(init_info):
+WORKSPACE_STR = 'Workspace'
+
+
+def create_config_window(init_info):
     """
-    ask for a config path and return the result
+    create the window that asks for the config path
     :param init_info: the ui initialization info
-    :return: a tuple of (config_path, config, data)
+    :return: the window
     """
     if init_info.has(constants.KEY_CONFIG_PATH):
         default_text = init_info.get(constants.KEY_CONFIG_PATH)
@@ -21,22 +23,52 @@ def ask_for_config(init_info):
         default_text = ''
     layout = [[sg.Text('Please enter the path to the config file')],
               [sg.InputText(default_text=default_text), sg.FileBrowse()],
-              [sg.Submit(), sg.Cancel()]]
+              [sg.Submit(), sg.Cancel(), sg.Button(WORKSPACE_STR)]]
+
+    return sg.Window('thstat', layout)
 
-    window = sg.Window('thstat', layout)
+
+def ask_for_config(init_info):
+    """
+    ask for a config path and load the database it refers to
+    :param init_info: the ui initialization info
+    :return: the loaded StatDatabase, or None if the user cancelled or used the workspace instead
+    """
+    window = create_config_window(init_info)
     while True:
         event, values = window.read()
-        if event in [sg.WIN_CLOSED, 'Cancel', 'Submit']:  # if user closes window or clicks cancel
+        if event in [sg.WIN_CLOSED, 'Cancel', 'Submit', WORKSPACE_STR]:  # if user closes window or clicks cancel
             break
     window.close()
 
-    if event != 'Submit':
+    if event == WORKSPACE_STR:
+        open_workspace(init_info, values[0])
+        return None
+    elif event != 'Submit':
         return None
     else:
         config_path = values[0]
-        config, data = stat_config.load_config(config_path)
+        database = stat_database.open_database(config_path)
         init_info.set(constants.KEY_CONFIG_PATH, config_path)
-        return config_path, config, data
+        return database
+
+
+def open_workspace(init_info, config_path):
+    """
+    open the configs of the workspace, plus the entered config if any, and show the dashboard
+    :param init_info: the ui initialization info
+    :param config_path: the config path entered in the config window, may be empty
+    """
+    import stat_workspace
+    config_paths = []
+    if init_info.has(constants.KEY_WORKSPACE_CONFIG_PATHS):
+        config_paths = init_info.get(constants.KEY_WORKSPACE_CONFIG_PATHS)
+    workspace = stat_workspace.Workspace(config_paths)
+    if config_path:
+        workspace.add_config(config_path)
+        init_info.set(constants.KEY_WORKSPACE_CONFIG_PATHS, list(workspace.config_paths))
+    stat_menu.workspace_menu(init_info, workspace)
+    workspace.close()
 
 
 def main():
@@ -47,15 +79,19 @@ def main():
     sg.theme('Gray Gray Gray')
     # font = ("Courier New", 11)
     # sg.set_options(font=font)
-    result = ask_for_config(init_info)
-    if result:
-        config_path, config, data = result
-    else:
-        return
-    database = StatDatabase(config_path, config, data)
+    database = None
+    try:
+        database = ask_for_config(init_info)
+        if database is None:
+            return
 
-    # enter the main menu
-    stat_menu.main_menu(init_info, database)
+        # enter the main menu
+        stat_menu.main_menu(init_info, database)
+    finally:
+        # close even after an error, so the journal is compacted and the pending commits are written
+        if database is not None:
+            database.close()
+        init_info.close()
 
 
 if __name__ == "__main__":
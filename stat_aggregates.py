@@ -0,0 +1,192 @@
+import os
+import sys
+import json
+import array
+import struct
+import hashlib
+import collections
+
+import stat_config
+import constants
+
+
+# the aggregate sidecar of a data file: the capture/attempt counters of the sessions, the totals and the attribute
+# values, so that a launch does not count every run again
+# file layout, all integers little-endian:
+#   magic, header length (uint32), header json
+#   counter rows: one row of uint32 per counter, the captures of the chapters of every stage in order, then the
+#   attempts; first a row per session, then the total row, then a row per attribute value
+# the header json holds
+#   Chapters: hash of the Chapters layout the counters were counted with
+#   DataHash: hash of the content of the data file the counters describe
+#   JournalSeq: the last journal record the counters include, on top of the data file
+#   SessionIds: the session of each session row
+#   AttributeValues: [attribute name, value] of each attribute value row
+# a sidecar whose Chapters or DataHash do not match is ignored; one that matches describes every session except
+# those changed by journal records after its JournalSeq, the tail, which are counted again
+MAGIC = b'THSTAGG\x01'
+PREFIX = struct.Struct('<8sI')
+
+HEADER_CHAPTERS = 'Chapters'
+HEADER_DATA_HASH = 'DataHash'
+HEADER_JOURNAL_SEQ = 'JournalSeq'
+HEADER_SESSION_IDS = 'SessionIds'
+HEADER_ATTRIBUTE_VALUES = 'AttributeValues'
+
+# counters read from a sidecar; total_counters and attribute_counters are None if a session was counted again
+LoadedAggregates = collections.namedtuple('LoadedAggregates',
+                                          ['session_counters', 'total_counters', 'attribute_counters'])
+
+
+def hash_file(path):
+    """
+    :param path: the path to the file
+    :return: the hex digest of the content of the file
+    """
+    digest = hashlib.sha1()
+    with open(path, mode='rb') as f:
+        while True:
+            chunk = f.read(constants.AGGREGATES_HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_chapters(config_stages):
+    """
+    :param config_stages: the Chapters dict of the config
+    :return: the hex digest of the layout of the chapters
+    """
+    return hashlib.sha1(json.dumps(config_stages, ensure_ascii=False).encode('UTF-8')).hexdigest()
+
+
+def take_counters(config_stages, session_counters, total_counters, attribute_counters):
+    """
+    copy the counters into counter rows, done under the database lock so they match the data being saved
+    :param config_stages: the Chapters dict of the config
+    :param session_counters: {session id: {stage_id: (cap_list, attempt_list)}}
+    :param total_counters: {stage_id: (cap_list, attempt_list)}
+    :param attribute_counters: {attribute name: {value: {stage_id: (cap_list, attempt_list)}}}
+    :return: (session ids, [attribute name, value] list, counter rows) for save_aggregates
+    """
+    rows = array.array('I')
+    for counters in session_counters.values():
+        append_row(config_stages, counters, rows)
+    append_row(config_stages, total_counters, rows)
+    attribute_values = []
+    for name, value_counters in attribute_counters.items():
+        for value, counters in value_counters.items():
+            attribute_values.append([name, value])
+            append_row(config_stages, counters, rows)
+    return list(session_counters.keys()), attribute_values, rows
+
+
+def append_row(config_stages, counters, rows):
+    for stage_id in config_stages:
+        rows.extend(counters[stage_id][0])
+    for stage_id in config_stages:
+        rows.extend(counters[stage_id][1])
+
+
+def save_aggregates(config_path, config_stages, data_hash, journal_seq, counters):
+    """
+    replace the aggregate sidecar of a config
+    :param config_path: the path to the config file
+    :param config_stages: the Chapters dict of the config
+    :param data_hash: the hash of the data file, see hash_file
+    :param journal_seq: the last journal record included in the counters
+    :param counters: the counters returned by take_counters
+    """
+    session_ids, attribute_values, rows = counters
+    header = {
+        HEADER_CHAPTERS: hash_chapters(config_stages),
+        HEADER_DATA_HASH: data_hash,
+        HEADER_JOURNAL_SEQ: journal_seq,
+        HEADER_SESSION_IDS: session_ids,
+        HEADER_ATTRIBUTE_VALUES: attribute_values,
+    }
+    header_bytes = json.dumps(header, separators=(',', ':'), ensure_ascii=False).encode('UTF-8')
+    if sys.byteorder != 'little':
+        rows = array.array('I', rows)
+        rows.byteswap()
+    aggregates_path = stat_config.get_aggregates_path(config_path)
+    temp_path = f'{aggregates_path}.tmp'
+    with open(temp_path, mode='wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(rows.tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, aggregates_path)
+
+
+def load_aggregates(config_path, config_stages, data_hash, journal):
+    """
+    read the aggregate sidecar of a config if it describes the data
+    :param config_path: the path to the config file
+    :param config_stages: the Chapters dict of the config
+    :param data_hash: the hash of the data file, see hash_file
+    :param journal: the journal records replayed on top of the data file
+    :return: the LoadedAggregates, or None if there is no valid sidecar
+    """
+    aggregates_path = stat_config.get_aggregates_path(config_path)
+    if not os.path.exists(aggregates_path):
+        return None
+    with open(aggregates_path, mode='rb') as f:
+        content = f.read()
+    if len(content) < PREFIX.size:
+        return None
+    magic, header_length = PREFIX.unpack_from(content)
+    if magic != MAGIC:
+        return None
+    try:
+        header = json.loads(content[PREFIX.size:PREFIX.size + header_length].decode('UTF-8'))
+    except ValueError:
+        return None
+    if header.get(HEADER_CHAPTERS) != hash_chapters(config_stages) or header.get(HEADER_DATA_HASH) != data_hash:
+        return None
+
+    # the sessions changed after the sidecar was written are counted again
+    changed_session_ids = set()
+    for record in journal:
+        if record[constants.JOURNAL_SEQ] <= header[HEADER_JOURNAL_SEQ]:
+            continue
+        if record[constants.JOURNAL_OP] == constants.JOURNAL_OP_ADD_SESSION:
+            continue  # a new session is not in the sidecar
+        if constants.JOURNAL_SESSION_ID not in record:
+            return None  # a record of an older version, addressed by position
+        changed_session_ids.add(record[constants.JOURNAL_SESSION_ID])
+
+    rows = array.array('I')
+    rows.frombytes(content[PREFIX.size + header_length:])
+    if sys.byteorder != 'little':
+        rows.byteswap()
+    stage_slices = []
+    width = 0
+    for stage_id, chapters_list in config_stages.items():
+        stage_slices.append((stage_id, width, width + len(chapters_list)))
+        width += len(chapters_list)
+    row_count = len(header[HEADER_SESSION_IDS]) + 1 + len(header[HEADER_ATTRIBUTE_VALUES])
+    if len(rows) != row_count * 2 * width:
+        return None
+
+    def read_row(row_idx):
+        offset = row_idx * 2 * width
+        return {stage_id: (rows[offset + start:offset + end].tolist(),
+                           rows[offset + width + start:offset + width + end].tolist())
+                for stage_id, start, end in stage_slices}
+
+    session_counters = {}
+    for row_idx, session_id in enumerate(header[HEADER_SESSION_IDS]):
+        if session_id not in changed_session_ids:
+            session_counters[session_id] = read_row(row_idx)
+    if len(changed_session_ids) != 0:
+        return LoadedAggregates(session_counters, None, None)
+    row_idx = len(header[HEADER_SESSION_IDS])
+    total_counters = read_row(row_idx)
+    attribute_counters = {}
+    for name, value in header[HEADER_ATTRIBUTE_VALUES]:
+        row_idx += 1
+        attribute_counters.setdefault(name, {})[value] = read_row(row_idx)
+    return LoadedAggregates(session_counters, total_counters, attribute_counters)
@@ -0,0 +1,332 @@
+import os
+import json
+import mmap
+import struct
+
+import stat_config
+import stat_lazy
+import stat_profile
+import constants
+
+
+# file layout, all integers little-endian:
+#   magic, header length (uint32), header json
+#   session count (uint32)
+#   session table: one fixed-size record per session
+#       date index (uint32), first run (uint64), run count (uint32), one uint16 value index per attribute
+#   runs: one fixed-size record per run, for each stage in order
+#       reached chapter count (uint8), capture bitmask (ceil(chapters / 8) bytes, bit j = chapter j)
+# the header json holds the stage layout, the date and attribute dictionaries and any other top-level data keys
+MAGIC = b'THSTBIN\x01'
+PREFIX = struct.Struct('<8sI')
+COUNT = struct.Struct('<I')
+MISSING_VALUE = 0xFFFF
+MAX_CHAPTERS = 0xFF  # the reached chapter count is a uint8
+MAX_ATTRIBUTE_VALUES = MISSING_VALUE  # value indices are uint16 and 0xFFFF marks a missing value
+
+HEADER_STAGES = 'Stages'
+HEADER_DATES = 'Dates'
+HEADER_ATTRIBUTES = 'Attributes'
+HEADER_EXTRA = 'Extra'
+
+
+def get_stage_layout(config_stages):
+    """
+    :param config_stages: the Chapters dict of the config
+    :return: a list of [stage_id, chapter count]
+    """
+    return [[stage_id, len(chapters_list)] for stage_id, chapters_list in config_stages.items()]
+
+
+def check_stage_layout(stage_layout):
+    """
+    raise ValueError if a stage has more chapters than a run record can hold
+    :param stage_layout: a list of [stage_id, chapter count]
+    """
+    for stage_id, chapter_count in stage_layout:
+        if chapter_count > MAX_CHAPTERS:
+            raise ValueError(f'stage {stage_id} has {chapter_count} chapters, '
+                             f'binary storage supports at most {MAX_CHAPTERS}')
+
+
+def get_session_struct(attribute_count):
+    return struct.Struct('<IQI' + 'H' * attribute_count)
+
+
+def get_run_size(stage_layout):
+    return sum(1 + (chapter_count + 7) // 8 for stage_id, chapter_count in stage_layout)
+
+
+def encode_run(stage_layout, result):
+    """
+    pack a result into a run record
+    :param stage_layout: a list of [stage_id, chapter count]
+    :param result: a dict {stage_id: list of 0 (fail) or 1 (capture)}
+    :return: the run record bytes
+    """
+    run_bytes = bytearray()
+    for stage_id, chapter_count in stage_layout:
+        success_list = result[stage_id]
+        if len(success_list) > chapter_count:
+            raise ValueError(f'a result of stage {stage_id} has {len(success_list)} chapters, '
+                             f'the stage has {chapter_count}')
+        mask = 0
+        for j, success in enumerate(success_list):
+            mask |= success << j
+        run_bytes.append(len(success_list))
+        run_bytes += mask.to_bytes((chapter_count + 7) // 8, 'little')
+    return bytes(run_bytes)
+
+
+class BinarySessionList(stat_lazy.LazySessionList):
+    """
+    The sessions of a binary data file, memory-mapped and decoded on first access.
+    A slot handle is the index of the session in the file.
+    """
+    def __init__(self, binary_path):
+        self.binary_path = binary_path
+        self.file = None
+        self.buffer = None
+        self.open_file()
+        super().__init__(range(self.session_count))
+
+    def open_file(self):
+        """
+        map the file and parse its header
+        """
+        self.file = open(self.binary_path, mode='rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = PREFIX.unpack_from(self.buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{self.binary_path} is not a thstat binary data file')
+        header = json.loads(bytes(self.buffer[PREFIX.size:PREFIX.size + header_length]).decode('UTF-8'))
+        self.stage_layout = header[HEADER_STAGES]
+        self.dates = header[HEADER_DATES]
+        self.attributes = header[HEADER_ATTRIBUTES]  # a list of [attribute name, list of values]
+        self.extra = header[HEADER_EXTRA]
+
+        offset = PREFIX.size + header_length
+        self.session_count = COUNT.unpack_from(self.buffer, offset)[0]
+        self.session_struct = get_session_struct(len(self.attributes))
+        self.session_table_offset = offset + COUNT.size
+        self.runs_offset = self.session_table_offset + self.session_count * self.session_struct.size
+        self.run_size = get_run_size(self.stage_layout)
+
+    def close_file(self):
+        self.buffer.close()
+        self.file.close()
+
+    def close(self):
+        self.close_file()
+
+    def read_session_record(self, handle):
+        """
+        :return: (date index, first run, run count, attribute value indices)
+        """
+        record = self.session_struct.unpack_from(self.buffer, self.session_table_offset + handle * self.session_struct.size)
+        return record[0], record[1], record[2], record[3:]
+
+    def iter_runs(self, first_run, run_count):
+        """
+        yield the stages of each run as a list of (reached chapter count, capture bitmask)
+        """
+        for run_idx in range(first_run, first_run + run_count):
+            offset = self.runs_offset + run_idx * self.run_size
+            stages = []
+            for stage_id, chapter_count in self.stage_layout:
+                mask_size = (chapter_count + 7) // 8
+                reached = self.buffer[offset]
+                mask = int.from_bytes(self.buffer[offset + 1:offset + 1 + mask_size], 'little')
+                stages.append((reached, mask))
+                offset += 1 + mask_size
+            yield stages
+
+    def get_handle_attributes(self, handle):
+        date_idx, first_run, run_count, value_indices = self.read_session_record(handle)
+        session_attributes = {}
+        for (name, values), value_idx in zip(self.attributes, value_indices):
+            if value_idx != MISSING_VALUE:
+                session_attributes[name] = values[value_idx]
+        return session_attributes
+
+    def get_handle_date(self, handle):
+        return self.dates[self.read_session_record(handle)[0]]
+
+    def load_session(self, handle):
+        date_idx, first_run, run_count, value_indices = self.read_session_record(handle)
+        session_attributes = self.get_handle_attributes(handle)
+        results = []
+        for stages in self.iter_runs(first_run, run_count):
+            result = {}
+            for (stage_id, chapter_count), (reached, mask) in zip(self.stage_layout, stages):
+                result[stage_id] = [(mask >> j) & 1 for j in range(reached)]
+            results.append(result)
+        return {
+            'Date': self.dates[date_idx],
+            'Attributes': session_attributes,
+            constants.DATA_RESULT: results,
+        }
+
+    def count_handle_outcomes(self, handle, config_stages):
+        if get_stage_layout(config_stages) != self.stage_layout:
+            return super().count_handle_outcomes(handle, config_stages)
+        date_idx, first_run, run_count, value_indices = self.read_session_record(handle)
+        # attempts only depend on how far each run went, captures only on the set bits
+        reached_counts = []
+        counters = {}
+        for stage_id, chapter_count in self.stage_layout:
+            reached_counts.append([0] * (chapter_count + 1))
+            counters[stage_id] = ([0] * chapter_count, [0] * chapter_count)
+        for stages in self.iter_runs(first_run, run_count):
+            for stage_idx, (reached, mask) in enumerate(stages):
+                reached_counts[stage_idx][reached] += 1
+                capture_list = counters[self.stage_layout[stage_idx][0]][0]
+                while mask:
+                    low_bit = mask & -mask
+                    capture_list[low_bit.bit_length() - 1] += 1
+                    mask ^= low_bit
+        for stage_idx, (stage_id, chapter_count) in enumerate(self.stage_layout):
+            attempt_list = counters[stage_id][1]
+            runs_reaching = 0
+            for j in range(chapter_count - 1, -1, -1):
+                runs_reaching += reached_counts[stage_idx][j + 1]
+                attempt_list[j] = runs_reaching
+        return counters
+
+
+@stat_profile.timed
+def load_data(binary_path):
+    """
+    load a binary data file; sessions are decoded lazily
+    :param binary_path: the path to the binary data file
+    :return: the data dict
+    """
+    sessions = BinarySessionList(binary_path)
+    data = dict(sessions.extra)
+    data[constants.DATA_DATA] = sessions
+    return data
+
+
+@stat_profile.timed
+def save_data(binary_path, config_stages, data):
+    """
+    write the data dict as a binary data file, replacing the old file atomically
+    sessions that were never decoded are copied over without decoding them
+    :param binary_path: the path to the binary data file
+    :param config_stages: the Chapters dict of the config
+    :param data: the data dict
+    """
+    sessions = data[constants.DATA_DATA]
+    stage_layout = get_stage_layout(config_stages)
+    check_stage_layout(stage_layout)
+    source = None
+    if isinstance(sessions, BinarySessionList) and sessions.stage_layout == stage_layout:
+        source = sessions
+
+    # extend the source dictionaries so that the indices of copied sessions stay valid
+    dates = list(source.dates) if source else []
+    attributes = [[name, list(values)] for name, values in source.attributes] if source else []
+    date_indices = {date: i for i, date in enumerate(dates)}
+    attribute_indices = {name: i for i, (name, values) in enumerate(attributes)}
+    value_indices = [{value: i for i, value in enumerate(values)} for name, values in attributes]
+
+    def get_index(table, indices, key, max_count=None):
+        if key not in indices:
+            if max_count is not None and len(table) >= max_count:
+                raise ValueError(f'an attribute has more than {max_count} values, '
+                                 f'binary storage supports at most {max_count}')
+            indices[key] = len(table)
+            table.append(key)
+        return indices[key]
+
+    # first pass: build the session records
+    session_records = []
+    run_sources = []  # per session, either (first run, run count) in the source or a list of results
+    run_count_total = 0
+    for idx in range(len(sessions)):
+        if source is not None and not source.is_loaded(idx):
+            date_idx, first_run, run_count, source_value_indices = source.read_session_record(source.slots[idx])
+            record_values = list(source_value_indices)
+            run_sources.append((first_run, run_count))
+        else:
+            session = sessions[idx]
+            date_idx = get_index(dates, date_indices, session['Date'])
+            record_values = []
+            for name, value in session['Attributes'].items():
+                if name not in attribute_indices:
+                    attribute_indices[name] = len(attributes)
+                    attributes.append([name, []])
+                    value_indices.append({})
+                attribute_idx = attribute_indices[name]
+                while len(record_values) <= attribute_idx:
+                    record_values.append(MISSING_VALUE)
+                record_values[attribute_idx] = get_index(attributes[attribute_idx][1], value_indices[attribute_idx],
+                                                         value, MAX_ATTRIBUTE_VALUES)
+            run_count = len(session[constants.DATA_RESULT])
+            run_sources.append(session[constants.DATA_RESULT])
+        session_records.append([date_idx, run_count_total, run_count, record_values])
+        run_count_total += run_count
+
+    header = {
+        HEADER_STAGES: stage_layout,
+        HEADER_DATES: dates,
+        HEADER_ATTRIBUTES: attributes,
+        HEADER_EXTRA: {key: value for key, value in data.items() if key != constants.DATA_DATA},
+    }
+    header_bytes = json.dumps(header, separators=(',', ':'), ensure_ascii=False).encode('UTF-8')
+    session_struct = get_session_struct(len(attributes))
+    run_size = get_run_size(stage_layout)
+
+    # second pass: write everything to a temporary file
+    temp_path = f'{binary_path}.tmp'
+    with open(temp_path, mode='wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(COUNT.pack(len(session_records)))
+        for date_idx, first_run, run_count, record_values in session_records:
+            record_values = record_values + [MISSING_VALUE] * (len(attributes) - len(record_values))
+            f.write(session_struct.pack(date_idx, first_run, run_count, *record_values))
+        for run_source in run_sources:
+            if isinstance(run_source, tuple):
+                first_run, run_count = run_source
+                start = source.runs_offset + first_run * run_size
+                f.write(source.buffer[start:start + run_count * run_size])
+            else:
+                for result in run_source:
+                    f.write(encode_run(stage_layout, result))
+        f.flush()
+        os.fsync(f.fileno())
+
+    if source is not None:
+        source.close_file()
+    os.replace(temp_path, binary_path)
+    if source is not None:
+        # sessions that are still undecoded now live at their own index in the new file
+        source.binary_path = binary_path
+        source.open_file()
+        for idx in range(len(source.slots)):
+            if not source.is_loaded(idx):
+                source.slots[idx] = idx
+
+
+def json_to_binary(config_path):
+    """
+    convert the json data file (and its journal) of a config into a binary data file
+    the json data file is left untouched
+    :param config_path: the path to the config file
+    """
+    config = stat_config.load_config_file(config_path)
+    data = stat_config.load_json_data(config_path)
+    save_data(stat_config.get_binary_path(config_path), config[constants.CONFIG_CHAPTERS], data)
+
+
+def binary_to_json(config_path):
+    """
+    convert the binary data file of a config back into a json data file
+    :param config_path: the path to the config file
+    """
+    data = load_data(stat_config.get_binary_path(config_path))
+    sessions = data[constants.DATA_DATA]
+    data[constants.DATA_DATA] = list(sessions)
+    sessions.close_file()
+    stat_config.write_file_atomic(stat_config.get_data_path(config_path), stat_config.serialize_data(data))
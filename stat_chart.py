@@ -0,0 +1,96 @@
+import PySimpleGUI as sg
+
+import constants
+
+
+BAR_COLOR = '#1f77b4'
+AXIS_COLOR = 'black'
+GRID_COLOR = '#dddddd'
+FONT = ('Helvetica', 9)
+
+# margins around the plot area, in pixels
+MARGIN_LEFT = 60
+MARGIN_RIGHT = 20
+MARGIN_TOP = 20
+MARGIN_BOTTOM = 50
+Y_TICKS = [0., 0.2, 0.4, 0.6, 0.8, 1.]
+
+
+def create_graph(key, size=constants.CHART_SIZE):
+    """
+    create a graph element whose coordinates are pixels from the bottom left corner, as BarChart expects
+    :param key: the key of the element
+    :param size: (width, height) in pixels
+    :return: the sg.Graph
+    """
+    width, height = size
+    return sg.Graph(canvas_size=(width, height), graph_bottom_left=(0, 0), graph_top_right=(width, height),
+                    background_color='white', key=key)
+
+
+class BarChart:
+    """
+    A bar chart of rates in [0, 1] drawn with sg.Graph primitives, one bar per chapter.
+    The axes and labels are drawn once; update only redraws the bars whose value changed.
+    """
+    def __init__(self, graph, bar_count, size=constants.CHART_SIZE, x_label='session', y_label='NN rate'):
+        """
+        :param graph: a finalized sg.Graph created by create_graph
+        :param bar_count: the number of bars
+        """
+        self.graph = graph
+        self.bar_count = bar_count
+        width, height = size
+        self.left = MARGIN_LEFT
+        self.bottom = MARGIN_BOTTOM
+        self.plot_width = width - MARGIN_LEFT - MARGIN_RIGHT
+        self.plot_height = height - MARGIN_TOP - MARGIN_BOTTOM
+        self.slot_width = self.plot_width / max(bar_count, 1)
+        self.values = [None] * bar_count
+        self.bar_figures = [[] for _ in range(bar_count)]  # figure ids of each bar and its value label
+        self.draw_axes(x_label, y_label)
+
+    def get_y(self, value):
+        return self.bottom + value * self.plot_height
+
+    def draw_axes(self, x_label, y_label):
+        right = self.left + self.plot_width
+        for tick in Y_TICKS:
+            y = self.get_y(tick)
+            if tick != 0.:
+                self.graph.draw_line((self.left, y), (right, y), color=GRID_COLOR)
+            self.graph.draw_line((self.left - 4, y), (self.left, y), color=AXIS_COLOR)
+            self.graph.draw_text(f'{tick:.1f}', (self.left - 6, y), color=AXIS_COLOR, font=FONT,
+                                 text_location=sg.TEXT_LOCATION_RIGHT)
+        self.graph.draw_line((self.left, self.bottom), (right, self.bottom), color=AXIS_COLOR)
+        self.graph.draw_line((self.left, self.bottom), (self.left, self.get_y(1.)), color=AXIS_COLOR)
+        for i in range(self.bar_count):
+            x = self.left + (i + 0.5) * self.slot_width
+            self.graph.draw_text(str(i + 1), (x, self.bottom - 4), color=AXIS_COLOR, font=FONT,
+                                 text_location=sg.TEXT_LOCATION_TOP)
+        self.graph.draw_text(x_label, (self.left + self.plot_width / 2, self.bottom - 30), color=AXIS_COLOR,
+                             font=FONT)
+        self.graph.draw_text(y_label, (self.left - 45, self.bottom + self.plot_height / 2), color=AXIS_COLOR,
+                             font=FONT, angle=90)
+
+    def update(self, values):
+        """
+        show new values, redrawing only the bars that changed
+        :param values: a list of bar_count rates in [0, 1]
+        """
+        for i, value in enumerate(values):
+            if value == self.values[i]:
+                continue
+            for figure_id in self.bar_figures[i]:
+                self.graph.delete_figure(figure_id)
+            x0 = self.left + (i + 0.1) * self.slot_width
+            x1 = self.left + (i + 0.9) * self.slot_width
+            top = self.get_y(min(max(value, 0.), 1.))
+            figures = []
+            if value > 0.:
+                figures.append(self.graph.draw_rectangle((x0, top), (x1, self.bottom),
+                                                         fill_color=BAR_COLOR, line_color=BAR_COLOR))
+            figures.append(self.graph.draw_text(f'{value * 100:.0f}%', ((x0 + x1) / 2, top + 2), color=AXIS_COLOR,
+                                                font=FONT, text_location=sg.TEXT_LOCATION_BOTTOM))
+            self.bar_figures[i] = figures
+            self.values[i] = value
@@ -0,0 +1,217 @@
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, the columnar store is simply unavailable without it
+    np = None
+
+import constants
+import stat_lazy
+
+
+INITIAL_CAPACITY = 1024
+
+
+def is_available():
+    """
+    check whether the columnar store can be used
+    :return: True if numpy is installed
+    """
+    return np is not None
+
+
+class ColumnarResultStore:
+    """
+    An in-memory column layout of all game results, used for vectorized aggregation.
+    Each result is one row shared by every stage: per stage there is an int8 outcome matrix
+    and a matching attempted mask, plus a session id column for the whole row.
+    The matrices are stored chapter-major (chapters x runs) so that every chapter is one contiguous column.
+    Removed rows are zeroed and marked with session -1, so reductions never need a mask.
+    """
+    def __init__(self, config_stages):
+        self.stage_ids = list(config_stages.keys())
+        self.chapter_counts = {stage_id: len(config_stages[stage_id]) for stage_id in self.stage_ids}
+        self.capacity = INITIAL_CAPACITY
+        self.row_count = 0  # rows in use, including removed ones
+        self.dead_count = 0
+        self.session_column = np.full(self.capacity, -1, dtype=np.int32)
+        self.outcomes = {}
+        self.attempted = {}
+        for stage_id in self.stage_ids:
+            self.outcomes[stage_id] = np.zeros((self.chapter_counts[stage_id], self.capacity), dtype=np.int8)
+            self.attempted[stage_id] = np.zeros((self.chapter_counts[stage_id], self.capacity), dtype=np.int8)
+        self.session_rows = {}  # session_rows[session_id] = list of row numbers, in result order
+
+    @classmethod
+    def from_data(cls, config_stages, data):
+        """
+        build a store from a data dict
+        :param config_stages: the Chapters dict of the config
+        :param data: the data dict
+        :return: the store
+        """
+        store = cls(config_stages)
+        data_field = data[constants.DATA_DATA]
+        for position, session_id in enumerate(data[constants.DATA_SESSION_IDS]):
+            if session_id is None:
+                continue  # a removed session
+            # lazily loaded sessions are read without being kept decoded
+            session = data_field.peek(position) if isinstance(data_field, stat_lazy.LazySessionList) \
+                else data_field[position]
+            store.add_session(session_id)
+            for result in session[constants.DATA_RESULT]:
+                store.add_result(session_id, result)
+        return store
+
+    def grow(self):
+        """
+        double the capacity of every column
+        """
+        self.capacity *= 2
+        session_column = np.full(self.capacity, -1, dtype=np.int32)
+        session_column[:self.row_count] = self.session_column[:self.row_count]
+        self.session_column = session_column
+        for stage_id in self.stage_ids:
+            for columns in (self.outcomes, self.attempted):
+                matrix = np.zeros((self.chapter_counts[stage_id], self.capacity), dtype=np.int8)
+                matrix[:, :self.row_count] = columns[stage_id][:, :self.row_count]
+                columns[stage_id] = matrix
+
+    def add_session(self, session_id):
+        """
+        add an empty session
+        :param session_id: the id of the session
+        """
+        self.session_rows[session_id] = []
+
+    def remove_session(self, session_id):
+        """
+        remove a session and all of its rows
+        :param session_id: the id of the session
+        """
+        self.clear_rows(self.session_rows.pop(session_id))
+        if self.dead_count > self.row_count // 2:
+            self.compact()
+
+    def add_result(self, session_id, result):
+        """
+        append a result as a new row
+        :param session_id: the id of the session
+        :param result: a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        if self.row_count == self.capacity:
+            self.grow()
+        row = self.row_count
+        self.row_count += 1
+        self.session_column[row] = session_id
+        for stage_id in self.stage_ids:
+            success_list = result[stage_id]
+            self.outcomes[stage_id][:len(success_list), row] = success_list
+            self.attempted[stage_id][:len(success_list), row] = 1
+        self.session_rows[session_id].append(row)
+
+    def pop_result(self, session_id):
+        """
+        remove the last result of a session
+        :param session_id: the id of the session
+        """
+        self.clear_rows([self.session_rows[session_id].pop()])
+
+    def clear_rows(self, rows):
+        """
+        zero out removed rows so that they do not contribute to any reduction
+        """
+        if len(rows) == 0:
+            return
+        if rows[-1] == self.row_count - 1 and len(rows) == 1:
+            self.row_count -= 1  # the most common case, popping the latest result, frees the row entirely
+        else:
+            self.dead_count += len(rows)
+        self.session_column[rows] = -1
+        for stage_id in self.stage_ids:
+            self.outcomes[stage_id][:, rows] = 0
+            self.attempted[stage_id][:, rows] = 0
+
+    def compact(self):
+        """
+        drop removed rows
+        """
+        alive = self.session_column[:self.row_count] >= 0
+        new_rows = np.cumsum(alive) - 1
+        self.session_column = self.session_column[:self.row_count][alive]
+        for stage_id in self.stage_ids:
+            self.outcomes[stage_id] = np.ascontiguousarray(self.outcomes[stage_id][:, :self.row_count][:, alive])
+            self.attempted[stage_id] = np.ascontiguousarray(self.attempted[stage_id][:, :self.row_count][:, alive])
+        self.session_rows = {session_id: new_rows[rows].tolist() for session_id, rows in self.session_rows.items()}
+        self.row_count = len(self.session_column)
+        self.capacity = self.row_count
+        self.dead_count = 0
+        if self.capacity == 0:
+            self.capacity = 1
+            self.grow()
+
+    def total_counts(self, stage_id):
+        """
+        :param stage_id: the stage id
+        :return: (captures, attempts) arrays over the chapters of the stage
+        """
+        captures = self.outcomes[stage_id][:, :self.row_count].sum(axis=1, dtype=np.int64)
+        attempts = self.attempted[stage_id][:, :self.row_count].sum(axis=1, dtype=np.int64)
+        return captures, attempts
+
+    def session_counts(self, stage_id, session_id):
+        """
+        :param stage_id: the stage id
+        :param session_id: the id of the session
+        :return: (captures, attempts) arrays over the chapters of the stage for one session
+        """
+        rows = self.session_rows[session_id]
+        captures = self.outcomes[stage_id][:, rows].sum(axis=1, dtype=np.int64)
+        attempts = self.attempted[stage_id][:, rows].sum(axis=1, dtype=np.int64)
+        return captures, attempts
+
+    def run_states(self, session_id=None):
+        """
+        the outcome of every chapter of every run as one row per run, all stages side by side
+        :param session_id: only the runs of this session, or None for every run
+        :return: an int8 matrix runs x chapters of 0 (not attempted), 1 (failed) or 2 (captured)
+        """
+        if session_id is None:
+            rows = np.flatnonzero(self.session_column[:self.row_count] >= 0)
+        else:
+            rows = np.asarray(self.session_rows[session_id], dtype=np.int64)
+        columns = [self.outcomes[stage_id][:, rows] + self.attempted[stage_id][:, rows] for stage_id in self.stage_ids]
+        return np.ascontiguousarray(np.concatenate(columns, axis=0).T)
+
+    def sessions_counts(self, stage_id):
+        """
+        count captures and attempts of every session at once
+        :param stage_id: the stage id
+        :return: (captures, attempts) matrices of shape sessions x chapters, sessions in the order they were added
+        """
+        session_count = len(self.session_rows)
+        chapter_count = self.chapter_counts[stage_id]
+        captures = np.zeros((session_count, chapter_count), dtype=np.int64)
+        attempts = np.zeros((session_count, chapter_count), dtype=np.int64)
+        if self.row_count == 0:
+            return captures, attempts
+
+        # results are almost always appended to the latest session, so rows come in long runs of the same session;
+        # reduce each run in one go and scatter the run totals to their sessions
+        session_column = self.session_column[:self.row_count]
+        run_starts = np.flatnonzero(np.concatenate(([True], session_column[1:] != session_column[:-1])))
+        run_sessions = session_column[run_starts]
+        alive_runs = run_sessions >= 0
+        # the output row of each session id
+        session_ids = np.fromiter(self.session_rows.keys(), dtype=np.int64, count=session_count)
+        order = np.argsort(session_ids)
+        run_outputs = order[np.searchsorted(session_ids[order], run_sessions[alive_runs])]
+        for matrix, counts in ((self.outcomes[stage_id], captures), (self.attempted[stage_id], attempts)):
+            run_sums = np.add.reduceat(matrix[:, :self.row_count], run_starts, axis=1, dtype=np.int64)
+            np.add.at(counts, run_outputs, run_sums[:, alive_runs].T)
+        return captures, attempts
+
+
+def compute_rates(captures, attempts):
+    """
+    vectorized capture rates, 0 for chapters never attempted
+    """
+    return np.divide(captures, attempts, out=np.zeros(captures.shape), where=attempts > 0)
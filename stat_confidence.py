@@ -0,0 +1,259 @@
+import os
+import math
+import weakref
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only the bootstrap needs it
+    np = None
+
+import constants
+import stat_profile
+
+# the bootstrap intervals of the whole history of a database are computed on a background thread and kept until
+# its data changes; {database: (data version, future)}
+executor = None
+executor_lock = threading.Lock()
+history_futures = weakref.WeakKeyDictionary()
+
+
+def is_available():
+    """
+    check whether bootstrap intervals can be computed
+    :return: True if numpy is installed
+    """
+    return np is not None
+
+
+def wilson_interval(capture, attempt, z=constants.CONFIDENCE_Z):
+    """
+    compute the Wilson score interval of a capture rate
+    unlike the normal approximation it stays inside [0, 1] and is meaningful for small samples and rates near 0 or 1
+    :param capture: the number of captures
+    :param attempt: the number of attempts
+    :param z: the standard normal quantile of the confidence level
+    :return: (low, high), (0, 1) for a chapter never attempted
+    """
+    if attempt == 0:
+        return 0., 1.
+    rate = capture / attempt
+    denominator = 1. + z * z / attempt
+    center = (rate + z * z / (2. * attempt)) / denominator
+    half_width = z * math.sqrt(rate * (1. - rate) / attempt + z * z / (4. * attempt * attempt)) / denominator
+    return max(0., center - half_width), min(1., center + half_width)
+
+
+def wilson_intervals(capture_list, attempt_list, z=constants.CONFIDENCE_Z):
+    """
+    :return: a list of (low, high), one per chapter
+    """
+    return [wilson_interval(capture_list[i], attempt_list[i], z) for i in range(len(capture_list))]
+
+
+def build_run_states(database, session_id=None):
+    """
+    get the outcome of every chapter of every run, all stages side by side, for resampling whole runs
+    :param database: the StatDatabase
+    :param session_id: only the runs of this session, or None for every run
+    :return: an int8 matrix runs x chapters of 0 (not attempted), 1 (failed) or 2 (captured)
+    """
+    if database.columnar is not None:
+        return database.columnar.run_states(session_id)
+    return encode_run_states(database.get_config_stage_dict(), database.iter_game_results(session_id))
+
+
+def encode_run_states(config_stages, results):
+    """
+    :param config_stages: the Chapters dict of the config
+    :param results: an iterable of results
+    :return: the matrix of build_run_states for the results
+    """
+    offsets = []
+    width = 0
+    for stage_id, chapters_list in config_stages.items():
+        offsets.append((stage_id, width))
+        width += len(chapters_list)
+    rows = []
+    for result in results:
+        row = bytearray(width)
+        for stage_id, offset in offsets:
+            for j, success in enumerate(result[stage_id]):
+                row[offset + j] = 1 + success
+        rows.append(bytes(row))
+    return np.frombuffer(b''.join(rows), dtype=np.int8).reshape(len(rows), width)
+
+
+def draw_weights(rng, run_patterns, counts, size):
+    """
+    draw how many times each pattern appears in size resamples of the runs
+    a multinomial draw costs per pattern, drawing run indices costs per run; the cheaper one is used
+    :param rng: the random generator
+    :param run_patterns: the pattern of each run
+    :param counts: the number of runs of each pattern
+    :param size: the number of resamples
+    :return: a float32 matrix resamples x patterns
+    """
+    run_count = len(run_patterns)
+    pattern_count = len(counts)
+    if run_count * constants.BOOTSTRAP_SECONDS_PER_RUN > pattern_count * constants.BOOTSTRAP_SECONDS_PER_PATTERN:
+        return rng.multinomial(run_count, counts / run_count, size=size).astype(np.float32)
+    picked = run_patterns[rng.integers(0, run_count, size=(size, run_count))]
+    picked += np.arange(size, dtype=picked.dtype)[:, None] * pattern_count
+    return np.bincount(picked.ravel(), minlength=size * pattern_count).reshape(size, pattern_count) \
+        .astype(np.float32)
+
+
+def bootstrap_batch(patterns, run_patterns, counts, stage_sizes, resample_count, seed):
+    """
+    resample whole runs resample_count times and compute the statistics of every resample
+    identical runs are merged into patterns beforehand, so the counts of a batch of resamples are
+    one product of a weight matrix (resamples x patterns) with the pattern matrix
+    :param patterns: an int8 matrix patterns x chapters of 0 (not attempted), 1 (failed) or 2 (captured)
+    :param run_patterns: the pattern of each run
+    :param counts: the number of runs of each pattern
+    :param stage_sizes: the number of chapters of each stage, in column order
+    :param resample_count: the number of resamples
+    :param seed: the seed of the random generator
+    :return: (level_misses, total_misses, level_nn_rate, total_nn_rate) arrays, one row per resample
+    """
+    rng = np.random.default_rng(seed)
+    captured = (patterns == 2).astype(np.float32)
+    attempted = (patterns >= 1).astype(np.float32)
+    stage_starts = np.concatenate([[0], np.cumsum(stage_sizes)[:-1]]).astype(np.int64)
+
+    # bound the memory of a batch
+    batch_size = max(1, constants.BOOTSTRAP_BATCH_CELLS // max(len(run_patterns), len(counts)))
+    outputs = []
+    for batch_start in range(0, resample_count, batch_size):
+        size = min(batch_size, resample_count - batch_start)
+        weights = draw_weights(rng, run_patterns, counts, size)
+        captures = (weights @ captured).astype(np.float64)
+        attempts = (weights @ attempted).astype(np.float64)
+        rates = np.divide(captures, attempts, out=np.zeros_like(captures), where=attempts > 0)
+        # per stage sums and products over the chapters of each stage
+        level_misses = np.add.reduceat(1. - rates, stage_starts, axis=1)
+        level_nn_rate = np.multiply.reduceat(rates, stage_starts, axis=1)
+        outputs.append((level_misses, level_misses.sum(axis=1), level_nn_rate, level_nn_rate.prod(axis=1)))
+    return tuple(np.concatenate([output[i] for output in outputs]) for i in range(4))
+
+
+def estimate_resample_seconds(run_count, pattern_count):
+    """
+    :param run_count: the number of runs
+    :param pattern_count: the number of distinct runs
+    :return: the seconds a resample is expected to take, drawn the cheaper way, see draw_weights
+    """
+    return min(run_count * constants.BOOTSTRAP_SECONDS_PER_RUN, pattern_count * constants.BOOTSTRAP_SECONDS_PER_PATTERN)
+
+
+@stat_profile.timed
+def bootstrap_intervals(run_states, stage_sizes, resample_count=None,
+                        confidence=constants.CONFIDENCE_LEVEL, process_count=None, seed=None):
+    """
+    estimate confidence intervals of the average misses and NN rates by resampling whole runs
+    :param run_states: the matrix returned by build_run_states
+    :param stage_sizes: the number of chapters of each stage, in column order
+    :param resample_count: the number of resamples; None for as many as are expected to fit in
+        BOOTSTRAP_TIME_BUDGET, between BOOTSTRAP_MIN_RESAMPLES and BOOTSTRAP_RESAMPLES
+    :param confidence: the confidence level of the intervals
+    :param process_count: split the resamples across this many processes; None to use a single process
+        unless the resamples are expected to take at least BOOTSTRAP_PROCESS_MIN_SECONDS
+    :param seed: the seed of the random generator, None for a fresh one
+    :return: ((level_misses_intervals, total_misses_interval), (level_nn_rate_intervals, total_nn_rate_interval)),
+        each interval a (low, high) tuple, shaped like compute_advanced_summary_statistics;
+        None if there is no run
+    """
+    if len(run_states) == 0:
+        return None
+    # identical runs are found by comparing the rows as raw bytes, much faster than np.unique(axis=0)
+    width = run_states.shape[1]
+    rows = np.ascontiguousarray(run_states, dtype=np.int8).view(np.dtype((np.void, width))).reshape(-1)
+    unique_rows, run_patterns, counts = np.unique(rows, return_inverse=True, return_counts=True)
+    patterns = unique_rows.view(np.int8).reshape(-1, width)
+    run_patterns = run_patterns.reshape(-1).astype(np.int64)
+
+    resample_seconds = estimate_resample_seconds(len(run_patterns), len(counts))
+    if resample_count is None:
+        resample_count = int(constants.BOOTSTRAP_TIME_BUDGET / resample_seconds)
+        resample_count = max(constants.BOOTSTRAP_MIN_RESAMPLES, min(constants.BOOTSTRAP_RESAMPLES, resample_count))
+    if process_count is None:
+        process_count = 1
+        if resample_count * resample_seconds >= constants.BOOTSTRAP_PROCESS_MIN_SECONDS:
+            process_count = min(constants.BOOTSTRAP_PROCESSES, os.cpu_count() or 1)
+
+    seeds = np.random.SeedSequence(seed).spawn(process_count)
+    shares = [resample_count // process_count + (1 if i < resample_count % process_count else 0)
+              for i in range(process_count)]
+    if process_count == 1:
+        parts = [bootstrap_batch(patterns, run_patterns, counts, stage_sizes, resample_count, seeds[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=process_count) as process_executor:
+            parts = list(process_executor.map(bootstrap_batch, [patterns] * process_count, [run_patterns] * process_count,
+                                      [counts] * process_count, [stage_sizes] * process_count, shares, seeds))
+    level_misses, total_misses, level_nn_rate, total_nn_rate = \
+        (np.concatenate([part[i] for part in parts]) for i in range(4))
+
+    return (percentile_interval(level_misses, confidence), percentile_interval(total_misses, confidence)), \
+        (percentile_interval(level_nn_rate, confidence), percentile_interval(total_nn_rate, confidence))
+
+
+def compute_history_intervals(database):
+    """
+    bootstrap_intervals of every run of a database, run by the background thread
+    :param database: the StatDatabase
+    """
+    # the runs are read while the database may be changed from the ui; the lock is only held to copy them
+    with database.lock:
+        if database.columnar is not None:
+            run_states = database.columnar.run_states()
+        else:
+            session_ids = database.get_session_ids()
+    config_stages = database.get_config_stage_dict()
+    if database.columnar is None:
+        # one session at a time, so a change from the ui waits for a single session to be copied at most
+        session_states = [encode_run_states(config_stages, [])]
+        for session_id in session_ids:
+            with database.lock:
+                if session_id not in database.session_versions:
+                    continue  # removed since
+                results = list(database.iter_game_results(session_id))
+            session_states.append(encode_run_states(config_stages, results))
+        run_states = np.concatenate(session_states)
+    stage_sizes = [len(chapters_list) for chapters_list in config_stages.values()]
+    return bootstrap_intervals(run_states, stage_sizes)
+
+
+def submit_history_intervals(database):
+    """
+    get the bootstrap intervals of every run of a database without waiting for them
+    they are computed on a background thread once per version of the data, so reopening a statistics view
+    of unchanged data finds them ready
+    :param database: the StatDatabase
+    :return: a Future of the result of bootstrap_intervals
+    """
+    global executor
+    data_version = database.get_data_version()
+    with executor_lock:
+        cached = history_futures.get(database)
+        if cached is not None and cached[0] == data_version:
+            return cached[1]
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thstat-bootstrap')
+        future = executor.submit(compute_history_intervals, database)
+        history_futures[database] = (data_version, future)
+        return future
+
+
+def percentile_interval(samples, confidence):
+    """
+    :param samples: bootstrap samples, a vector or a matrix with one column per level
+    :param confidence: the confidence level
+    :return: (low, high), or a list of (low, high) per column for a matrix
+    """
+    tail = (1. - confidence) / 2. * 100.
+    low, high = np.percentile(samples, [tail, 100. - tail], axis=0)
+    if np.ndim(low) == 0:
+        return float(low), float(high)
+    return list(zip(low.tolist(), high.tolist()))
@@ -4,32 +4,141 @@ import time
 import json
 
 import constants
+import stat_binary
+import stat_stream
+import stat_profile
 
 
+def get_data_path(config_path):
+    """
+    get the path of the data file that belongs to a config file
+    :param config_path: the path to the config file
+    :return: the path to the data file
+    """
+    return f'{config_path}.data.json'
+
+
+def get_journal_path(config_path):
+    """
+    get the path of the journal file that belongs to a config file
+    :param config_path: the path to the config file
+    :return: the path to the journal file
+    """
+    return f'{config_path}.data.journal.jsonl'
+
+
+def get_sqlite_path(config_path):
+    """
+    get the path of the SQLite database that belongs to a config file
+    :param config_path: the path to the config file
+    :return: the path to the SQLite database
+    """
+    return f'{config_path}.data.sqlite'
+
+
+def get_binary_path(config_path):
+    """
+    get the path of the binary data file that belongs to a config file
+    :param config_path: the path to the config file
+    :return: the path to the binary data file
+    """
+    return f'{config_path}.data.bin'
+
+
+def get_aggregates_path(config_path):
+    """
+    get the path of the aggregate sidecar that belongs to a config file, see stat_aggregates
+    :param config_path: the path to the config file
+    :return: the path to the aggregate sidecar
+    """
+    return f'{config_path}.data.aggregates.bin'
+
+
+def load_config_file(config_path):
+    """
+    load only the config from a json file, without its data
+    :param config_path: the path to the config file
+    :return: the config dict
+    """
+    with open(config_path, mode='r', encoding='UTF-8') as f:
+        return json.load(f)
+
+
+@stat_profile.timed
 def load_config(config_path):
     """
     load config from a json file
     :param config_path: the path to the config file
     :return: a tuple of (config, data)
     """
-    data_path = f'{config_path}.data.json'
-    with open(config_path, mode='r', encoding='UTF-8') as f:
-        config = json.load(f)
+    config = load_config_file(config_path)
+    if config.get(constants.CONFIG_STORAGE, constants.STORAGE_JSON) == constants.STORAGE_BINARY:
+        return config, load_binary_data(config_path, config)
+    return config, load_json_data(config_path, config)
+
+
+@stat_profile.timed
+def load_json_data(config_path, config=None):
+    """
+    load the json data file of a config, including the changes recorded in its journal
+    :param config_path: the path to the config file
+    :param config: the config dict; if given, a large data file is streamed, see stat_stream.should_stream
+    :return: the data dict
+    """
+    data_path = get_data_path(config_path)
 
     # ensure data file exists
     if not os.path.exists(data_path):
         data = {
             constants.DATA_DATA: [],
         }
-        with open(data_path, mode='w+', encoding='UTF-8') as f:
-            json.dump(data, f, separators=(',', ':'), indent=4, ensure_ascii=False)
+        write_file_atomic(data_path, serialize_data(data))
 
     # load data
-    with open(data_path, mode='r', encoding='UTF-8') as f:
-        data = json.load(f)
-    return config, data
+    if config is not None and stat_stream.should_stream(config, data_path):
+        data = stat_stream.load_data(data_path, config[constants.CONFIG_CHAPTERS])
+    else:
+        with open(data_path, mode='r', encoding='UTF-8') as f:
+            data = json.load(f)
+    assign_session_ids(data)
+
+    # apply the changes recorded after the last snapshot
+    for record in read_journal(config_path):
+        apply_journal_record(data, record)
+    return data
+
+
+def load_binary_data(config_path, config):
+    """
+    load the binary data file of a config; its sessions are decoded on first access
+    a missing binary file is converted from the json data file if there is one
+    :param config_path: the path to the config file
+    :param config: the config dict
+    :return: the data dict
+    """
+    binary_path = get_binary_path(config_path)
+    if not os.path.exists(binary_path):
+        if os.path.exists(get_data_path(config_path)):
+            stat_binary.json_to_binary(config_path)
+        else:
+            stat_binary.save_data(binary_path, config[constants.CONFIG_CHAPTERS], {constants.DATA_DATA: []})
+    data = stat_binary.load_data(binary_path)
+    assign_session_ids(data)
+    return data
+
+
+def assign_session_ids(data):
+    """
+    give the sessions of a data dict written before session ids existed the ids 0, 1, 2... in their order
+    :param data: the data dict, updated in place
+    """
+    if constants.DATA_SESSION_IDS not in data:
+        data[constants.DATA_SESSION_IDS] = list(range(len(data[constants.DATA_DATA])))
+    if constants.DATA_NEXT_SESSION_ID not in data:
+        data[constants.DATA_NEXT_SESSION_ID] = max(data[constants.DATA_SESSION_IDS], default=-1) + 1
 
 
+@stat_profile.timed
 def save_config(config_path, config, data):
     """
     save config to a json file
@@ -37,12 +146,141 @@ def save_config(config_path, config, data):
     :param config: the config dict
     :param data: the data dict
     """
-    data_path = f'{config_path}.data.json'
-    with open(config_path, mode='w+', encoding='UTF-8') as f:
-        json.dump(config, f, separators=(',', ':'), indent=4, ensure_ascii=False)
+    save_config_file(config_path, config)
+
+    if config.get(constants.CONFIG_STORAGE, constants.STORAGE_JSON) == constants.STORAGE_BINARY:
+        stat_binary.save_data(get_binary_path(config_path), config[constants.CONFIG_CHAPTERS], data)
+        return
+
+    save_data_text(config_path, serialize_data(data))
+
+
+def save_config_file(config_path, config):
+    """
+    rewrite the config file, but only if its content changed, to keep the user's file untouched
+    :param config_path: the path to the config file
+    :param config: the config dict
+    """
+    with open(config_path, mode='r', encoding='UTF-8') as f:
+        config_changed = json.load(f) != config
+    if config_changed:
+        write_file_atomic(config_path, json.dumps(config, separators=(',', ':'), indent=4, ensure_ascii=False))
+
+
+@stat_profile.timed
+def serialize_data(data):
+    """
+    :param data: the data dict
+    :return: the content of the json data file
+    """
+    return json.dumps(data, separators=(',', ':'), indent=4, ensure_ascii=False)
+
+
+@stat_profile.timed
+def save_data_text(config_path, data_text):
+    """
+    replace the json data file of a config and discard its journal
+    :param config_path: the path to the config file
+    :param data_text: the serialized data, as returned by serialize_data
+    """
+    write_file_atomic(get_data_path(config_path), data_text)
+    remove_journal(config_path)
+
+
+def remove_journal(config_path):
+    """
+    discard the journal of a config once a snapshot contains every journaled change
+    :param config_path: the path to the config file
+    """
+    journal_path = get_journal_path(config_path)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+
+def write_file_atomic(path, text):
+    """
+    write a text file through a temporary file that replaces the original once fully written
+    a crash in the middle of the write leaves the original file intact
+    :param path: the path to the file
+    :param text: the content of the file
+    """
+    temp_path = f'{path}.tmp'
+    with open(temp_path, mode='w', encoding='UTF-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def read_journal(config_path):
+    """
+    read the journal records that are not yet part of the data snapshot
+    :param config_path: the path to the config file
+    :return: a list of journal records, in the order they were written
+    """
+    journal_path = get_journal_path(config_path)
+    if not os.path.exists(journal_path):
+        return []
+    records = []
+    with open(journal_path, mode='r', encoding='UTF-8') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break  # a record cut short by a crash, nothing after it was committed
+    return records
+
+
+@stat_profile.timed
+def append_journal(config_path, records):
+    """
+    append records to the journal file
+    :param config_path: the path to the config file
+    :param records: a list of journal records
+    """
+    with open(get_journal_path(config_path), mode='a', encoding='UTF-8') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def apply_journal_record(data, record):
+    """
+    apply a journal record to the data dict
+    records already contained in the data snapshot are skipped
+    :param data: the data dict
+    :param record: the journal record
+    """
+    seq = record[constants.JOURNAL_SEQ]
+    if seq <= data.get(constants.DATA_JOURNAL_SEQ, 0):
+        return
+    data[constants.DATA_JOURNAL_SEQ] = seq
+
+    data_field = data[constants.DATA_DATA]
+    session_ids = data[constants.DATA_SESSION_IDS]
+    op = record[constants.JOURNAL_OP]
+    if op == constants.JOURNAL_OP_ADD_SESSION:
+        session_id = record.get(constants.JOURNAL_SESSION_ID, data[constants.DATA_NEXT_SESSION_ID])
+        data_field.append(record[constants.JOURNAL_SESSION])
+        session_ids.append(session_id)
+        data[constants.DATA_NEXT_SESSION_ID] = max(data[constants.DATA_NEXT_SESSION_ID], session_id + 1)
+        return
 
-    with open(data_path, mode='w+', encoding='UTF-8') as f:
-        json.dump(data, f, separators=(',', ':'), indent=4, ensure_ascii=False)
+    # records written before session ids existed address the session by its position
+    if constants.JOURNAL_SESSION_ID in record:
+        position = session_ids.index(record[constants.JOURNAL_SESSION_ID])
+    else:
+        position = record[constants.JOURNAL_SESSION_IDX]
+    if op == constants.JOURNAL_OP_REMOVE_SESSION:
+        data_field.pop(position)
+        session_ids.pop(position)
+    elif op == constants.JOURNAL_OP_ADD_RESULT:
+        data_field[position][constants.DATA_RESULT].append(record[constants.JOURNAL_RESULT])
+    elif op == constants.JOURNAL_OP_POP_RESULT:
+        data_field[position][constants.DATA_RESULT].pop()
+    else:
+        raise ValueError(f'unknown journal operation {op}')
 
 
 # config={
@@ -1,9 +1,33 @@
-import PySimpleGUI as sg
 import stat_config
+import stat_aggregates
+import stat_lazy
+import stat_rolling
+import stat_stream
+import stat_writer
+import stat_profile
+import stat_reach
+import os
+import threading
+import contextlib
 import time
+import datetime
 import constants
 
 
+def open_database(config_path):
+    """
+    load a config and its data using the storage backend selected in the config
+    :param config_path: the path to the config file
+    :return: a StatDatabase
+    """
+    config = stat_config.load_config_file(config_path)
+    if config.get(constants.CONFIG_STORAGE, constants.STORAGE_JSON) == constants.STORAGE_SQLITE:
+        import stat_database_sqlite
+        return stat_database_sqlite.SqliteStatDatabase(config_path, config)
+    config, data = stat_config.load_config(config_path)
+    return StatDatabase(config_path, config, data)
+
+
 class StatDatabase:
     """
     This class is used to store the statistics of the game.
@@ -12,6 +36,25 @@ class StatDatabase:
         self.config_path = config_path
         self.config = config
         self.data = data
+        if data is not None:
+            stat_config.assign_session_ids(data)
+
+        # in journal mode, changes are appended to a journal on commit instead of rewriting the data file
+        self.storage = config.get(constants.CONFIG_STORAGE, constants.STORAGE_JSON)
+        self.journaled = self.storage == constants.STORAGE_JOURNAL
+        self.pending_journal_records = []
+        journal = stat_config.read_journal(config_path) if self.journaled else []
+        self.journal_length = len(journal)
+
+        # with AsyncCommit, commits are written by a background thread; self.lock guards self.data and the
+        # pending journal records against that thread, which holds it only while taking a snapshot
+        self.lock = threading.RLock()
+        self.writer = None
+        if config.get(constants.CONFIG_ASYNC_COMMIT, False):
+            if self.storage in [constants.STORAGE_JSON, constants.STORAGE_JOURNAL]:
+                self.writer = stat_writer.BackgroundWriter(self.write_pending)
+            else:
+                print(f'AsyncCommit is not supported by {self.storage} storage, commits are written immediately.')
 
         self.stage_idx_from_id = {}
         for stage_id in config[constants.CONFIG_CHAPTERS]:
@@ -25,112 +68,870 @@ class StatDatabase:
                 if attr['Type'] == 'SelectFromMainMenuDropdown':
                     self.dropdown_attribute_name.append(key)
 
+        # sessions are addressed by their persistent id; a removed session leaves a tombstone (None) in Data
+        # and SessionIds until the next compaction, so that no position moves on removal
+        # position_of[session_id] = position in Data, in the order the sessions were recorded
+        self.position_of = {}
+        self.tombstone_count = 0
+        # per-stage capture/attempt counters, updated by every method that changes the results
+        # session_counters[session_id][stage_id] = (cap_list, attempt_list)
+        # total_counters[stage_id] = (cap_list, attempt_list)
+        self.session_counters = {}
+        self.total_counters = {}
+        # inverted index of the session attributes and the counters of every attribute value
+        # session_attributes[session_id] = {attribute name: value}
+        # attribute_index[attribute name][value] = set of session_id
+        # attribute_counters[attribute name][value][stage_id] = (cap_list, attempt_list)
+        self.session_attributes = {}
+        self.attribute_index = {}
+        self.attribute_counters = {}
+        # optional numpy column layout of all results, answers the whole-history aggregations
+        self.columnar = None
+        # prefix sums over the runs in date order for rolling/ranged queries, built on first use
+        self.rolling = None
+        # chapter-transition counts of the runs for the reach/no-miss estimates, built on first use
+        self.reach = None
+        # session_versions[session_id] changes whenever the session changes, for caches keyed by session;
+        # version_counter changes whenever anything changes, for caches of the whole history
+        self.version_counter = 0
+        self.session_versions = {}
+        # inside a batch, the changes to the raw data that a rollback has to undo, in the order they were made;
+        # None outside of a batch
+        self.batch_undo = None
+        # the counters are also saved to a sidecar of the data file, see stat_aggregates, so that the next launch
+        # does not count every run again; data_generation counts the writes of the data file, so that a sidecar is
+        # only saved along with the file its counters were taken from
+        self.aggregates_lock = threading.Lock()
+        self.aggregates_thread = None
+        self.data_generation = 0
+        self.loaded_aggregates = None
+        if self.uses_aggregates() and os.path.exists(stat_config.get_aggregates_path(config_path)):
+            self.loaded_aggregates = stat_aggregates.load_aggregates(
+                config_path, self.get_config_stage_dict(), stat_aggregates.hash_file(self.get_data_file_path()),
+                journal)
+        counted_session_count = self.rebuild_counters()
+        if self.uses_aggregates() and counted_session_count != 0:
+            self.save_aggregates_in_background()
+
+    @stat_profile.timed
+    def rebuild_counters(self):
+        """
+        recompute all capture/attempt counters from the raw results
+        the counters of the sessions described by a loaded aggregate sidecar are taken from it instead, and so are
+        the aggregate counters if it describes every session
+        :return: the number of sessions counted from their results
+        """
+        loaded = self.loaded_aggregates
+        self.loaded_aggregates = None
+        loaded_session_counters = {} if loaded is None else loaded.session_counters
+        live_session_ids = [session_id for session_id in self.data[constants.DATA_SESSION_IDS]
+                            if session_id is not None]
+        loaded_totals = loaded is not None and loaded.total_counters is not None and \
+            loaded_session_counters.keys() == set(live_session_ids)
+        counted_session_count = 0
+        self.position_of = {}
+        self.tombstone_count = 0
+        self.session_counters = {}
+        self.total_counters = loaded.total_counters if loaded_totals else self.create_empty_counters()
+        self.session_attributes = {}
+        self.attribute_index = {}
+        self.attribute_counters = loaded.attribute_counters if loaded_totals else {}
+        self.rolling = None
+        self.reach = None
+        self.session_versions = {}
+        config_stages = self.get_config_stage_dict()
+        data_field = self.data[constants.DATA_DATA]
+        for position, session_id in enumerate(self.data[constants.DATA_SESSION_IDS]):
+            if session_id is None:
+                self.tombstone_count += 1
+                continue
+            self.position_of[session_id] = position
+            if isinstance(data_field, stat_lazy.LazySessionList):
+                attributes = data_field.get_attributes(position)
+            else:
+                attributes = data_field[position]['Attributes']
+            if session_id in loaded_session_counters:
+                session_counter = loaded_session_counters[session_id]
+            elif isinstance(data_field, stat_lazy.LazySessionList):
+                # counted straight from the source, without decoding the session
+                session_counter = data_field.count_outcomes(position, config_stages)
+                counted_session_count += 1
+            else:
+                session_counter = stat_lazy.count_session_outcomes(data_field[position], config_stages)
+                counted_session_count += 1
+            self.session_counters[session_id] = session_counter
+            self.session_versions[session_id] = self.next_version()
+            self.index_session_attributes(session_id, attributes)
+            if not loaded_totals:
+                for counters in self.get_aggregate_counters(session_id):
+                    merge_counters(counters, session_counter, 1)
+
+        if self.config.get(constants.CONFIG_COLUMNAR, False):
+            import stat_columnar  # numpy is only loaded by configs that enable the columnar store
+            if stat_columnar.is_available():
+                self.columnar = stat_columnar.ColumnarResultStore.from_data(self.get_config_stage_dict(), self.data)
+            else:
+                print('numpy is not installed, the columnar result store is disabled.')
+        return counted_session_count
+
+    def uses_aggregates(self):
+        """
+        :return: True if the counters are saved to an aggregate sidecar; a streamed data file is counted while it
+        is scanned anyway, and SQLite counts with queries
+        """
+        return self.data is not None and self.storage in [constants.STORAGE_JSON, constants.STORAGE_JOURNAL,
+                                                          constants.STORAGE_BINARY] and \
+            not isinstance(self.data[constants.DATA_DATA], stat_stream.StreamedSessionList)
+
+    def get_data_file_path(self):
+        """
+        :return: the path to the file the data is loaded from
+        """
+        if self.storage == constants.STORAGE_BINARY:
+            return stat_config.get_binary_path(self.config_path)
+        return stat_config.get_data_path(self.config_path)
+
+    def take_aggregates(self):
+        """
+        copy the counters for the aggregate sidecar; the caller must hold the lock
+        :return: the counters, see stat_aggregates.take_counters, or None if no sidecar is used
+        """
+        if not self.uses_aggregates():
+            return None
+        return stat_aggregates.take_counters(self.get_config_stage_dict(), self.session_counters,
+                                             self.total_counters, self.attribute_counters)
+
+    def begin_data_write(self):
+        """
+        mark the start of a write of the data file, any sidecar save of an earlier generation is skipped
+        :return: the generation of the data file being written
+        """
+        with self.aggregates_lock:
+            self.data_generation += 1
+            return self.data_generation
+
+    def save_aggregates(self, generation, journal_seq, counters):
+        """
+        save the aggregate sidecar of the data file, unless the data file was written again since generation
+        :param generation: the generation of the data file the counters belong to
+        :param journal_seq: the last journal record included in the counters
+        :param counters: the counters, see take_aggregates, or None if no sidecar is used
+        """
+        with self.aggregates_lock:
+            if counters is None or generation != self.data_generation:
+                return
+            try:
+                stat_aggregates.save_aggregates(self.config_path, self.get_config_stage_dict(),
+                                                stat_aggregates.hash_file(self.get_data_file_path()), journal_seq,
+                                                counters)
+            except OSError as e:  # only the next launch is slower
+                print(f'Failed to save the aggregates: {type(e).__name__}: {e}')
+
+    def save_aggregates_in_background(self):
+        """
+        save the aggregate sidecar of the data file as loaded, on a background thread
+        """
+        with self.lock:
+            counters = self.take_aggregates()
+            journal_seq = self.data.get(constants.DATA_JOURNAL_SEQ, 0)
+        self.aggregates_thread = threading.Thread(target=self.save_aggregates,
+                                                  args=(self.data_generation, journal_seq, counters),
+                                                  name='thstat-aggregates', daemon=True)
+        self.aggregates_thread.start()
+
+    def create_empty_counters(self):
+        """
+        create a zeroed capture/attempt counter for each stage
+        :return: a dict {stage_id: (cap_list, attempt_list)}
+        """
+        counters = {}
+        for stage_id, chapters_list in self.get_config_stage_dict().items():
+            counters[stage_id] = ([0] * len(chapters_list), [0] * len(chapters_list))
+        return counters
+
+    def update_counters(self, session_id, result, sign):
+        """
+        add (sign=1) or subtract (sign=-1) a single game result from the session and total counters
+        :param session_id: the id of the session the result belongs to
+        :param result: the result of the game, a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        :param sign: 1 to add the result, -1 to remove it
+        """
+        targets = [self.session_counters[session_id]] + self.get_aggregate_counters(session_id)
+        for stage_id in self.total_counters:
+            for j, success in enumerate(result[stage_id]):
+                for counters in targets:
+                    capture_list, attempt_list = counters[stage_id]
+                    capture_list[j] += sign * success
+                    attempt_list[j] += sign
+
+    def next_version(self):
+        """
+        :return: a version stamp never handed out before
+        """
+        self.version_counter += 1
+        return self.version_counter
+
+    def get_data_version(self):
+        """
+        get a stamp that changes whenever any session or result of the database changes
+        :return: the version stamp
+        """
+        return self.version_counter
+
+    def get_session_version(self, session_id):
+        """
+        get a stamp that changes whenever the results of the session change
+        :param session_id: the id of the session
+        :return: the version stamp
+        """
+        return self.session_versions[session_id]
+
+    def get_aggregate_counters(self, session_id):
+        """
+        get every aggregate counter a session contributes to
+        :param session_id: the id of the session
+        :return: a list of counters: the total counters and the counters of each attribute value of the session
+        """
+        targets = [self.total_counters]
+        for name, value in self.session_attributes[session_id].items():
+            targets.append(self.attribute_counters[name][value])
+        return targets
+
+    def index_session_attributes(self, session_id, attributes):
+        """
+        add a session to the attribute index
+        :param session_id: the id of the session
+        :param attributes: the attributes of the session {attribute name: value}
+        """
+        self.session_attributes[session_id] = attributes.copy()
+        for name, value in attributes.items():
+            self.attribute_index.setdefault(name, {}).setdefault(value, set()).add(session_id)
+            if value not in self.attribute_counters.setdefault(name, {}):
+                self.attribute_counters[name][value] = self.create_empty_counters()
+
+    def unindex_session_attributes(self, session_id):
+        """
+        remove a session from the attribute index
+        :param session_id: the id of the session
+        """
+        for name, value in self.session_attributes.pop(session_id).items():
+            self.attribute_index[name][value].discard(session_id)
+
+    @stat_profile.timed
     def commit(self):
         """
         save the data to the file
+        with AsyncCommit the save is queued to the background writer and this returns immediately
+        inside a batch, the save is left to the end of the batch
+        """
+        if self.batch_undo is not None:
+            return
+        if self.writer is not None:
+            self.writer.request()
+        else:
+            self.write_pending()
+
+    @stat_profile.timed
+    def write_pending(self):
+        """
+        write the changes made since the last write: a full snapshot, or the pending records in journal mode
+        the snapshot is taken under the lock, it is serialized and written outside of it
+        """
+        if self.storage == constants.STORAGE_BINARY:  # always written immediately
+            with self.lock:
+                self.remove_tombstones()
+                counters = self.take_aggregates()
+            generation = self.begin_data_write()
+            stat_config.save_config(self.config_path, self.config, self.data)
+            self.save_aggregates(generation, 0, counters)
+            return
+
+        with self.lock:
+            if self.journaled and self.journal_length + len(self.pending_journal_records) < \
+                    constants.JOURNAL_COMPACT_THRESHOLD:
+                records = self.pending_journal_records
+                self.pending_journal_records = []
+                self.journal_length += len(records)
+                snapshot = None
+            else:
+                records = None
+                snapshot = self.take_snapshot()
+                counters = self.take_aggregates()
+        if snapshot is not None:
+            self.write_snapshot(snapshot, counters)
+        elif len(records) != 0:
+            stat_config.append_journal(self.config_path, records)
+
+    def take_snapshot(self):
+        """
+        copy the structure of the data, which makes the journal obsolete; the caller must hold the lock
+        results are never modified once added, so they are shared with the copy instead of copied
+        :return: a data dict that later changes do not affect
+        """
+        self.pending_journal_records = []
+        self.journal_length = 0
+        self.remove_tombstones()  # the file is rewritten anyway, so the tombstones go with it
+        data_field = self.data[constants.DATA_DATA]
+        if isinstance(data_field, stat_stream.StreamedSessionList):
+            sessions = data_field.snapshot()
+        else:
+            sessions = [{**session, constants.DATA_RESULT: list(session[constants.DATA_RESULT])}
+                        for session in data_field]
+        return {**self.data, constants.DATA_DATA: sessions}
+
+    def remove_tombstones(self):
+        """
+        drop the tombstones of removed sessions from Data and SessionIds; the caller must hold the lock
+        the positions of the remaining sessions change, their ids do not
+        """
+        if self.tombstone_count == 0:
+            return
+        data_field = self.data[constants.DATA_DATA]
+        session_ids = self.data[constants.DATA_SESSION_IDS]
+        if isinstance(data_field, stat_lazy.LazySessionList):
+            data_field.slots = [slot for slot in data_field.slots if slot is not None]
+        else:
+            data_field[:] = [session for session in data_field if session is not None]
+        session_ids[:] = [session_id for session_id in session_ids if session_id is not None]
+        self.position_of = {session_id: position for position, session_id in enumerate(session_ids)}
+        self.tombstone_count = 0
+
+    def write_snapshot(self, snapshot, counters=None):
+        """
+        write a snapshot taken by take_snapshot to the data file, and its aggregate sidecar
+        :param snapshot: the data dict returned by take_snapshot
+        :param counters: the counters taken along with the snapshot, see take_aggregates
+        """
+        stat_config.save_config_file(self.config_path, self.config)
+        generation = self.begin_data_write()
+        data_field = self.data[constants.DATA_DATA]
+        if isinstance(data_field, stat_stream.StreamedSessionList):
+            stat_stream.save_data(self.config_path, snapshot, data_field)
+        else:
+            stat_config.save_data_text(self.config_path, stat_config.serialize_data(snapshot))
+        self.save_aggregates(generation, snapshot.get(constants.DATA_JOURNAL_SEQ, 0), counters)
+
+    def flush(self):
+        """
+        wait until every commit has been written
+        """
+        if self.writer is not None:
+            self.writer.flush()
+
+    def compact(self):
+        """
+        write a full snapshot of the data and discard the journal
+        """
+        self.flush()
+        with self.lock:
+            snapshot = self.take_snapshot()
+            counters = self.take_aggregates()
+        self.write_snapshot(snapshot, counters)
+
+    def close(self):
+        """
+        persist everything before the program exits
+        """
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.aggregates_thread is not None:
+            self.aggregates_thread.join()
+        # a database that was only read, e.g. by the workspace dashboard, leaves its data file untouched
+        if self.journaled and (self.journal_length != 0 or len(self.pending_journal_records) != 0):
+            self.compact()
+        data_field = self.data[constants.DATA_DATA]
+        if isinstance(data_field, stat_lazy.LazySessionList):
+            data_field.close()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        apply many sessions and results as one change, e.g. for an import
+        inside the batch, add_game_session and add_game_result validate their input against the config, and
+        commit does nothing; the batch is saved by a single commit when it ends, or rolled back entirely if it
+        raises, in which case the error is raised again
+        the lock is held for the whole batch, so the background writer never sees half of it
+        a batch started inside another batch is part of the outer one
+        :return: a context manager giving the database
+        """
+        with self.lock:
+            if self.batch_undo is not None:
+                yield self
+                return
+            self.batch_undo = []
+            saved_state = (len(self.data[constants.DATA_DATA]), self.data[constants.DATA_NEXT_SESSION_ID],
+                           self.data.get(constants.DATA_JOURNAL_SEQ), len(self.pending_journal_records))
+            try:
+                yield self
+            except BaseException:
+                self.rollback_batch(saved_state)
+                raise
+            finally:
+                self.batch_undo = None
+        self.commit()
+
+    def rollback_batch(self, saved_state):
+        """
+        undo the changes of a batch to the raw data, then recompute everything derived from it
+        tombstones are not dropped during a batch, so every session keeps its position and the sessions added by
+        the batch are the ones past the saved length
+        :param saved_state: (session count, next session id, journal sequence, pending journal record count)
+        at the start of the batch
+        """
+        session_count, next_session_id, journal_seq, pending_record_count = saved_state
+        data_field = self.data[constants.DATA_DATA]
+        slots = data_field.slots if isinstance(data_field, stat_lazy.LazySessionList) else data_field
+        for undo in reversed(self.batch_undo):
+            if undo[0] == constants.JOURNAL_OP_ADD_RESULT:
+                data_field[undo[1]][constants.DATA_RESULT].pop()
+            elif undo[0] == constants.JOURNAL_OP_POP_RESULT:
+                data_field[undo[1]][constants.DATA_RESULT].append(undo[2])
+            else:  # JOURNAL_OP_REMOVE_SESSION
+                position, session_id, slot = undo[1:]
+                slots[position] = slot
+                self.data[constants.DATA_SESSION_IDS][position] = session_id
+        del slots[session_count:]
+        del self.data[constants.DATA_SESSION_IDS][session_count:]
+        self.data[constants.DATA_NEXT_SESSION_ID] = next_session_id
+        if journal_seq is None:
+            self.data.pop(constants.DATA_JOURNAL_SEQ, None)
+        else:
+            self.data[constants.DATA_JOURNAL_SEQ] = journal_seq
+        del self.pending_journal_records[pending_record_count:]
+        self.rebuild_counters()
+
+    def validate_game_session(self, date_str, attributes):
+        """
+        check a session that does not come from the main menu against the config
+        :param date_str: the date of the session
+        :param attributes: the attributes of the session {attribute name: value}
+        :raise ValueError: if the date is not YYYY-MM-DD, or an attribute is not a dropdown attribute of the config
+        or its value is not one of the Values of the dropdown
+        """
+        try:
+            # strptime alone also takes 2024-1-1, which would not sort with the dates the main menu writes
+            is_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date().isoformat() == date_str
+        except (TypeError, ValueError):
+            is_date = False
+        if not is_date:
+            raise ValueError(f'the date {date_str!r} is not YYYY-MM-DD')
+        for name, value in attributes.items():
+            if name not in self.dropdown_attribute_name:
+                raise ValueError(f'{name!r} is not a dropdown attribute of the config')
+            if value not in self.config[name]['Values']:
+                raise ValueError(f'{value!r} is not one of the Values of {name!r}')
+
+    def validate_game_result(self, result):
+        """
+        check a result that does not come from the gameplay menu against the config
+        :param result: a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        :raise ValueError: unless the result has every stage of the config and nothing else, no stage has more
+        outcomes than chapters, every outcome is 0 or 1, and the stages after the one where the run ended are empty
+        """
+        config_stages = self.get_config_stage_dict()
+        if result.keys() != config_stages.keys():
+            raise ValueError(f'the stages of a result must be {list(config_stages)}, got {list(result)}')
+        ended = False
+        for stage_id, chapters_list in config_stages.items():
+            success_list = result[stage_id]
+            if ended and len(success_list) != 0:
+                raise ValueError(f'stage {stage_id!r} has outcomes after the run ended')
+            if len(success_list) > len(chapters_list):
+                raise ValueError(f'stage {stage_id!r} has {len(chapters_list)} chapters, '
+                                 f'got {len(success_list)} outcomes')
+            if any(success not in (0, 1) for success in success_list):
+                raise ValueError(f'the outcomes of stage {stage_id!r} must be 0 or 1, got {success_list}')
+            ended = len(success_list) < len(chapters_list)
+
+    def add_journal_record(self, record):
+        """
+        number a journal record and queue it to be written on the next commit
+        :param record: the journal record without its sequence number
         """
-        stat_config.save_config(self.config_path, self.config, self.data)
+        if not self.journaled:
+            return
+        seq = self.data.get(constants.DATA_JOURNAL_SEQ, 0) + 1
+        self.data[constants.DATA_JOURNAL_SEQ] = seq
+        record[constants.JOURNAL_SEQ] = seq
+        self.pending_journal_records.append(record)
 
-    def add_game_session(self, date_str):
+    def add_game_session(self, date_str, attributes=None):
         """
         record a game session to the database
         :param date_str: the date of the game session
-        :return: an index to the newly added session
+        :param attributes: the attributes of the session, or None for the current dropdown attributes
+        :return: the id of the newly added session
         """
+        if attributes is None:
+            attributes = self.current_dropdown_attributes
+        if self.batch_undo is not None:
+            self.validate_game_session(date_str, attributes)
         game_session = {
             'Date': date_str,
-            'Attributes': self.current_dropdown_attributes.copy(),
+            'Attributes': attributes.copy(),
             constants.DATA_RESULT: [],
         }
-        idx = len(self.data[constants.DATA_DATA])
-        self.data[constants.DATA_DATA].append(game_session)
-        return idx
+        with self.lock:
+            session_id = self.data[constants.DATA_NEXT_SESSION_ID]
+            self.data[constants.DATA_NEXT_SESSION_ID] = session_id + 1
+            self.position_of[session_id] = len(self.data[constants.DATA_DATA])
+            self.data[constants.DATA_DATA].append(game_session)
+            self.data[constants.DATA_SESSION_IDS].append(session_id)
+            self.add_journal_record({constants.JOURNAL_OP: constants.JOURNAL_OP_ADD_SESSION,
+                                     constants.JOURNAL_SESSION_ID: session_id,
+                                     constants.JOURNAL_SESSION: {**game_session, constants.DATA_RESULT: []}})
+            # the counters are changed under the lock, as the aggregate sidecar is taken from them on the writer thread
+            self.session_counters[session_id] = self.create_empty_counters()
+            self.session_versions[session_id] = self.next_version()
+            self.index_session_attributes(session_id, game_session['Attributes'])
+            if self.columnar is not None:
+                self.columnar.add_session(session_id)
+            if self.rolling is not None:
+                self.rolling.add_session(session_id, date_str)
+            if self.reach is not None:
+                self.reach.add_session(session_id)
+        return session_id
 
-    def remove_game_session(self, session_idx):
+    def remove_game_session(self, session_id):
         """
-        remove the last game session from data field
+        remove a game session together with all of its results
+        the session is replaced by a tombstone, which is dropped once tombstones outnumber the sessions
+        :param session_id: the id of the session
         """
-        data_field = self.data[constants.DATA_DATA]
-        for i in range(len(data_field[session_idx][constants.DATA_RESULT]) - 1, -1, -1):
-            self.pop_game_result(session_idx)
-        data_field.pop(session_idx)  # remove the game session entirely
+        with self.lock:
+            position = self.position_of.pop(session_id)
+            if self.batch_undo is not None:
+                data_field = self.data[constants.DATA_DATA]
+                slots = data_field.slots if isinstance(data_field, stat_lazy.LazySessionList) else data_field
+                self.batch_undo.append((constants.JOURNAL_OP_REMOVE_SESSION, position, session_id, slots[position]))
+            self.data[constants.DATA_DATA][position] = None
+            self.data[constants.DATA_SESSION_IDS][position] = None
+            self.tombstone_count += 1
+            self.add_journal_record({constants.JOURNAL_OP: constants.JOURNAL_OP_REMOVE_SESSION,
+                                     constants.JOURNAL_SESSION_ID: session_id})
+            if self.tombstone_count > len(self.position_of) and self.batch_undo is None:
+                self.remove_tombstones()
+            session_counter = self.session_counters.pop(session_id)
+
+            # subtract the whole session from the totals at once instead of popping its results one by one
+            for counters in self.get_aggregate_counters(session_id):
+                merge_counters(counters, session_counter, -1)
+            self.unindex_session_attributes(session_id)
+            self.session_versions.pop(session_id)
+            self.next_version()  # a removal changes the data version as well
+            if self.columnar is not None:
+                self.columnar.remove_session(session_id)
+            if self.rolling is not None:
+                self.rolling.remove_session(session_id)
+            if self.reach is not None:
+                self.reach.remove_session(session_id)
 
-    def add_game_result(self, session_idx, result):
+    def add_game_result(self, session_id, result):
         """
         add a game result to the database
-        :param session_idx: the index of the session
+        :param session_id: the id of the session
         :param result: the result of the game, a list of 0 (fail) or 1 (capture)
         """
-        self.data[constants.DATA_DATA][session_idx][constants.DATA_RESULT].append(result.copy())
+        with self.lock:
+            if self.batch_undo is not None:
+                self.validate_game_result(result)
+                self.batch_undo.append((constants.JOURNAL_OP_ADD_RESULT, self.position_of[session_id]))
+            self.get_session(session_id)[constants.DATA_RESULT].append(result.copy())
+            self.add_journal_record({constants.JOURNAL_OP: constants.JOURNAL_OP_ADD_RESULT,
+                                     constants.JOURNAL_SESSION_ID: session_id,
+                                     constants.JOURNAL_RESULT: result.copy()})
+            # under the lock, so that the counters saved along with a snapshot match its results
+            self.update_counters(session_id, result, 1)
+            self.session_versions[session_id] = self.next_version()
+            if self.columnar is not None:
+                self.columnar.add_result(session_id, result)
+            if self.rolling is not None:
+                self.rolling.add_result(session_id, result)
+            if self.reach is not None:
+                self.reach.add_result(session_id, result)
 
-    def pop_game_result(self, session_idx):
+    def pop_game_result(self, session_id):
         """
         remove the last game result from the specified session
-        :param session_idx: the index of the session
+        :param session_id: the id of the session
+        """
+        with self.lock:
+            result = self.get_session(session_id)[constants.DATA_RESULT].pop()
+            if self.batch_undo is not None:
+                self.batch_undo.append((constants.JOURNAL_OP_POP_RESULT, self.position_of[session_id], result))
+            self.add_journal_record({constants.JOURNAL_OP: constants.JOURNAL_OP_POP_RESULT,
+                                     constants.JOURNAL_SESSION_ID: session_id})
+            self.update_counters(session_id, result, -1)
+            self.session_versions[session_id] = self.next_version()
+            if self.columnar is not None:
+                self.columnar.pop_result(session_id)
+            if self.rolling is not None:
+                self.rolling.pop_result(session_id)
+            if self.reach is not None:
+                self.reach.pop_result(session_id, result)
+
+    def get_session(self, session_id):
+        """
+        get the session dict of a session, decoding it if it is lazily loaded
+        :param session_id: the id of the session
+        :return: the session dict
+        """
+        return self.data[constants.DATA_DATA][self.position_of[session_id]]
+
+    def peek_session(self, session_id):
+        """
+        get the session dict of a session without keeping a lazily loaded session decoded
+        :param session_id: the id of the session
+        :return: the session dict, which must not be modified
+        """
+        data_field = self.data[constants.DATA_DATA]
+        if isinstance(data_field, stat_lazy.LazySessionList):
+            return data_field.peek(self.position_of[session_id])
+        return data_field[self.position_of[session_id]]
+
+    def get_session_ids(self):
+        """
+        get the ids of all recorded game sessions
+        :return: a list of session ids, in the order the sessions were recorded
+        """
+        return list(self.position_of)
+
+    def has_session(self, session_id):
+        """
+        :param session_id: a session id
+        :return: True if the session exists and was not removed
+        """
+        return session_id in self.position_of
+
+    def get_session_count(self):
+        """
+        get the number of recorded game sessions
+        :return: the number of sessions
+        """
+        return len(self.position_of)
+
+    def get_session_date(self, session_id):
+        """
+        get the date of a game session
+        :param session_id: the id of the session
+        :return: the date string of the session
+        """
+        data_field = self.data[constants.DATA_DATA]
+        if isinstance(data_field, stat_lazy.LazySessionList):
+            return data_field.get_date(self.position_of[session_id])
+        return data_field[self.position_of[session_id]]['Date']
+
+    def get_session_attributes(self, session_id):
         """
-        self.data[constants.DATA_DATA][session_idx][constants.DATA_RESULT].pop()
+        get the dropdown attributes a game session was recorded with
+        :param session_id: the id of the session
+        :return: a dictionary of attributes {attribute name: value}
+        """
+        return self.session_attributes[session_id].copy()
+
+    def get_session_results(self, session_id):
+        """
+        get the game results of a session
+        :param session_id: the id of the session
+        :return: a list of results, each a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        return self.get_session(session_id)[constants.DATA_RESULT].copy()
+
+    def iter_game_results(self, session_id=None):
+        """
+        iterate over game results without keeping lazily loaded sessions decoded
+        :param session_id: only the results of this session, or None for every result of every session
+        :return: an iterator of results, each a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        session_ids = self.get_session_ids() if session_id is None else [session_id]
+        for session_id in session_ids:
+            yield from self.peek_session(session_id)[constants.DATA_RESULT]
+
+    def get_session_result_count(self, session_id):
+        """
+        get the number of game results in a session
+        :param session_id: the id of the session
+        :return: the number of results
+        """
+        return len(self.peek_session(session_id)[constants.DATA_RESULT])
 
+    @stat_profile.timed
     def aggregate_cap_rates(self, stage_id):
         """
         aggregate the capture rates
-        :return: ((sessions cap, sessions attempt, sessions rate), (total cap, total attempt, total rate))
+        :return: ((sessions cap, sessions attempt, sessions rate), (total cap, total attempt, total rate)),
+        the session lists in the order of get_session_ids
         """
-        chapters_list = self.get_config_stage_dict()[stage_id]
+        if self.columnar is not None:
+            import stat_columnar
+            captures, attempts = self.columnar.sessions_counts(stage_id)
+            rates = stat_columnar.compute_rates(captures, attempts)
+            return (captures.tolist(), attempts.tolist(), rates.tolist()), self.get_total_cap_rates(stage_id)
+
         sessions_cap = []
         sessions_attempt = []
         sessions_rate = []
-        for session in self.data[constants.DATA_DATA]:
-            capture_list = [0] * len(chapters_list)
-            attempt_list = [0] * len(chapters_list)
-            for i, run in enumerate(session[constants.DATA_RESULT]):
-                for j, success in enumerate(run[stage_id]):
-                    capture_list[j] += success
-                    attempt_list[j] += 1
-            capture_rate = [capture_list[i] / attempt_list[i] if attempt_list[i] > 0 else 0 for i in range(len(capture_list))]
+        for session_id in self.session_counters:
+            capture_list, attempt_list, capture_rate = self.get_session_cap_rates(stage_id, session_id)
             sessions_cap.append(capture_list)
             sessions_attempt.append(attempt_list)
             sessions_rate.append(capture_rate)
 
-        # calculate total cap info as three single lists
-        total_cap = [0] * len(chapters_list)
-        total_attempt = [0] * len(chapters_list)
-        total_rate = [0] * len(chapters_list)
-        for i in range(len(sessions_cap)):
-            for j in range(len(sessions_cap[i])):
-                total_cap[j] += sessions_cap[i][j]
-                total_attempt[j] += sessions_attempt[i][j]
-        for i in range(len(total_cap)):
-            total_rate[i] = total_cap[i] / total_attempt[i] if total_attempt[i] > 0 else 0
+        return (sessions_cap, sessions_attempt, sessions_rate), self.get_total_cap_rates(stage_id)
+
+    def get_session_cap_rates(self, stage_id, session_id):
+        """
+        get the capture rates of a single session from the counters
+        :param stage_id: the stage id
+        :param session_id: the id of the session
+        :return: (session cap, session attempt, session rate)
+        """
+        capture_list, attempt_list = self.session_counters[session_id][stage_id]
+        return capture_list.copy(), attempt_list.copy(), compute_rates(capture_list, attempt_list)
+
+    def get_total_cap_rates(self, stage_id):
+        """
+        get the capture rates of all sessions combined from the counters
+        :param stage_id: the stage id
+        :return: (total cap, total attempt, total rate)
+        """
+        total_cap, total_attempt = self.total_counters[stage_id]
+        return total_cap.copy(), total_attempt.copy(), compute_rates(total_cap, total_attempt)
+
+    def get_rolling_index(self):
+        """
+        get the prefix-sum index over the runs in date order, building it on first use
+        :return: the RollingWindowIndex
+        """
+        if self.rolling is None:
+            rolling = stat_rolling.RollingWindowIndex(self.get_config_stage_dict())
+            for session_id in self.get_session_ids():
+                rolling.add_session(session_id, self.get_session_date(session_id))
+                if self.columnar is not None:
+                    rolling.add_runs(session_id, self.columnar.run_states(session_id).tobytes())
+                else:
+                    rolling.add_runs(session_id, b''.join(rolling.encode_result(result)
+                                                          for result in self.iter_game_results(session_id)))
+            self.rolling = rolling
+        return self.rolling
 
-        return (sessions_cap, sessions_attempt, sessions_rate), (total_cap, total_attempt, total_rate)
+    @stat_profile.timed
+    def get_reach_model(self):
+        """
+        get the chapter-transition model of the runs, building it in one pass over the data on first use
+        :return: the ReachModel
+        """
+        if self.reach is None:
+            reach = stat_reach.ReachModel(self.get_config_stage_dict())
+            for session_id in self.get_session_ids():
+                reach.add_session(session_id)
+                for result in self.iter_game_results(session_id):
+                    reach.add_result(session_id, result)
+            self.reach = reach
+        return self.reach
 
-    def compute_advanced_summary_statistics(self, stages_cap_rates):
+    @stat_profile.timed
+    def aggregate_cap_rates_last_runs(self, stage_id, run_count):
+        """
+        aggregate the capture rates of the latest runs, sessions ordered by date
+        :param stage_id: the stage id
+        :param run_count: the number of runs to include
+        :return: (cap, attempt, rate)
+        """
+        capture_list, attempt_list = self.get_rolling_index().last_runs_counts(stage_id, run_count)
+        return capture_list, attempt_list, compute_rates(capture_list, attempt_list)
+
+    @stat_profile.timed
+    def aggregate_cap_rates_between_dates(self, stage_id, start_date, end_date):
+        """
+        aggregate the capture rates of the sessions dated between two dates, inclusive
+        :param stage_id: the stage id
+        :param start_date: the first date, 'YYYY-MM-DD'
+        :param end_date: the last date, 'YYYY-MM-DD'
+        :return: (cap, attempt, rate)
+        """
+        capture_list, attempt_list = self.get_rolling_index().date_range_counts(stage_id, start_date, end_date)
+        return capture_list, attempt_list, compute_rates(capture_list, attempt_list)
+
+    def aggregate_cap_rates_last_days(self, stage_id, day_count, today=None):
+        """
+        aggregate the capture rates of the sessions of the last day_count days, today included
+        :param stage_id: the stage id
+        :param day_count: the number of days, e.g. 7 or 30
+        :param today: the current date, 'YYYY-MM-DD'; defaults to the local date
+        :return: (cap, attempt, rate)
+        """
+        if today is None:
+            today = time.strftime('%Y-%m-%d', time.localtime())
+        start_date = (datetime.date.fromisoformat(today) - datetime.timedelta(days=day_count - 1)).isoformat()
+        return self.aggregate_cap_rates_between_dates(stage_id, start_date, today)
+
+    def get_attribute_values(self, attribute_name):
+        """
+        get the values of an attribute that appear in at least one session
+        :param attribute_name: the attribute name
+        :return: a list of values
+        """
+        return [value for value, session_set in self.attribute_index.get(attribute_name, {}).items()
+                if len(session_set) != 0]
+
+    def get_sessions_with_attribute(self, attribute_name, value):
+        """
+        look up the sessions recorded with a given attribute value
+        :param attribute_name: the attribute name
+        :param value: the attribute value
+        :return: a sorted list of session ids
+        """
+        return sorted(self.attribute_index.get(attribute_name, {}).get(value, ()))
+
+    @stat_profile.timed
+    def aggregate_cap_rates_by_attribute(self, stage_id, attribute_name):
+        """
+        aggregate the capture rates of all sessions grouped by the value of a session attribute
+        :param stage_id: the stage id
+        :param attribute_name: the attribute to group by, e.g. a dropdown attribute name
+        :return: {attribute value: (cap, attempt, rate)}
+        """
+        grouped_rates = {}
+        for value in self.get_attribute_values(attribute_name):
+            group_cap, group_attempt = self.attribute_counters[attribute_name][value][stage_id]
+            grouped_rates[value] = (group_cap.copy(), group_attempt.copy(), compute_rates(group_cap, group_attempt))
+        return grouped_rates
+
+    def compute_summary_statistics_by_attribute(self, attribute_name):
+        """
+        compute_advanced_summary_statistics for each value of a session attribute
+        :param attribute_name: the attribute to group by
+        :return: {attribute value: ((level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate))}
+        """
+        stages_grouped_rates = {}
+        for stage_id in self.get_config_stage_dict():
+            stages_grouped_rates[stage_id] = self.aggregate_cap_rates_by_attribute(stage_id, attribute_name)
+        summaries = {}
+        for value in self.get_attribute_values(attribute_name):
+            stages_rate = {stage_id: stages_grouped_rates[stage_id][value][2] for stage_id in stages_grouped_rates}
+            summaries[value] = summarize_rates(stages_rate)
+        return summaries
+
+    @stat_profile.timed
+    def compute_advanced_summary_statistics(self, stages_cap_rates=None):
         """
         compute summary statistics. The statistics include:
         1. average number of misses of each level and in total
         2. NN rate of each level and in total
-        :param stages_cap_rates:
+        :param stages_cap_rates: {stage_id: aggregate_cap_rates(stage_id)}; if None, the total counters are used
         :return: (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate)
         """
-        level_misses_arr = []
-        total_misses = 0.
-        level_nn_rate_arr = []
-        total_nn_rate = 1.
-        for stage_id in stages_cap_rates:
-            cap_rates = stages_cap_rates[stage_id]
-            level_misses = 0.
-            level_nn_rate = 1.
-            (sessions_cap, sessions_attempt, sessions_rate), (total_cap, total_attempt, total_rate) = cap_rates
-            for rate in total_rate:
-                level_misses += 1. - rate
-                level_nn_rate *= rate
-
-            level_misses_arr.append(level_misses)
-            total_misses += level_misses
-            level_nn_rate_arr.append(level_nn_rate)
-            total_nn_rate *= level_nn_rate
-
-        return (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate)
+        stages_rate = {}
+        for stage_id in self.get_config_stage_dict():
+            if stages_cap_rates is None:
+                total_cap, total_attempt, total_rate = self.get_total_cap_rates(stage_id)
+            else:
+                (sessions_cap, sessions_attempt, sessions_rate), (total_cap, total_attempt, total_rate) = \
+                    stages_cap_rates[stage_id]
+            stages_rate[stage_id] = total_rate
+        return summarize_rates(stages_rate)
 
     def get_config_stage_dict(self):
         """
@@ -160,3 +961,83 @@ class StatDatabase:
         :return: the stage index
         """
         return self.stage_idx_from_id[stage_id]
+
+
+def get_default_success_dict(config_stages):
+    """
+    get the default success list for a game session
+    :return: the default success list
+    """
+    success_dict = {}
+    for stage_id in config_stages:
+        success_dict[stage_id] = [1] * len(config_stages[stage_id])
+    return success_dict
+
+
+def truncate_result(config_stages, success_dict, quit_location):
+    """
+    cut a run at the point where the player quit, the chapters from there on were not played
+    :param config_stages: the Chapters dict of the config
+    :param success_dict: the outcome of each chapter {stage_id: list of 0/1}
+    :param quit_location: (stage_idx, chapter_idx) of the first chapter the player did not play
+    :return: the result of the run, {stage_id: list of 0/1 of the played chapters}
+    """
+    result = {}
+    for stage_idx, stage_id in enumerate(config_stages):
+        if stage_idx > quit_location[0]:
+            result[stage_id] = []
+        elif stage_idx == quit_location[0]:
+            result[stage_id] = success_dict[stage_id][:quit_location[1]]
+        else:
+            result[stage_id] = success_dict[stage_id].copy()
+    return result
+
+
+def merge_counters(target, source, sign):
+    """
+    add (sign=1) or subtract (sign=-1) capture/attempt counters into another set of counters
+    :param target: the counters to update, a dict {stage_id: (cap_list, attempt_list)}
+    :param source: the counters to add or subtract, in the same format
+    :param sign: 1 to add, -1 to subtract
+    """
+    for stage_id in source:
+        source_cap, source_attempt = source[stage_id]
+        target_cap, target_attempt = target[stage_id]
+        for j in range(len(source_cap)):
+            target_cap[j] += sign * source_cap[j]
+            target_attempt[j] += sign * source_attempt[j]
+
+
+def summarize_rates(stages_rate):
+    """
+    compute the average number of misses and the NN rate of each level and in total
+    :param stages_rate: {stage_id: list of capture rates of each chapter}
+    :return: (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate)
+    """
+    level_misses_arr = []
+    total_misses = 0.
+    level_nn_rate_arr = []
+    total_nn_rate = 1.
+    for stage_id in stages_rate:
+        level_misses = 0.
+        level_nn_rate = 1.
+        for rate in stages_rate[stage_id]:
+            level_misses += 1. - rate
+            level_nn_rate *= rate
+
+        level_misses_arr.append(level_misses)
+        total_misses += level_misses
+        level_nn_rate_arr.append(level_nn_rate)
+        total_nn_rate *= level_nn_rate
+
+    return (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate)
+
+
+def compute_rates(capture_list, attempt_list):
+    """
+    compute the capture rate of each chapter
+    :param capture_list: the number of captures of each chapter
+    :param attempt_list: the number of attempts of each chapter
+    :return: a list of capture rates, 0 for chapters never attempted
+    """
+    return [capture_list[i] / attempt_list[i] if attempt_list[i] > 0 else 0 for i in range(len(capture_list))]
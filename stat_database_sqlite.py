@@ -0,0 +1,479 @@
+import os
+import sqlite3
+import contextlib
+
+import stat_config
+import stat_profile
+import constants
+from stat_database import StatDatabase, compute_rates
+
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON sessions(date, id);
+CREATE TABLE IF NOT EXISTS session_attributes (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (session_id, name)
+);
+CREATE INDEX IF NOT EXISTS idx_session_attributes_value ON session_attributes(name, value, session_id);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_runs_session ON runs(session_id, id);
+CREATE TABLE IF NOT EXISTS outcomes (
+    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+    session_id INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    chapter INTEGER NOT NULL,
+    captured INTEGER NOT NULL,
+    PRIMARY KEY (run_id, stage, chapter)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_outcomes_stage ON outcomes(stage, chapter, captured);
+CREATE INDEX IF NOT EXISTS idx_outcomes_session ON outcomes(session_id, stage, chapter, captured);
+'''
+
+
+def connect(sqlite_path):
+    """
+    open a SQLite database and make sure the tables exist
+    :param sqlite_path: the path to the SQLite file
+    :return: the connection
+    """
+    # a workspace opens databases on a loading thread and hands them over to the UI thread
+    connection = sqlite3.connect(sqlite_path, check_same_thread=False)
+    connection.execute('PRAGMA foreign_keys = ON')
+    connection.execute('PRAGMA journal_mode = WAL')
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def insert_game_session(cursor, date_str, attributes, session_id=None):
+    """
+    insert a game session row and its attributes
+    :param session_id: the id of the session, or None for a new id
+    :return: the id of the new session
+    """
+    cursor.execute('INSERT INTO sessions (id, date) VALUES (?, ?)', (session_id, date_str))
+    session_id = cursor.lastrowid
+    cursor.executemany('INSERT INTO session_attributes (session_id, name, value) VALUES (?, ?, ?)',
+                       [(session_id, name, value) for name, value in attributes.items()])
+    return session_id
+
+
+def insert_game_result(cursor, session_id, result):
+    """
+    insert a run row and one outcome row per attempted chapter
+    """
+    cursor.execute('INSERT INTO runs (session_id) VALUES (?)', (session_id,))
+    run_id = cursor.lastrowid
+    rows = []
+    for stage_id, success_list in result.items():
+        for chapter_idx, success in enumerate(success_list):
+            rows.append((run_id, session_id, stage_id, chapter_idx, success))
+    cursor.executemany('INSERT INTO outcomes (run_id, session_id, stage, chapter, captured) VALUES (?, ?, ?, ?, ?)',
+                       rows)
+
+
+def migrate_json_to_sqlite(config_path):
+    """
+    copy all sessions of the json data file (and its journal) into the SQLite database of a config
+    the json data file is left untouched
+    :param config_path: the path to the config file
+    """
+    data = stat_config.load_json_data(config_path)
+    connection = connect(stat_config.get_sqlite_path(config_path))
+    with connection:
+        cursor = connection.cursor()
+        # the sessions keep their ids
+        for session, session_id in zip(data[constants.DATA_DATA], data[constants.DATA_SESSION_IDS]):
+            insert_game_session(cursor, session['Date'], session['Attributes'], session_id)
+            for result in session[constants.DATA_RESULT]:
+                insert_game_result(cursor, session_id, result)
+    connection.close()
+
+
+class SqliteStatDatabase(StatDatabase):
+    """
+    A StatDatabase that keeps the data in a SQLite file instead of the json data file.
+    Every change is a small transaction and the statistics are computed by SQL queries.
+    """
+    def __init__(self, config_path, config):
+        sqlite_path = stat_config.get_sqlite_path(config_path)
+        if not os.path.exists(sqlite_path) and os.path.exists(stat_config.get_data_path(config_path)):
+            migrate_json_to_sqlite(config_path)
+        self.connection = connect(sqlite_path)
+        super().__init__(config_path, config, None)
+
+        # session ids are the row ids of the sessions table; the keys of session_versions are the ids of every
+        # session, in the order they were recorded
+        self.session_versions = {row[0]: self.next_version()
+                                 for row in self.connection.execute('SELECT id FROM sessions ORDER BY id')}
+
+    def rebuild_counters(self):
+        """
+        nothing to do, the statistics are queried from the database
+        """
+        pass
+
+    @stat_profile.timed
+    def commit(self):
+        """
+        save the data to the file
+        inside a batch, the save is left to the end of the batch
+        """
+        if self.batch_undo is None:
+            self.connection.commit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        apply many sessions and results as one transaction, see StatDatabase.batch
+        :return: a context manager giving the database
+        """
+        if self.batch_undo is not None:
+            yield self
+            return
+        self.connection.commit()  # the batch rolls back to here
+        saved_versions = self.session_versions.copy()
+        self.batch_undo = []  # only marks the batch, the transaction is the undo log
+        try:
+            yield self
+        except BaseException:
+            self.connection.rollback()
+            self.session_versions = saved_versions
+            for session_id in self.session_versions:
+                self.session_versions[session_id] = self.next_version()
+            self.reach = None  # rebuilt on its next use
+            raise
+        finally:
+            self.batch_undo = None
+        self.connection.commit()
+
+    def close(self):
+        """
+        persist everything before the program exits
+        """
+        self.connection.commit()
+        self.connection.close()
+
+    def add_game_session(self, date_str, attributes=None):
+        """
+        record a game session to the database
+        :param date_str: the date of the game session
+        :param attributes: the attributes of the session, or None for the current dropdown attributes
+        :return: the id of the newly added session
+        """
+        if attributes is None:
+            attributes = self.current_dropdown_attributes
+        if self.batch_undo is not None:
+            self.validate_game_session(date_str, attributes)
+        session_id = insert_game_session(self.connection.cursor(), date_str, attributes)
+        self.session_versions[session_id] = self.next_version()
+        if self.reach is not None:
+            self.reach.add_session(session_id)
+        return session_id
+
+    def remove_game_session(self, session_id):
+        """
+        remove a game session together with all of its results
+        :param session_id: the id of the session
+        """
+        self.session_versions.pop(session_id)
+        self.next_version()  # a removal changes the data version as well
+        self.connection.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        if self.reach is not None:
+            self.reach.remove_session(session_id)
+
+    def add_game_result(self, session_id, result):
+        """
+        add a game result to the database
+        :param session_id: the id of the session
+        :param result: the result of the game, a list of 0 (fail) or 1 (capture)
+        """
+        if self.batch_undo is not None:
+            self.validate_game_result(result)
+        insert_game_result(self.connection.cursor(), session_id, result)
+        self.session_versions[session_id] = self.next_version()
+        if self.reach is not None:
+            self.reach.add_result(session_id, result)
+
+    def pop_game_result(self, session_id):
+        """
+        remove the last game result from the specified session
+        :param session_id: the id of the session
+        """
+        if self.reach is not None:
+            # the model needs the outcomes of the removed run
+            self.reach.pop_result(session_id, self.get_session_results(session_id)[-1])
+        self.connection.execute('DELETE FROM runs WHERE id = (SELECT MAX(id) FROM runs WHERE session_id = ?)',
+                                (session_id,))
+        self.session_versions[session_id] = self.next_version()
+
+    def get_session_ids(self):
+        """
+        get the ids of all recorded game sessions
+        :return: a list of session ids, in the order the sessions were recorded
+        """
+        return list(self.session_versions)
+
+    def has_session(self, session_id):
+        """
+        :param session_id: a session id
+        :return: True if the session exists and was not removed
+        """
+        return session_id in self.session_versions
+
+    def get_session_count(self):
+        """
+        get the number of recorded game sessions
+        :return: the number of sessions
+        """
+        return len(self.session_versions)
+
+    def get_session_date(self, session_id):
+        """
+        get the date of a game session
+        :param session_id: the id of the session
+        :return: the date string of the session
+        """
+        return self.connection.execute('SELECT date FROM sessions WHERE id = ?',
+                                       (session_id,)).fetchone()[0]
+
+    def get_session_attributes(self, session_id):
+        """
+        get the dropdown attributes a game session was recorded with
+        :param session_id: the id of the session
+        :return: a dictionary of attributes {attribute name: value}
+        """
+        rows = self.connection.execute('SELECT name, value FROM session_attributes WHERE session_id = ?',
+                                       (session_id,))
+        return dict(rows)
+
+    def get_session_results(self, session_id):
+        """
+        get the game results of a session
+        :param session_id: the id of the session
+        :return: a list of results, each a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        rows = self.connection.execute(
+            'SELECT runs.id, outcomes.stage, outcomes.captured FROM runs '
+            'LEFT JOIN outcomes ON outcomes.run_id = runs.id '
+            'WHERE runs.session_id = ? ORDER BY runs.id, outcomes.stage, outcomes.chapter',
+            (session_id,))
+        results = {}
+        for run_id, stage_id, success in rows:
+            if run_id not in results:
+                results[run_id] = {stage: [] for stage in self.get_config_stage_dict()}
+            if stage_id is not None:
+                results[run_id][stage_id].append(success)
+        return list(results.values())
+
+    def get_session(self, session_id):
+        """
+        get the session dict of a session, built from its rows
+        :param session_id: the id of the session
+        :return: the session dict, a copy: changing it does not change the database
+        """
+        if session_id not in self.session_versions:
+            raise KeyError(session_id)
+        return {
+            'Date': self.get_session_date(session_id),
+            'Attributes': self.get_session_attributes(session_id),
+            constants.DATA_RESULT: self.get_session_results(session_id),
+        }
+
+    def peek_session(self, session_id):
+        """
+        get the session dict of a session, see get_session
+        :param session_id: the id of the session
+        :return: the session dict
+        """
+        return self.get_session(session_id)
+
+    def iter_game_results(self, session_id=None):
+        """
+        iterate over game results in the order they were recorded
+        :param session_id: only the results of this session, or None for every result of every session
+        :return: an iterator of results, each a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        if session_id is not None:
+            yield from self.get_session_results(session_id)
+            return
+        rows = self.connection.execute(
+            'SELECT runs.id, outcomes.stage, outcomes.captured FROM runs '
+            'LEFT JOIN outcomes ON outcomes.run_id = runs.id '
+            'ORDER BY runs.id, outcomes.stage, outcomes.chapter')
+        current_run_id = None
+        result = None
+        for run_id, stage_id, success in rows:
+            if run_id != current_run_id:
+                if result is not None:
+                    yield result
+                current_run_id = run_id
+                result = {stage: [] for stage in self.get_config_stage_dict()}
+            if stage_id is not None:
+                result[stage_id].append(success)
+        if result is not None:
+            yield result
+
+    def get_session_result_count(self, session_id):
+        """
+        get the number of game results in a session
+        :param session_id: the id of the session
+        :return: the number of results
+        """
+        return self.connection.execute('SELECT COUNT(*) FROM runs WHERE session_id = ?',
+                                       (session_id,)).fetchone()[0]
+
+    def query_chapter_counts(self, stage_id, query, parameters):
+        """
+        run a query returning (group, chapter, captures, attempts) rows and collect them per group
+        :return: {group: (cap_list, attempt_list)}
+        """
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        grouped_counters = {}
+        for group, chapter_idx, captures, attempts in self.connection.execute(query, parameters):
+            if group not in grouped_counters:
+                grouped_counters[group] = ([0] * chapter_count, [0] * chapter_count)
+            grouped_counters[group][0][chapter_idx] = captures
+            grouped_counters[group][1][chapter_idx] = attempts
+        return grouped_counters
+
+    @stat_profile.timed
+    def aggregate_cap_rates(self, stage_id):
+        """
+        aggregate the capture rates
+        :return: ((sessions cap, sessions attempt, sessions rate), (total cap, total attempt, total rate))
+        """
+        grouped_counters = self.query_chapter_counts(
+            stage_id,
+            'SELECT session_id, chapter, SUM(captured), COUNT(*) FROM outcomes '
+            'WHERE stage = ? GROUP BY session_id, chapter',
+            (stage_id,))
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        sessions_cap = []
+        sessions_attempt = []
+        sessions_rate = []
+        for session_id in self.session_versions:
+            capture_list, attempt_list = grouped_counters.get(session_id, ([0] * chapter_count, [0] * chapter_count))
+            sessions_cap.append(capture_list)
+            sessions_attempt.append(attempt_list)
+            sessions_rate.append(compute_rates(capture_list, attempt_list))
+
+        return (sessions_cap, sessions_attempt, sessions_rate), self.get_total_cap_rates(stage_id)
+
+    def get_session_cap_rates(self, stage_id, session_id):
+        """
+        get the capture rates of a single session
+        :param stage_id: the stage id
+        :param session_id: the id of the session
+        :return: (session cap, session attempt, session rate)
+        """
+        grouped_counters = self.query_chapter_counts(
+            stage_id,
+            'SELECT session_id, chapter, SUM(captured), COUNT(*) FROM outcomes '
+            'WHERE session_id = ? AND stage = ? GROUP BY chapter',
+            (session_id, stage_id))
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        capture_list, attempt_list = grouped_counters.get(session_id, ([0] * chapter_count, [0] * chapter_count))
+        return capture_list, attempt_list, compute_rates(capture_list, attempt_list)
+
+    def get_total_cap_rates(self, stage_id):
+        """
+        get the capture rates of all sessions combined
+        :param stage_id: the stage id
+        :return: (total cap, total attempt, total rate)
+        """
+        grouped_counters = self.query_chapter_counts(
+            stage_id,
+            'SELECT 0, chapter, SUM(captured), COUNT(*) FROM outcomes WHERE stage = ? GROUP BY chapter',
+            (stage_id,))
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        total_cap, total_attempt = grouped_counters.get(0, ([0] * chapter_count, [0] * chapter_count))
+        return total_cap, total_attempt, compute_rates(total_cap, total_attempt)
+
+    @stat_profile.timed
+    def aggregate_cap_rates_last_runs(self, stage_id, run_count):
+        """
+        aggregate the capture rates of the latest runs, sessions ordered by date
+        :param stage_id: the stage id
+        :param run_count: the number of runs to include
+        :return: (cap, attempt, rate)
+        """
+        grouped_counters = self.query_chapter_counts(
+            stage_id,
+            'SELECT 0, chapter, SUM(captured), COUNT(*) FROM outcomes WHERE stage = ? AND run_id IN ('
+            'SELECT runs.id FROM runs JOIN sessions ON sessions.id = runs.session_id '
+            'ORDER BY sessions.date DESC, sessions.id DESC, runs.id DESC LIMIT ?) GROUP BY chapter',
+            (stage_id, run_count))
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        capture_list, attempt_list = grouped_counters.get(0, ([0] * chapter_count, [0] * chapter_count))
+        return capture_list, attempt_list, compute_rates(capture_list, attempt_list)
+
+    @stat_profile.timed
+    def aggregate_cap_rates_between_dates(self, stage_id, start_date, end_date):
+        """
+        aggregate the capture rates of the sessions dated between two dates, inclusive
+        :param stage_id: the stage id
+        :param start_date: the first date, 'YYYY-MM-DD'
+        :param end_date: the last date, 'YYYY-MM-DD'
+        :return: (cap, attempt, rate)
+        """
+        grouped_counters = self.query_chapter_counts(
+            stage_id,
+            'SELECT 0, chapter, SUM(captured), COUNT(*) FROM outcomes WHERE stage = ? AND session_id IN ('
+            'SELECT id FROM sessions WHERE date BETWEEN ? AND ?) GROUP BY chapter',
+            (stage_id, start_date, end_date))
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        capture_list, attempt_list = grouped_counters.get(0, ([0] * chapter_count, [0] * chapter_count))
+        return capture_list, attempt_list, compute_rates(capture_list, attempt_list)
+
+    def get_attribute_values(self, attribute_name):
+        """
+        get the values of an attribute that appear in at least one session
+        :param attribute_name: the attribute name
+        :return: a list of values
+        """
+        rows = self.connection.execute('SELECT DISTINCT value FROM session_attributes WHERE name = ?',
+                                       (attribute_name,))
+        return [row[0] for row in rows]
+
+    def get_sessions_with_attribute(self, attribute_name, value):
+        """
+        look up the sessions recorded with a given attribute value
+        :param attribute_name: the attribute name
+        :param value: the attribute value
+        :return: a sorted list of session ids
+        """
+        rows = self.connection.execute('SELECT session_id FROM session_attributes WHERE name = ? AND value = ?',
+                                       (attribute_name, value))
+        return sorted(row[0] for row in rows)
+
+    @stat_profile.timed
+    def aggregate_cap_rates_by_attribute(self, stage_id, attribute_name):
+        """
+        aggregate the capture rates of all sessions grouped by the value of a session attribute
+        :param stage_id: the stage id
+        :param attribute_name: the attribute to group by, e.g. a dropdown attribute name
+        :return: {attribute value: (cap, attempt, rate)}
+        """
+        grouped_counters = self.query_chapter_counts(
+            stage_id,
+            'SELECT session_attributes.value, outcomes.chapter, SUM(outcomes.captured), COUNT(*) '
+            'FROM session_attributes JOIN outcomes ON outcomes.session_id = session_attributes.session_id '
+            'WHERE session_attributes.name = ? AND outcomes.stage = ? '
+            'GROUP BY session_attributes.value, outcomes.chapter',
+            (attribute_name, stage_id))
+        # a value whose sessions have no outcome in the stage gets no row, it is zero as in the other storages
+        chapter_count = len(self.get_config_stage_dict()[stage_id])
+        grouped_rates = {}
+        for value in self.get_attribute_values(attribute_name):
+            group_cap, group_attempt = grouped_counters.get(value, ([0] * chapter_count, [0] * chapter_count))
+            grouped_rates[value] = (group_cap, group_attempt, compute_rates(group_cap, group_attempt))
+        return grouped_rates
@@ -0,0 +1,326 @@
+import os
+import sys
+import io
+import csv
+import json
+import array
+import struct
+import argparse
+
+import stat_database
+import constants
+
+
+# the flat layout of every export: one row per chapter of every stage of every run, unreached chapters included
+#   session_id, date, one column per session attribute, run (index of the run in its session),
+#   stage, chapter (index of the chapter in its stage), reached (0/1), captured (0/1)
+# rows are produced session by session, so memory stays bounded by one session plus one chunk of rows
+FORMAT_CSV = 'csv'
+FORMAT_JSONL = 'jsonl'
+FORMAT_COLUMNAR = 'columnar'
+SESSION_COLUMNS = ['session_id', 'date']
+RUN_COLUMNS = ['run', 'stage', 'chapter', 'reached', 'captured']
+
+# columnar file layout, all integers little-endian:
+#   magic
+#   row groups, each: row count (uint32), then every column as a contiguous array of its type
+#   footer json: columns [[name, type]], dictionaries {column: list of values}, row groups [[offset, row count]]
+#   footer length (uint32), magic
+# dictionary columns (date, attributes, stage) hold the index of their value in the footer dictionary,
+# MISSING_VALUE for a session without the attribute
+COLUMNAR_MAGIC = b'THSTCOL1'
+UINT32 = struct.Struct('<I')
+MISSING_VALUE = 0xFFFF
+COLUMN_TYPES = {'uint8': 'B', 'uint16': 'H', 'uint32': 'I'}
+ZERO_BYTES = bytes(256)  # padding of the reached/captured columns, chapters of a stage fit in a uint8
+ONE_BYTES = b'\x01' * 256
+
+
+def get_attribute_names(database):
+    """
+    :param database: the StatDatabase
+    :return: the sorted names of every attribute any session was recorded with
+    """
+    names = set(database.get_all_dropdown_attribute_name())
+    for session_id in database.get_session_ids():
+        names.update(database.get_session_attributes(session_id).keys())
+    return sorted(names)
+
+
+def iter_sessions(database):
+    """
+    iterate over the sessions without keeping lazily loaded sessions decoded
+    :param database: the StatDatabase
+    :return: an iterator of (session id, date, attributes, results)
+    """
+    for session_id in database.get_session_ids():
+        yield (session_id, database.get_session_date(session_id), database.get_session_attributes(session_id),
+               database.iter_game_results(session_id))
+
+
+def format_csv_line(values):
+    """
+    :param values: the values of a line
+    :return: the line quoted as csv.writer would, with its line terminator
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+class CsvExportWriter:
+    """
+    Writes the rows as csv with a header row; a missing attribute is an empty field.
+    The session, run and chapter parts of each line are quoted once and reused for all of their rows.
+    """
+    def __init__(self, f, config_stages, attribute_names):
+        self.f = f
+        self.attribute_names = attribute_names
+        self.chapter_parts = []
+        for stage_id, chapters_list in config_stages.items():
+            for chapter_idx in range(len(chapters_list)):
+                self.chapter_parts.append((stage_id, f'{format_csv_line([stage_id, chapter_idx])[:-2]},'))
+        f.write(format_csv_line(SESSION_COLUMNS + attribute_names + RUN_COLUMNS))
+
+    def write_session(self, session_id, date_str, attributes, results):
+        session_part = format_csv_line([session_id, date_str] +
+                                       [attributes.get(name, '') for name in self.attribute_names])[:-2]
+        lines = []
+        for run_idx, result in enumerate(results):
+            run_part = f'{session_part},{run_idx},'
+            chapter_idx = 0
+            previous_stage = None
+            for stage_id, chapter_part in self.chapter_parts:
+                if stage_id != previous_stage:
+                    success_list = result[stage_id]
+                    chapter_idx = 0
+                    previous_stage = stage_id
+                if chapter_idx < len(success_list):
+                    lines.append(f'{run_part}{chapter_part}1,{success_list[chapter_idx]}\r\n')
+                else:
+                    lines.append(f'{run_part}{chapter_part}0,0\r\n')
+                chapter_idx += 1
+            if len(lines) >= constants.EXPORT_CHUNK_ROWS:
+                self.f.write(''.join(lines))
+                lines = []
+        self.f.write(''.join(lines))
+
+    def close(self):
+        pass
+
+
+class JsonlExportWriter:
+    """
+    Writes one json object per row; a missing attribute is null.
+    The session and run parts of each object are serialized once and reused for all of their rows.
+    """
+    def __init__(self, f, config_stages, attribute_names):
+        self.f = f
+        self.attribute_names = attribute_names
+        # the stage and chapter part of every chapter, in row order
+        self.chapter_parts = []
+        for stage_id, chapters_list in config_stages.items():
+            for chapter_idx in range(len(chapters_list)):
+                self.chapter_parts.append((stage_id, f'"stage":{json.dumps(stage_id, ensure_ascii=False)},'
+                                                     f'"chapter":{chapter_idx},'))
+
+    def write_session(self, session_id, date_str, attributes, results):
+        session_part = json.dumps({'session_id': session_id, 'date': date_str,
+                                   **{name: attributes.get(name) for name in self.attribute_names}},
+                                  separators=(',', ':'), ensure_ascii=False)[:-1]
+        lines = []
+        for run_idx, result in enumerate(results):
+            run_part = f'{session_part},"run":{run_idx},'
+            chapter_idx = 0
+            previous_stage = None
+            for stage_id, chapter_part in self.chapter_parts:
+                if stage_id != previous_stage:
+                    success_list = result[stage_id]
+                    chapter_idx = 0
+                    previous_stage = stage_id
+                if chapter_idx < len(success_list):
+                    lines.append(f'{run_part}{chapter_part}"reached":1,"captured":{success_list[chapter_idx]}}}\n')
+                else:
+                    lines.append(f'{run_part}{chapter_part}"reached":0,"captured":0}}\n')
+                chapter_idx += 1
+            if len(lines) >= constants.EXPORT_CHUNK_ROWS:
+                self.f.write(''.join(lines))
+                lines = []
+        self.f.write(''.join(lines))
+
+    def close(self):
+        pass
+
+
+class ColumnarExportWriter:
+    """
+    Writes the rows as typed columns in row groups of up to EXPORT_CHUNK_ROWS rows, see the file layout above.
+    The stage, chapter and reached/captured columns are filled run by run from per-run templates,
+    the session columns session by session.
+    """
+    def __init__(self, f, config_stages, attribute_names):
+        self.f = f
+        self.attribute_names = attribute_names
+        self.columns = [['session_id', 'uint32'], ['date', 'uint16']] + \
+            [[name, 'uint16'] for name in attribute_names] + \
+            [['run', 'uint32'], ['stage', 'uint8'], ['chapter', 'uint8'], ['reached', 'uint8'], ['captured', 'uint8']]
+        self.dictionaries = {'date': [], 'stage': list(config_stages.keys())}
+        for name in attribute_names:
+            self.dictionaries[name] = []
+        self.dictionary_indices = {column: {} for column in self.dictionaries}
+        self.row_groups = []
+        self.stage_template = array.array('B')
+        self.chapter_template = array.array('B')
+        for stage_idx, chapters_list in enumerate(config_stages.values()):
+            self.stage_template.extend([stage_idx] * len(chapters_list))
+            self.chapter_template.extend(range(len(chapters_list)))
+        self.run_width = len(self.stage_template)
+        self.chapter_counts = [(stage_id, len(chapters_list)) for stage_id, chapters_list in config_stages.items()]
+        self.f.write(COLUMNAR_MAGIC)
+        self.buffers = None
+        self.reset_buffers()
+
+    def reset_buffers(self):
+        self.buffers = [array.array(COLUMN_TYPES[column_type]) for name, column_type in self.columns]
+        self.buffered_rows = 0
+
+    def get_dictionary_index(self, column, value):
+        if value is None:
+            return MISSING_VALUE
+        indices = self.dictionary_indices[column]
+        if value not in indices:
+            indices[value] = len(self.dictionaries[column])
+            self.dictionaries[column].append(value)
+        return indices[value]
+
+    def write_session(self, session_id, date_str, attributes, results):
+        session_values = [session_id, self.get_dictionary_index('date', date_str)] + \
+            [self.get_dictionary_index(name, attributes.get(name)) for name in self.attribute_names]
+        run_column, stage_column, chapter_column, reached_column, captured_column = self.buffers[len(session_values):]
+        session_runs = 0  # runs of this session buffered since the session columns were last filled
+        for run_idx, result in enumerate(results):
+            for stage_id, chapter_count in self.chapter_counts:
+                success_list = result[stage_id]
+                missing = chapter_count - len(success_list)
+                reached_column.frombytes(ONE_BYTES[:len(success_list)])
+                reached_column.frombytes(ZERO_BYTES[:missing])
+                captured_column.frombytes(bytes(success_list))
+                captured_column.frombytes(ZERO_BYTES[:missing])
+            run_column.extend(array.array('I', [run_idx]) * self.run_width)
+            stage_column.extend(self.stage_template)
+            chapter_column.extend(self.chapter_template)
+            self.buffered_rows += self.run_width
+            session_runs += 1
+            if self.buffered_rows >= constants.EXPORT_CHUNK_ROWS:
+                self.fill_session_columns(session_values, session_runs)
+                session_runs = 0
+                self.write_row_group()
+                run_column, stage_column, chapter_column, reached_column, captured_column = \
+                    self.buffers[len(session_values):]
+        self.fill_session_columns(session_values, session_runs)
+
+    def fill_session_columns(self, session_values, run_count):
+        for buffer, value in zip(self.buffers, session_values):
+            buffer.extend(array.array(buffer.typecode, [value]) * (run_count * self.run_width))
+
+    def write_row_group(self):
+        if self.buffered_rows == 0:
+            return
+        self.row_groups.append([self.f.tell(), self.buffered_rows])
+        self.f.write(UINT32.pack(self.buffered_rows))
+        for buffer in self.buffers:
+            if sys.byteorder != 'little':
+                buffer.byteswap()
+            self.f.write(buffer.tobytes())
+        self.reset_buffers()
+
+    def close(self):
+        self.write_row_group()
+        footer = {'Columns': self.columns, 'Dictionaries': self.dictionaries, 'RowGroups': self.row_groups}
+        footer_bytes = json.dumps(footer, separators=(',', ':'), ensure_ascii=False).encode('UTF-8')
+        self.f.write(footer_bytes)
+        self.f.write(UINT32.pack(len(footer_bytes)))
+        self.f.write(COLUMNAR_MAGIC)
+
+
+WRITERS = {
+    FORMAT_CSV: CsvExportWriter,
+    FORMAT_JSONL: JsonlExportWriter,
+    FORMAT_COLUMNAR: ColumnarExportWriter,
+}
+
+
+def export_database(database, output_path, export_format):
+    """
+    stream the whole history of a database to a file
+    the file is written under a temporary name and only replaces output_path once complete
+    :param database: the StatDatabase
+    :param output_path: the path of the exported file
+    :param export_format: FORMAT_CSV, FORMAT_JSONL or FORMAT_COLUMNAR
+    :return: the number of sessions exported
+    """
+    config_stages = database.get_config_stage_dict()
+    attribute_names = get_attribute_names(database)
+    temp_path = f'{output_path}.tmp'
+    session_count = 0
+    if export_format == FORMAT_COLUMNAR:
+        f = open(temp_path, mode='wb')
+    else:
+        f = open(temp_path, mode='w', encoding='UTF-8', newline='')
+    with f:
+        writer = WRITERS[export_format](f, config_stages, attribute_names)
+        for session_id, date_str, attributes, results in iter_sessions(database):
+            writer.write_session(session_id, date_str, attributes, results)
+            session_count += 1
+        writer.close()
+    os.replace(temp_path, output_path)
+    return session_count
+
+
+def read_columnar(input_path):
+    """
+    read a columnar export row group by row group
+    :param input_path: the path of the exported file
+    :return: (footer dict, iterator of {column name: array} per row group)
+    """
+    with open(input_path, mode='rb') as f:
+        f.seek(-len(COLUMNAR_MAGIC) - UINT32.size, os.SEEK_END)
+        footer_length = UINT32.unpack(f.read(UINT32.size))[0]
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f'{input_path} is not a thstat columnar export')
+        f.seek(-len(COLUMNAR_MAGIC) - UINT32.size - footer_length, os.SEEK_END)
+        footer = json.loads(f.read(footer_length).decode('UTF-8'))
+
+    def iter_row_groups():
+        with open(input_path, mode='rb') as group_file:
+            for offset, row_count in footer['RowGroups']:
+                group_file.seek(offset + UINT32.size)
+                columns = {}
+                for name, column_type in footer['Columns']:
+                    column = array.array(COLUMN_TYPES[column_type])
+                    column.frombytes(group_file.read(row_count * column.itemsize))
+                    if sys.byteorder != 'little':
+                        column.byteswap()
+                    columns[name] = column
+                yield columns
+
+    return footer, iter_row_groups()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export the practice history of a thstat config as flat rows.')
+    parser.add_argument('config_path', help='path to the config file')
+    parser.add_argument('output_path', help='path of the exported file')
+    parser.add_argument('-f', '--format', dest='export_format', choices=list(WRITERS.keys()), default=FORMAT_CSV,
+                        help='csv, jsonl or columnar (typed binary columns); default csv')
+    args = parser.parse_args(argv)
+
+    database = stat_database.open_database(args.config_path)
+    session_count = export_database(database, args.output_path, args.export_format)
+    database.close()
+    print(f'Exported {session_count} sessions to {args.output_path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import os
+import sys
+import csv
+import json
+import argparse
+
+import stat_database
+import stat_export
+
+
+# the rows are those of stat_export: one row per chapter of every run, with the columns
+#   session_id, date, one column per session attribute, run, stage, chapter, reached, captured
+# session_id and run only group the rows, the imported sessions get new ids; reached may be left out (a row is a
+# reached chapter) and so may the rows of unreached chapters; an empty attribute is a missing one
+# the rows of a session, and of a run within it, must be consecutive
+
+
+class RunError(ValueError):
+    """
+    an invalid run, already tagged with the line it starts at
+    """
+
+
+def iter_csv_rows(f):
+    """
+    :param f: a csv file with a header row
+    :return: an iterator of (line number, row dict)
+    """
+    reader = csv.reader(f)
+    header = next(reader, [])
+    for line_number, values in enumerate(reader, start=2):
+        yield line_number, dict(zip(header, values))
+
+
+def iter_jsonl_rows(f):
+    """
+    :param f: a file of one json object per line
+    :return: an iterator of (line number, row dict)
+    """
+    for line_number, line in enumerate(f, start=1):
+        if line.strip():
+            yield line_number, json.loads(line)
+
+
+def build_result(config_stages, outcomes):
+    """
+    :param config_stages: the Chapters dict of the config
+    :param outcomes: {stage_id: {chapter index: 0 or 1}} of the reached chapters of a run
+    :return: the result dict of the run
+    """
+    result = {}
+    for stage_id in config_stages:
+        chapter_outcomes = outcomes[stage_id]
+        if sorted(chapter_outcomes) != list(range(len(chapter_outcomes))):
+            raise ValueError(f'the reached chapters of stage {stage_id!r} must be 0 to n-1, '
+                             f'got {sorted(chapter_outcomes)}')
+        result[stage_id] = [chapter_outcomes[chapter_idx] for chapter_idx in range(len(chapter_outcomes))]
+    return result
+
+
+def import_rows(database, rows):
+    """
+    add the sessions and runs of flat rows to a database in a single batch, saved by a single write
+    nothing is added if any row is invalid
+    :param database: the StatDatabase
+    :param rows: an iterator of (line number, row dict)
+    :return: (number of sessions added, number of runs added)
+    :raise ValueError: for the first invalid row, session or run, with its line number
+    """
+    config_stages = database.get_config_stage_dict()
+    fixed_columns = set(stat_export.SESSION_COLUMNS + stat_export.RUN_COLUMNS)
+    finished_session_keys = set()
+    session_key = None
+    session_id = None
+    finished_run_keys = set()
+    run_key = None
+    run_line_number = None
+    outcomes = None
+    session_count = 0
+    run_count = 0
+
+    def finish_run():
+        try:
+            database.add_game_result(session_id, build_result(config_stages, outcomes))
+        except ValueError as e:
+            raise RunError(f'run starting at line {run_line_number}: {e}') from e
+
+    with database.batch():
+        for line_number, row in rows:
+            try:
+                row_session_key = str(row['session_id'])
+                row_run_key = int(row['run'])
+                if row_session_key != session_key or row_run_key != run_key:
+                    if outcomes is not None:
+                        finish_run()
+                        run_count += 1
+                    if row_session_key != session_key:
+                        if row_session_key in finished_session_keys:
+                            raise ValueError(f'the rows of session {row_session_key} are not consecutive')
+                        if session_key is not None:
+                            finished_session_keys.add(session_key)
+                        attributes = {name: str(value) for name, value in row.items()
+                                      if name not in fixed_columns and value not in ('', None)}
+                        session_id = database.add_game_session(str(row['date']), attributes)
+                        session_key = row_session_key
+                        finished_run_keys = set()
+                        session_count += 1
+                    elif row_run_key in finished_run_keys:
+                        raise ValueError(f'the rows of run {row_run_key} of session {session_key} are not consecutive')
+                    else:
+                        finished_run_keys.add(run_key)
+                    run_key = row_run_key
+                    run_line_number = line_number
+                    outcomes = {stage_id: {} for stage_id in config_stages}
+                if int(row.get('reached', 1)) == 1:
+                    stage_id = str(row['stage'])
+                    if stage_id not in outcomes:
+                        raise ValueError(f'{stage_id!r} is not a stage of the config')
+                    outcomes[stage_id][int(row['chapter'])] = int(row['captured'])
+            except KeyError as e:
+                raise ValueError(f'line {line_number}: missing column {e}') from e
+            except RunError:
+                raise
+            except ValueError as e:
+                raise ValueError(f'line {line_number}: {e}') from e
+        if outcomes is not None:
+            finish_run()
+            run_count += 1
+    return session_count, run_count
+
+
+def import_file(database, input_path, import_format=None):
+    """
+    import a csv or jsonl file of flat rows, see import_rows
+    :param database: the StatDatabase
+    :param input_path: the path of the file
+    :param import_format: stat_export.FORMAT_CSV or FORMAT_JSONL, or None to tell by the file extension
+    :return: (number of sessions added, number of runs added)
+    """
+    if import_format is None:
+        is_jsonl = os.path.splitext(input_path)[1].lower() in ['.jsonl', '.ndjson']
+        import_format = stat_export.FORMAT_JSONL if is_jsonl else stat_export.FORMAT_CSV
+    # utf-8-sig also reads the byte order mark spreadsheet programs put in front of csv files
+    with open(input_path, mode='r', encoding='utf-8-sig', newline='') as f:
+        if import_format == stat_export.FORMAT_JSONL:
+            return import_rows(database, iter_jsonl_rows(f))
+        return import_rows(database, iter_csv_rows(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Import practice history from flat rows into a thstat config.')
+    parser.add_argument('config_path', help='path to the config file')
+    parser.add_argument('input_path', help='csv or jsonl file in the layout of stat_export')
+    parser.add_argument('-f', '--format', dest='import_format',
+                        choices=[stat_export.FORMAT_CSV, stat_export.FORMAT_JSONL], default=None,
+                        help='csv or jsonl; by default told by the file extension')
+    args = parser.parse_args(argv)
+
+    database = stat_database.open_database(args.config_path)
+    try:
+        session_count, run_count = import_file(database, args.input_path, args.import_format)
+    except ValueError as e:
+        print(f'Nothing was imported, {args.input_path}: {e}')
+        return 1
+    finally:
+        database.close()
+    print(f'Imported {session_count} sessions and {run_count} runs from {args.input_path}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,141 @@
+from collections.abc import MutableSequence
+
+import constants
+
+
+class LazySessionList(MutableSequence):
+    """
+    A list of game sessions that are only decoded from their source when first accessed.
+    Each slot holds either a decoded session dict or a handle understood by load_session,
+    or None for a removed session until the database drops its tombstones.
+    Subclasses implement load_session and may implement a cheaper count_handle_outcomes.
+    """
+    def __init__(self, handles):
+        self.slots = list(handles)
+
+    def load_session(self, handle):
+        """
+        decode a session from its source
+        :param handle: the handle stored in the slot
+        :return: the session dict
+        """
+        raise NotImplementedError
+
+    def count_handle_outcomes(self, handle, config_stages):
+        """
+        count the captures and attempts of a session that has not been decoded yet
+        :param handle: the handle stored in the slot
+        :param config_stages: the Chapters dict of the config
+        :return: a dict {stage_id: (cap_list, attempt_list)}
+        """
+        return count_session_outcomes(self.load_session(handle), config_stages)
+
+    def close(self):
+        """
+        release the source of the sessions; sessions not decoded yet can no longer be read
+        """
+
+    def get_handle_attributes(self, handle):
+        """
+        read the attributes of a session that has not been decoded yet
+        :param handle: the handle stored in the slot
+        :return: a dictionary of attributes {attribute name: value}
+        """
+        return self.load_session(handle)['Attributes']
+
+    def get_handle_date(self, handle):
+        """
+        read the date of a session that has not been decoded yet
+        :param handle: the handle stored in the slot
+        :return: the date string of the session
+        """
+        return self.load_session(handle)['Date']
+
+    def get_date(self, idx):
+        """
+        read the date of a session without keeping it decoded
+        :param idx: the index of the session
+        :return: the date string of the session
+        """
+        if self.is_loaded(idx):
+            return self.slots[idx]['Date']
+        return self.get_handle_date(self.slots[idx])
+
+    def peek(self, idx):
+        """
+        get a session without keeping it decoded, for a single pass over every session
+        :param idx: the index of the session
+        :return: the session dict, which must not be modified
+        """
+        if self.is_loaded(idx):
+            return self.slots[idx]
+        return self.load_session(self.slots[idx])
+
+    def get_attributes(self, idx):
+        """
+        read the attributes of a session without keeping it decoded
+        :param idx: the index of the session
+        :return: a dictionary of attributes {attribute name: value}
+        """
+        if self.is_loaded(idx):
+            return self.slots[idx]['Attributes']
+        return self.get_handle_attributes(self.slots[idx])
+
+    def is_loaded(self, idx):
+        """
+        check whether a session has already been decoded
+        :param idx: the index of the session
+        :return: True if the slot holds a session dict
+        """
+        return isinstance(self.slots[idx], dict)
+
+    def count_outcomes(self, idx, config_stages):
+        """
+        count the captures and attempts of a session without keeping it decoded
+        :param idx: the index of the session
+        :param config_stages: the Chapters dict of the config
+        :return: a dict {stage_id: (cap_list, attempt_list)}
+        """
+        if self.is_loaded(idx):
+            return count_session_outcomes(self.slots[idx], config_stages)
+        return self.count_handle_outcomes(self.slots[idx], config_stages)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        slot = self.slots[idx]
+        if not isinstance(slot, dict):
+            slot = self.load_session(slot)
+            self.slots[idx] = slot
+        return slot
+
+    def __setitem__(self, idx, session):
+        self.slots[idx] = session
+
+    def __delitem__(self, idx):
+        del self.slots[idx]
+
+    def __len__(self):
+        return len(self.slots)
+
+    def insert(self, idx, session):
+        self.slots.insert(idx, session)
+
+
+def count_session_outcomes(session, config_stages):
+    """
+    count the captures and attempts of each chapter in a session
+    :param session: the session dict
+    :param config_stages: the Chapters dict of the config
+    :return: a dict {stage_id: (cap_list, attempt_list)}
+    """
+    counters = {}
+    for stage_id, chapters_list in config_stages.items():
+        counters[stage_id] = ([0] * len(chapters_list), [0] * len(chapters_list))
+    for result in session[constants.DATA_RESULT]:
+        for stage_id in counters:
+            capture_list, attempt_list = counters[stage_id]
+            for j, success in enumerate(result[stage_id]):
+                capture_list[j] += success
+                attempt_list[j] += 1
+    return counters
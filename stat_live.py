@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import stat
+import time
+import asyncio
+import argparse
+import threading
+
+import stat_database
+import constants
+
+
+# a live feed is a stream of json events, one per line, written by a helper tool while the player practices
+#   {"type": "chapter", "stage": stage_id, "chapter": chapter index, "captured": 0 or 1}
+#       the outcome of a chapter of the current run
+#   {"type": "end"}
+#       the run is over, the player did not play the chapters after the furthest one reported
+#   {"type": "end", "stage": stage_id, "chapter": chapter index}
+#       the run is over, the player quit at this chapter and did not play it
+#   {"type": "discard"}
+#       forget the current run
+# as in the gameplay menu, a chapter before the quit location that was not reported counts as captured; a run
+# without any played chapter is not recorded
+
+# what the callback of a LiveFeed receives
+FEED_RUN = 'run'  # (FEED_RUN, result of the run)
+FEED_PROGRESS = 'progress'  # (FEED_PROGRESS, success_dict, quit_location) of the current run
+FEED_ERROR = 'error'  # (FEED_ERROR, message)
+
+
+class RunAssembler:
+    """
+    Assembles the events of a live feed into runs, cut where the player quit as the gameplay menu does.
+    The current run is kept as the gameplay menu keeps it: the outcome of every chapter and the quit location,
+    the first chapter not played.
+    """
+    def __init__(self, config_stages):
+        self.config_stages = config_stages
+        self.stage_idx_from_id = {stage_id: stage_idx for stage_idx, stage_id in enumerate(config_stages)}
+        self.success_dict = None
+        self.quit_location = None
+        self.reset()
+
+    def reset(self):
+        """
+        start a new run, in which nothing has been played yet
+        """
+        self.success_dict = stat_database.get_default_success_dict(self.config_stages)
+        self.quit_location = (0, 0)
+
+    def get_location(self, event):
+        """
+        :param event: an event with a stage and a chapter
+        :return: (stage_id, stage_idx, chapter_idx)
+        """
+        stage_id = event.get(constants.LIVE_STAGE)
+        if stage_id not in self.stage_idx_from_id:
+            raise ValueError(f'{stage_id!r} is not a stage of the config')
+        chapter_idx = event.get(constants.LIVE_CHAPTER)
+        if type(chapter_idx) != int or not 0 <= chapter_idx < len(self.config_stages[stage_id]):
+            raise ValueError(f'{chapter_idx!r} is not a chapter of stage {stage_id!r}')
+        return stage_id, self.stage_idx_from_id[stage_id], chapter_idx
+
+    def handle(self, event):
+        """
+        apply an event to the current run
+        :param event: the decoded event
+        :return: the result of the run the event ended, or None
+        :raise ValueError: if the event is invalid, the current run is then left unchanged
+        """
+        event_type = event.get(constants.LIVE_TYPE) if type(event) == dict else None
+        if event_type == constants.LIVE_EVENT_CHAPTER:
+            stage_id, stage_idx, chapter_idx = self.get_location(event)
+            captured = event.get(constants.LIVE_CAPTURED)
+            if type(captured) != int or captured not in [0, 1]:
+                raise ValueError(f'captured must be 0 or 1, got {captured!r}')
+            self.success_dict[stage_id][chapter_idx] = captured
+            self.quit_location = max(self.quit_location, (stage_idx, chapter_idx + 1))
+            return None
+        elif event_type == constants.LIVE_EVENT_END:
+            if constants.LIVE_STAGE in event:
+                _, stage_idx, chapter_idx = self.get_location(event)
+                quit_location = (stage_idx, chapter_idx)
+            else:
+                quit_location = self.quit_location
+            result = stat_database.truncate_result(self.config_stages, self.success_dict, quit_location)
+            self.reset()
+            if all(len(stage_result) == 0 for stage_result in result.values()):
+                return None
+            return result
+        elif event_type == constants.LIVE_EVENT_DISCARD:
+            self.reset()
+            return None
+        raise ValueError(f'unknown event type {event_type!r}')
+
+
+async def read_tail(path, handle_line):
+    """
+    follow a jsonl file from its current end, like tail -f
+    a file that does not exist yet is waited for, one that is truncated or replaced is read again from its start
+    :param path: the path to the file
+    :param handle_line: called with each complete line, as bytes
+    """
+    def get_file_id(file_stat):
+        return None if file_stat is None else (file_stat.st_dev, file_stat.st_ino)
+
+    file_stat = os.stat(path) if os.path.exists(path) else None
+    file_id = get_file_id(file_stat)
+    position = 0 if file_stat is None else file_stat.st_size
+    remainder = b''
+    while True:
+        await asyncio.sleep(constants.LIVE_POLL_INTERVAL)
+        try:
+            file_stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        if get_file_id(file_stat) != file_id or file_stat.st_size < position:
+            file_id = get_file_id(file_stat)
+            position = 0
+            remainder = b''
+        if file_stat.st_size == position:
+            continue
+        with open(path, mode='rb') as f:
+            f.seek(position)
+            chunk = f.read(file_stat.st_size - position)
+        position += len(chunk)
+        lines = (remainder + chunk).split(b'\n')
+        remainder = lines.pop()  # the part of a line still being written
+        for line in lines:
+            handle_line(line)
+
+
+async def read_fifo(path, handle_line):
+    """
+    read a named pipe, created if it does not exist; writers may open and close it any number of times
+    :param path: the path to the named pipe
+    :param handle_line: called with each complete line, as bytes
+    """
+    if not os.path.exists(path):
+        os.mkfifo(path)
+    elif not stat.S_ISFIFO(os.stat(path).st_mode):
+        raise ValueError(f'{path} is not a named pipe')
+    read_fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    # holding a write end ourselves keeps the pipe from reaching end of file whenever a writer closes it
+    write_fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader),
+                                                os.fdopen(read_fd, mode='rb', buffering=0))
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            handle_line(line)
+    finally:
+        transport.close()
+        os.close(write_fd)
+
+
+async def read_socket(path, handle_line):
+    """
+    listen on a unix socket, the lines of every connection are read as they arrive
+    :param path: the path of the socket, a socket left there by an earlier run is replaced
+    :param handle_line: called with each complete line, as bytes
+    """
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise ValueError(f'{path} is not a socket')
+        os.remove(path)
+    writers = set()
+
+    async def handle_connection(reader, writer):
+        writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                handle_line(line)
+        finally:
+            writers.discard(writer)
+            writer.close()
+
+    server = await asyncio.start_unix_server(handle_connection, path)
+    try:
+        await asyncio.Future()  # serve until cancelled
+    finally:
+        server.close()
+        for writer in list(writers):
+            writer.close()
+        os.remove(path)
+
+
+READERS = {
+    constants.LIVE_SOURCE_TAIL: read_tail,
+    constants.LIVE_SOURCE_FIFO: read_fifo,
+    constants.LIVE_SOURCE_SOCKET: read_socket,
+}
+
+
+class LiveFeed:
+    """
+    Reads a live feed with asyncio and assembles its events into runs.
+    start() runs the event loop on a background thread, so that waiting for events never blocks the window; the
+    callback is then called on that thread, and a window passes its values on with window.write_event_value.
+    The callback receives (FEED_RUN, result) for every finished run, (FEED_PROGRESS, success_dict, quit_location)
+    whenever the current run changes, and (FEED_ERROR, message) for an invalid event or a failing source; a failing
+    source ends the feed, and with it the background thread.
+    """
+    def __init__(self, config_stages, source, path, callback):
+        """
+        :param config_stages: the Chapters dict of the config
+        :param source: one of the LIVE_SOURCE values
+        :param path: the path to the file, named pipe or socket
+        :param callback: called with each value described above
+        """
+        if source not in READERS:
+            raise ValueError(f'unknown live feed source {source!r}, expected one of {list(READERS.keys())}')
+        if source != constants.LIVE_SOURCE_TAIL and sys.platform == 'win32':
+            raise ValueError(f'the {source} live feed source is not supported on Windows, use {constants.LIVE_SOURCE_TAIL}')
+        self.assembler = RunAssembler(config_stages)
+        self.source = source
+        self.path = path
+        self.callback = callback
+        self.stop_event = asyncio.Event()
+        self.stopping = threading.Event()  # set by stop, no callback is called afterwards
+        self.loop = None
+        self.running = threading.Event()  # set once the loop of the background thread runs
+        self.thread = None
+        self.error = None  # the exception the source failed with, if it did
+
+    def report(self, value):
+        """
+        pass a value to the callback, unless the feed is being stopped
+        """
+        if not self.stopping.is_set():
+            self.callback(value)
+
+    def handle_line(self, line):
+        """
+        :param line: a line of the feed, as bytes
+        """
+        line = line.strip()
+        if not line:
+            return
+        try:
+            result = self.assembler.handle(json.loads(line))
+        except ValueError as e:  # includes invalid json and utf-8
+            self.report((FEED_ERROR, f'Ignored the live event {line[:80]!r}: {e}'))
+            return
+        if result is not None:
+            self.report((FEED_RUN, result))
+        else:
+            success_dict = {stage_id: outcomes.copy() for stage_id, outcomes in self.assembler.success_dict.items()}
+            self.report((FEED_PROGRESS, success_dict, self.assembler.quit_location))
+
+    async def run(self):
+        """
+        read the feed until stop is called, the source fails, or until cancelled
+        a failing source is reported as a FEED_ERROR and kept in self.error
+        """
+        self.loop = asyncio.get_running_loop()
+        self.running.set()
+        reader = asyncio.ensure_future(READERS[self.source](self.path, self.handle_line))
+        stopper = asyncio.ensure_future(self.stop_event.wait())
+        try:
+            await asyncio.wait([reader, stopper], return_when=asyncio.FIRST_COMPLETED)
+            if reader.done() and not reader.cancelled() and reader.exception() is not None:
+                self.error = reader.exception()
+                self.report((FEED_ERROR, f'The live feed stopped: {type(self.error).__name__}: {self.error}'))
+        finally:
+            reader.cancel()
+            stopper.cancel()
+            await asyncio.gather(reader, stopper, return_exceptions=True)
+
+    def start(self):
+        """
+        read the feed on a background thread
+        """
+        self.thread = threading.Thread(target=asyncio.run, args=(self.run(),), name='thstat-live', daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """
+        stop reading, no callback is called afterwards except one already running
+        :param wait: wait for the background thread to end; a window that is posted to by the callback must keep
+        reading instead until is_alive is false, as posting an event waits for the window
+        """
+        self.stopping.set()
+        if self.thread is None:
+            return
+        self.running.wait()
+        try:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        except RuntimeError:
+            pass  # the loop is already closed, the feed ended on its own
+        if wait:
+            self.thread.join()
+
+    def is_alive(self):
+        """
+        :return: whether the background thread is still running
+        """
+        return self.thread is not None and self.thread.is_alive()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record the runs of a live event feed as a new game session.')
+    parser.add_argument('config_path', help='path to the config file')
+    parser.add_argument('-s', '--source', choices=list(READERS.keys()), default=None,
+                        help='kind of feed; by default the Source of the LiveFeed of the config')
+    parser.add_argument('-p', '--path', default=None,
+                        help='path to the file, named pipe or socket; by default the Path of the LiveFeed of the config')
+    args = parser.parse_args(argv)
+
+    database = stat_database.open_database(args.config_path)
+    live_config = database.config.get(constants.CONFIG_LIVE_FEED, {})
+    source = args.source or live_config.get('Source', constants.LIVE_SOURCE_TAIL)
+    path = args.path or live_config.get('Path')
+    if path is None:
+        print('No live feed path given, pass --path or set the LiveFeed of the config.')
+        database.close()
+        return 1
+
+    session_id = database.add_game_session(time.strftime("%Y-%m-%d", time.localtime()))
+
+    def apply(value):
+        if value[0] == FEED_RUN:
+            database.add_game_result(session_id, value[1])
+            database.commit()
+            print(f'Run {database.get_session_result_count(session_id)}: {value[1]}')
+        elif value[0] == FEED_ERROR:
+            print(value[1])
+
+    try:
+        feed = LiveFeed(database.get_config_stage_dict(), source, path, apply)
+    except ValueError as e:
+        print(e)
+        database.remove_game_session(session_id)
+        database.close()
+        return 1
+    print(f'Reading the live feed {path}, press Ctrl+C to stop.')
+    try:
+        asyncio.run(feed.run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # an empty session is dropped, as in the gameplay menu
+        if database.get_session_result_count(session_id) == 0:
+            database.remove_game_session(session_id)
+        database.close()
+    return 1 if feed.error is not None else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
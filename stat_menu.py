@@ -1,33 +1,70 @@
 import PySimpleGUI as sg
+import os
 import time
-import stat_plot
 import stat_ui_init
+import stat_database
+import stat_profile
+import stat_chart
 import constants
 import utilities.popup_menu as popup_menu
 
 
-def create_session_text_statistics_layout(database, session_idx):
+def get_session_text_statistics(database, session_id):
     """
-    return a dict of layouts that shows the rates as the following format, one layout per stage:
-    session_cap/session_attempt (session_rate%) | total_cap/total_attempt (total_rate%) | chapter_name
+    return a dict of text lines that show the rates as the following format, one list per stage:
+    session_cap/session_attempt (session_rate%) | total_cap/total_attempt (total_rate%)
     """
     config_stages = database.get_config_stage_dict()
 
-    layouts = {}
+    texts = {}
     for stage_id in config_stages:
         chapters_list = config_stages[stage_id]
-        (sessions_cap, sessions_attempt, sessions_rate), (total_cap, total_attempt, total_rate) = database.aggregate_cap_rates(stage_id)
-        stat_layout = []
+        session_cap, session_attempt, session_rate = database.get_session_cap_rates(stage_id, session_id)
+        total_cap, total_attempt, total_rate = database.get_total_cap_rates(stage_id)
+        stage_texts = []
         for i, chapter in enumerate(chapters_list):
-            stat_layout.append([sg.Text(
-                f'({sessions_rate[session_idx][i] * 100:.2f}%) '
-                f'{sessions_cap[session_idx][i]}/{sessions_attempt[session_idx][i]} | '
+            stage_texts.append(
+                f'({session_rate[i] * 100:.2f}%) '
+                f'{session_cap[i]}/{session_attempt[i]} | '
                 f'total ({total_rate[i] * 100:.2f}%) '
-                f'{total_cap[i]}/{total_attempt[i]}')])
+                f'{total_cap[i]}/{total_attempt[i]}')
+        texts[stage_id] = stage_texts
+    return texts
+
+
+def create_session_text_statistics_layout(database, session_id, key=None):
+    """
+    return a dict of layouts that shows the rates as the following format, one layout per stage:
+    session_cap/session_attempt (session_rate%) | total_cap/total_attempt (total_rate%) | chapter_name
+    :param key: if given, the text of chapter i of a stage gets the key (key, stage_id, i) so it can be updated
+    """
+    layouts = {}
+    for stage_id, stage_texts in get_session_text_statistics(database, session_id).items():
+        stat_layout = []
+        for i, text in enumerate(stage_texts):
+            text_key = None if key is None else (key, stage_id, i)
+            stat_layout.append([sg.Text(text, key=text_key)])
         layouts[stage_id] = stat_layout
     return layouts
 
 
+def create_rolling_statistics_layout(database, stage_id, run_count=100, day_counts=(7, 30)):
+    """
+    return a layout that shows the level NN rate and average misses over recent windows:
+    the last run_count runs and the last few days
+    """
+    windows = [(f'last {run_count} runs', database.aggregate_cap_rates_last_runs(stage_id, run_count))]
+    for day_count in day_counts:
+        windows.append((f'last {day_count} days', database.aggregate_cap_rates_last_days(stage_id, day_count)))
+
+    layout = []
+    for window_name, (capture_list, attempt_list, rate_list) in windows:
+        (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate) = \
+            stat_database.summarize_rates({stage_id: rate_list})
+        layout.append([sg.Text(f'{window_name}: average misses {total_misses:.3f}, NN rate {total_nn_rate:.5f}')])
+    return layout
+
+
 def select_session_menu(init_info, database):
     """
     select a session to view statistics
@@ -42,14 +79,19 @@ def select_session_menu(init_info, database):
     while continue_flag:
         # show the list of all recorded gameplay sessions
         items = []
-        for i, session in enumerate(database.data[constants.DATA_DATA]):
-            items.append(f'{i}.{session["Date"]}')
+        for session_id in database.get_session_ids():
+            items.append(f'{session_id}.{database.get_session_date(session_id)}')
         if len(items) == 0:
             default_values = []
             print('No recorded session found. Record a game first.')
             break
         else:
-            default_values = [items[0]]
+            # the session last viewed in this config, if it still exists
+            last_session_id = init_info.get_config_value(database.config_path, constants.KEY_LAST_SESSION_ID)
+            if last_session_id is not None and database.has_session(last_session_id):
+                default_values = [f'{last_session_id}.{database.get_session_date(last_session_id)}']
+            else:
+                default_values = [items[0]]
 
         layout = [[sg.Text('Select a session to view statistics')],
                   [sg.Listbox(values=items, default_values=default_values,
@@ -69,183 +111,459 @@ def select_session_menu(init_info, database):
         if event in [SHOW_STAT_STR, REMOVE_SESSION_STR]:
             selected_strs = values['-SESSION-']
             if len(selected_strs) != 0:
-                session_idx = int(values['-SESSION-'][0].split('.')[0])
+                session_id = int(values['-SESSION-'][0].split('.')[0])
                 if event == SHOW_STAT_STR:
-                    show_session_stat_menu(init_info, database, session_idx)
+                    init_info.set_config_value(database.config_path, constants.KEY_LAST_SESSION_ID, session_id)
+                    show_session_stat_menu(init_info, database, session_id)
                 elif event == REMOVE_SESSION_STR:
                     if popup_menu.confirm_popup('thstat', 'Are you sure you want to remove this session?'):
-                        database.remove_game_session(session_idx)
+                        database.remove_game_session(session_id)
                         database.commit()
             else:
                 print('No session selected. Please select a session.')
 
 
-def show_session_stat_menu(init_info, database, session_idx):
+def format_interval(interval):
+    """
+    :param interval: a (low, high) confidence interval, or None if it could not be computed
+    :return: the interval as a suffix for a statistic, empty if it is None
+    """
+    if interval is None:
+        return ''
+    low, high = interval
+    return f' ({constants.CONFIDENCE_LEVEL:.0%} CI {low:.5g} to {high:.5g})'
+
+
+def get_bootstrap_result(bootstrap_future):
+    """
+    :param bootstrap_future: a finished future of stat_confidence.submit_history_intervals
+    :return: the bootstrap intervals, or None if they could not be computed
+    """
+    try:
+        return bootstrap_future.result()
+    except Exception as e:
+        print(f'Failed to compute the confidence intervals: {type(e).__name__}: {e}')
+        return None
+
+
+def get_summary_texts(config_stages, summary, bootstrap):
+    """
+    get the texts of the summary statistics of the statistics view
+    :param config_stages: the Chapters dict of the config
+    :param summary: the result of compute_advanced_summary_statistics
+    :param bootstrap: the result of stat_confidence.bootstrap_intervals, or None if not known
+    :return: {element key: text}
+    """
+    (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate) = summary
+    level_misses_intervals = level_nn_rate_intervals = [None] * len(config_stages)
+    total_misses_interval = total_nn_rate_interval = None
+    if bootstrap is not None:
+        (level_misses_intervals, total_misses_interval), (level_nn_rate_intervals, total_nn_rate_interval) = bootstrap
+    texts = {}
+    for stage_idx, stage_id in enumerate(config_stages):
+        texts[('-MISSES-', stage_id)] = f'Average misses: {level_misses_arr[stage_idx]}' \
+                                        f'{format_interval(level_misses_intervals[stage_idx])}'
+        texts[('-NN-', stage_id)] = f'Level NN rate: {level_nn_rate_arr[stage_idx]}' \
+                                    f'{format_interval(level_nn_rate_intervals[stage_idx])}'
+    texts['-TOTAL-MISSES-'] = f'Full game average misses: {total_misses}{format_interval(total_misses_interval)}'
+    texts['-TOTAL-NN-'] = f'NN rate: {total_nn_rate}{format_interval(total_nn_rate_interval)}'
+    return texts
+
+
+def show_session_stat_menu(init_info, database, session_id):
     """
     show the game statistics
     :param init_info: the ui initialization info
     :param database: the database to store the data
-    :param session_idx: the session to show statistics
+    :param session_id: the session to show statistics
     """
-    # show the capture rate using pyplot
+    # show the capture rate as a bar chart, drawn natively or with matplotlib depending on the config
     # each spell's capture rate is displayed as sum of individual segments divided by Total
+    EXPORT_STR = 'Export Charts'
 
+    build_start = time.perf_counter()
     layout = []
-    stat_layouts = create_session_text_statistics_layout(database, session_idx)
+    stat_layouts = create_session_text_statistics_layout(database, session_id)
 
+    import stat_confidence  # numpy is only loaded once a statistics view is opened
     config_stages = database.get_config_stage_dict()
-    stages_cap_rates = {}
-    # add the stage name to the layout
+    reach_model = database.get_reach_model()
+    # add the confidence interval of the total rate, the reach probability and the stage name to the layout
     for stage_id in config_stages:
         chapters_list = config_stages[stage_id]
         stage_layout = stat_layouts[stage_id]
+        total_cap, total_attempt, total_rate = database.get_total_cap_rates(stage_id)
+        intervals = stat_confidence.wilson_intervals(total_cap, total_attempt)
+        reach_list, capture_list, continue_list = reach_model.get_stage_probabilities(stage_id)
         for i in range(len(stage_layout)):
             row = stage_layout[i]
+            low, high = intervals[i]
+            row.append(sg.Text(f'[{low * 100:.1f}%, {high * 100:.1f}%]'))
+            row.append(sg.Text(f'reached {reach_list[i] * 100:.1f}%'))
             row.append(sg.Text(chapters_list[i]))
-        cap_rates = database.aggregate_cap_rates(stage_id)
-        stages_cap_rates[stage_id] = cap_rates
-    (level_misses_arr, total_misses), (level_nn_rate_arr, total_nn_rate) = \
-        database.compute_advanced_summary_statistics(stages_cap_rates)
-    im_data_dict = {}
+    no_miss_rate, expected_runs, expected_chapters = reach_model.get_no_miss_estimates()
+    summary = database.compute_advanced_summary_statistics()
+    # bootstrap intervals of the same statistics, resampling whole runs of the whole history
+    # they are computed in the background and kept until the data changes, the texts are filled in once ready
+    bootstrap_future = None
+    if stat_confidence.is_available():
+        bootstrap_future = stat_confidence.submit_history_intervals(database)
+    bootstrap = None
+    if bootstrap_future is not None and bootstrap_future.done():
+        bootstrap = get_bootstrap_result(bootstrap_future)
+        bootstrap_future = None
+    summary_texts = get_summary_texts(config_stages, summary, bootstrap)
+    session_rates = {}
     for stage_id in config_stages:
-        stage_idx = database.get_stage_idx_from_id(stage_id)
-        chapters_list = config_stages[stage_id]
-        (sessions_cap, sessions_attempt, sessions_rate), (total_cap, total_attempt, total_rate) = stages_cap_rates[stage_id]
-        im_data = stat_plot.plt_im_bytes_session_capture_rates(chapters_list, sessions_rate[session_idx])
-        width, height = im_data[1], im_data[2]
-        im_data_dict[stage_id] = im_data
+        session_cap, session_attempt, session_rate = database.get_session_cap_rates(stage_id, session_id)
+        session_rates[stage_id] = session_rate
+
+    renderer = database.config.get(constants.CONFIG_CHART_RENDERER, constants.CHART_RENDERER_NATIVE)
+    im_data_dict = {}
+    if renderer == constants.CHART_RENDERER_MATPLOTLIB:
+        # render every stage's chart at once; unchanged sessions come from the image cache
+        session_version = database.get_session_version(session_id)
+        render_jobs = {}
+        for stage_id in config_stages:
+            render_jobs[(stage_id, session_id, session_version)] = (config_stages[stage_id], session_rates[stage_id])
+        import stat_plot  # matplotlib is only loaded when it draws the charts
+        rendered = stat_plot.render_session_capture_rates(render_jobs)
+        im_data_dict = {stage_id: rendered[(stage_id, session_id, session_version)] for stage_id in config_stages}
 
-        stat_layout = [[sg.Text(f'Average misses: {level_misses_arr[stage_idx]}')],
-                       [sg.Text(f'Level NN rate: {level_nn_rate_arr[stage_idx]}')]] + \
+    for stage_id in config_stages:
+        stat_layout = [[sg.Text(summary_texts[('-MISSES-', stage_id)], key=('-MISSES-', stage_id))],
+                       [sg.Text(summary_texts[('-NN-', stage_id)], key=('-NN-', stage_id))]] + \
+            create_rolling_statistics_layout(database, stage_id) + \
             stat_layouts[stage_id]
 
-        # reference:https://stackoverflow.com/questions/70474671/pysimplegui-graph-displaying-an-image-directly
-        graph = sg.Graph(
-            canvas_size=(width, height),
-            graph_bottom_left=(0, 0),
-            graph_top_right=(width, height),
-            background_color='white',
-            key=f'-GRAPH-{stage_id}-',
-        )
+        if renderer == constants.CHART_RENDERER_MATPLOTLIB:
+            # reference:https://stackoverflow.com/questions/70474671/pysimplegui-graph-displaying-an-image-directly
+            im_bytes, width, height = im_data_dict[stage_id]
+            graph = sg.Graph(
+                canvas_size=(width, height),
+                graph_bottom_left=(0, 0),
+                graph_top_right=(width, height),
+                background_color='white',
+                key=f'-GRAPH-{stage_id}-',
+            )
+        else:
+            graph = stat_chart.create_graph(f'-GRAPH-{stage_id}-')
         graph_layout = [[graph]]
         horizontal_layout = [[sg.Column(stat_layout), sg.Column(graph_layout)]]
-        layout.append([sg.Tab(stage_id,  horizontal_layout)])
+        layout.append([sg.Tab(stage_id,  horizontal_layout, key=f'-TAB-{stage_id}-')])
 
-    layout = [[sg.TabGroup(layout)],
-              [sg.Text(f'Full game average misses: {total_misses}')],
-              [sg.Text(f'NN rate: {total_nn_rate}')],
-              [sg.Button('Back')]]
+    layout = [[sg.TabGroup(layout, key='-TABS-', enable_events=True)],
+              [sg.Text(summary_texts['-TOTAL-MISSES-'], key='-TOTAL-MISSES-')],
+              [sg.Text(summary_texts['-TOTAL-NN-'], key='-TOTAL-NN-')],
+              [sg.Text(f'Full no-miss chance per run: {no_miss_rate:.5g}, expected runs: {expected_runs:.5g}, '
+                       f'expected chapters played: {expected_chapters:.5g}')],
+              [sg.Button('Back'), sg.Button(EXPORT_STR)]]
 
     window = sg.Window('thstat', layout, finalize=True)
     for stage_id in config_stages:
         graph = window[f'-GRAPH-{stage_id}-']
-        im_bytes, width, height = im_data_dict[stage_id]
-        graph.draw_image(data=im_bytes, location=(0, height))
+        if renderer == constants.CHART_RENDERER_MATPLOTLIB:
+            im_bytes, width, height = im_data_dict[stage_id]
+            graph.draw_image(data=im_bytes, location=(0, height))
+        else:
+            chart = stat_chart.BarChart(graph, len(config_stages[stage_id]))
+            chart.update(session_rates[stage_id])
+    # reopen the tab of the stage last viewed in this config
+    last_tab = init_info.get_config_value(database.config_path, constants.KEY_LAST_TAB)
+    if last_tab in config_stages:
+        window[f'-TAB-{last_tab}-'].select()
+    stat_profile.record('stat_menu.show_session_stat_menu.build', build_start, time.perf_counter())
 
     while True:
-        event, values = window.read()
+        event, values = window.read(timeout=constants.BOOTSTRAP_REFRESH_MS if bootstrap_future is not None else None)
         if event in [sg.WIN_CLOSED, 'Back']:
             break
+        elif event == sg.TIMEOUT_KEY:
+            if bootstrap_future.done():
+                bootstrap = get_bootstrap_result(bootstrap_future)
+                bootstrap_future = None
+                for key, text in get_summary_texts(config_stages, summary, bootstrap).items():
+                    window[key].update(text)
+        elif event == '-TABS-':
+            # the tab key is -TAB-{stage_id}-
+            init_info.set_config_value(database.config_path, constants.KEY_LAST_TAB, values['-TABS-'][len('-TAB-'):-1])
+        elif event == EXPORT_STR:
+            export_session_charts(database, session_id, session_rates)
     window.close()
 
 
-def get_default_success_dict(config_stages):
+def export_session_charts(database, session_id, session_rates):
     """
-    get the default success list for a game session
-    :return: the default success list
+    save the charts of a session as PNG files rendered by matplotlib, one per stage
+    :param database: the database to store the data
+    :param session_id: the id of the session
+    :param session_rates: a dict {stage_id: list of capture rates}
     """
-    success_dict = {}
+    folder = sg.popup_get_folder('Select a folder to save the charts in', title='thstat')
+    if not folder:
+        return
+    try:
+        import stat_plot
+    except ImportError:
+        print('matplotlib is not installed, the charts cannot be exported.')
+        return
+    config_stages = database.get_config_stage_dict()
+    date_str = database.get_session_date(session_id)
     for stage_id in config_stages:
-        success_dict[stage_id] = [1] * len(config_stages[stage_id])
-    return success_dict
+        path = os.path.join(folder, f'{date_str}_{session_id}_{stage_id}.png')
+        stat_plot.save_session_capture_rates(path, config_stages[stage_id], session_rates[stage_id])
+    print(f'Charts saved to {folder}')
 
 
-def gameplay_session_creation_menu(init_info, database, session_idx):
+def attribute_stat_menu(init_info, database):
     """
-    the menu for a game session
+    show the capture rates of every chapter grouped by the value of a dropdown attribute
+    e.g. the capture rate per chapter for each keyboard
     :param init_info: the ui initialization info
     :param database: the database to store the data
-    :param session_idx: the index of the session
     """
-    POP_RESULT_STR = 'Pop Last Result'
+    attribute_names = database.get_all_dropdown_attribute_name()
+    if len(attribute_names) == 0:
+        print('No dropdown attribute found in the config.')
+        return
+    attribute_name = attribute_names[0]
     config_stages = database.get_config_stage_dict()
-    config_stages_list = list(config_stages.keys())
-    default_tab_key = f'-{config_stages_list[0]}-'
-
-    CHAPTER_NAME_SIZE = (22, 1)
 
     continue_flag = True
-    success_dict = get_default_success_dict(config_stages)
-    quit_location = (len(success_dict), 0)  # initially assume the player does not quit
     while continue_flag:
-        stat_layouts = create_session_text_statistics_layout(database, session_idx)
+        summaries = database.compute_summary_statistics_by_attribute(attribute_name)
+        values_list = list(summaries.keys())
 
-        # create tab group
         tab_group_layout = []
         for stage_id in config_stages:
-            # button list for pass/fail
+            stage_idx = database.get_stage_idx_from_id(stage_id)
             chapters_list = config_stages[stage_id]
-            success_list = success_dict[stage_id]
-            pass_fail_layout = []
-            for i in range(len(chapters_list)):
-                chapter_text = f'Chapter {i + 1}: {chapters_list[i]}'
-                button_key = f'-{stage_id}-{i}-'
-
-                stage_idx = database.get_stage_idx_from_id(stage_id)
-                if stage_idx > quit_location[0] or (stage_idx == quit_location[0] and i >= quit_location[1]):
-                    display_text = sg.Text('ESC', text_color='green', size=(6, 1))
-                    pass_fail_layout.append([sg.Button('Re-add', key=button_key, size=(6, 1)),
-                                             sg.Text(chapter_text, size=CHAPTER_NAME_SIZE, text_color='white'),
-                                             display_text])
-                else:
-                    # display the pass/fail button
-                    if success_list[i] == 1:
-                        display_text = sg.Text('Passed', text_color='green', size=(6, 1))
-                    else:
-                        display_text = sg.Text('Failed!', text_color='red', size=(6, 1))
-                    pass_fail_layout.append([sg.Button('Change', key=button_key, size=(6, 1)),
-                                             sg.Text(chapter_text, size=CHAPTER_NAME_SIZE),
-                                             display_text])
-
-            # display the session statistics as well
-            stat_layout = stat_layouts[stage_id]
-
-            # merge pass_fail_layout and stat_layout
-            new_layout = []
-            for i in range(len(pass_fail_layout)):
-                new_layout.append(pass_fail_layout[i] + stat_layout[i])
-
-            tab_key = f'-{stage_id}-'
-            row = [sg.Tab(stage_id, new_layout, key=tab_key)]
-            tab_group_layout.append(row)
-
-        # display the current results in this session
-        results = database.data[constants.DATA_DATA][session_idx][constants.DATA_RESULT]
-        result_display_strs = [str(result) for result in results]
-        listbox = sg.Listbox(values=result_display_strs, size=(40, 20), key='-RESULT-', enable_events=False)
-        result_layout = [[sg.Text('Current Results')],
-                         [listbox]]
-        if len(results) != 0:
-            result_layout.append([sg.Button(POP_RESULT_STR)])
-
-        tab_group = sg.TabGroup(tab_group_layout, enable_events=True, key='-TABGROUP-')
-        layout = [[sg.Column(result_layout),
-                   sg.Column([[tab_group],
-                              [sg.Button('Submit'), sg.Button('Finish')]])]]
-
-        window = sg.Window('thstat', layout, finalize=True)
-        window[f'{default_tab_key}'].select()
+            grouped_rates = database.aggregate_cap_rates_by_attribute(stage_id, attribute_name)
+            stage_layout = [[sg.Text('', size=(16, 1))] + [sg.Text(value, size=(20, 1)) for value in values_list]]
+            for i, chapter in enumerate(chapters_list):
+                row = [sg.Text(chapter, size=(16, 1))]
+                for value in values_list:
+                    group_cap, group_attempt, group_rate = grouped_rates[value]
+                    row.append(sg.Text(f'({group_rate[i] * 100:.2f}%) {group_cap[i]}/{group_attempt[i]}', size=(20, 1)))
+                stage_layout.append(row)
+            stage_layout.append([sg.Text('Average misses', size=(16, 1))] +
+                                [sg.Text(f'{summaries[value][0][0][stage_idx]:.3f}', size=(20, 1))
+                                 for value in values_list])
+            stage_layout.append([sg.Text('Level NN rate', size=(16, 1))] +
+                                [sg.Text(f'{summaries[value][1][0][stage_idx]:.5f}', size=(20, 1))
+                                 for value in values_list])
+            tab_group_layout.append([sg.Tab(stage_id, stage_layout)])
+
+        layout = [[sg.Text('Group by'),
+                   sg.DropDown(attribute_names, default_value=attribute_name, key='-ATTRIBUTE-',
+                               enable_events=True, readonly=True)],
+                  [sg.TabGroup(tab_group_layout)],
+                  [sg.Text('Full game average misses', size=(20, 1))] +
+                  [sg.Text(f'{value}: {summaries[value][0][1]:.3f}') for value in values_list],
+                  [sg.Text('Full game NN rate', size=(20, 1))] +
+                  [sg.Text(f'{value}: {summaries[value][1][1]:.5f}') for value in values_list],
+                  [sg.Button('Back')]]
 
+        window = sg.Window('thstat', layout)
         while True:
             event, values = window.read()
-            if event in [sg.WIN_CLOSED, 'Finish']:  # if user closes window or clicks cancel
+            if event in [sg.WIN_CLOSED, 'Back']:
                 continue_flag = False
                 break
-            elif event == 'Submit':
-                break
-            elif event == '-TABGROUP-':
-                default_tab_key = values['-TABGROUP-']
+            elif event == '-ATTRIBUTE-':
+                attribute_name = values['-ATTRIBUTE-']
+                break  # refresh the window
+        window.close()
+
+
+def get_chapter_display(stage_idx, chapter_idx, success, quit_location):
+    """
+    get how a chapter is displayed in the gameplay session menu
+    :param stage_idx: the index of the stage
+    :param chapter_idx: the index of the chapter in the stage
+    :param success: 1 if the chapter is marked as passed, 0 if failed
+    :param quit_location: (stage_idx, chapter_idx) of the first chapter the player did not play
+    :return: (button text, whether the chapter was not played, status text, status color)
+    """
+    if stage_idx > quit_location[0] or (stage_idx == quit_location[0] and chapter_idx >= quit_location[1]):
+        return 'Re-add', True, 'ESC', 'green'
+    elif success == 1:
+        return 'Change', False, 'Passed', 'green'
+    else:
+        return 'Change', False, 'Failed!', 'red'
+
+
+def update_chapter_elements(window, database, success_dict, quit_location, displayed):
+    """
+    update the buttons and texts of the chapters whose display changed in the gameplay session menu
+    :param window: the gameplay session window
+    :param database: the database to store the data
+    :param success_dict: the current outcome of each chapter {stage_id: list of 0/1}
+    :param quit_location: (stage_idx, chapter_idx) of the first chapter the player did not play
+    :param displayed: {(stage_id, chapter_idx): display} of what the window shows, updated in place
+    """
+    config_stages = database.get_config_stage_dict()
+    for stage_id in config_stages:
+        stage_idx = database.get_stage_idx_from_id(stage_id)
+        for i in range(len(config_stages[stage_id])):
+            display = get_chapter_display(stage_idx, i, success_dict[stage_id][i], quit_location)
+            old_display = displayed[(stage_id, i)]
+            if display == old_display:
                 continue
+            button_text, escaped, status_text, status_color = display
+            if button_text != old_display[0]:
+                window[f'-{stage_id}-{i}-'].update(button_text)
+            if escaped != old_display[1]:
+                window[('-NAME-', stage_id, i)].update(text_color='white' if escaped else sg.theme_text_color())
+            window[('-STATUS-', stage_id, i)].update(status_text, text_color=status_color)
+            displayed[(stage_id, i)] = display
+
+
+def update_result_elements(window, database, session_id, result_display_strs, stat_texts, stat_key):
+    """
+    update the result list, the pop button and the statistics rows that changed in the gameplay session menu
+    :param window: the gameplay session window
+    :param database: the database to store the data
+    :param session_id: the id of the session
+    :param result_display_strs: the results of the session as displayed in the list
+    :param stat_texts: the statistics texts the window shows, as returned by get_session_text_statistics, updated in place
+    :param stat_key: the key passed to create_session_text_statistics_layout
+    """
+    window['-RESULT-'].update(values=result_display_strs)
+    window['Pop Last Result'].update(visible=len(result_display_strs) != 0)
+    new_stat_texts = get_session_text_statistics(database, session_id)
+    for stage_id, stage_texts in new_stat_texts.items():
+        for i, text in enumerate(stage_texts):
+            if text != stat_texts[stage_id][i]:
+                window[(stat_key, stage_id, i)].update(text)
+    stat_texts.update(new_stat_texts)
+
+
+def gameplay_session_creation_menu(init_info, database, session_id):
+    """
+    the menu for a game session
+    the window stays open for the whole session, every click only updates the elements it changes
+    :param init_info: the ui initialization info
+    :param database: the database to store the data
+    :param session_id: the id of the session
+    :return: whether the session was committed, it then has to be committed again if it is removed
+    """
+    POP_RESULT_STR = 'Pop Last Result'
+    STAT_KEY = '-STAT-'
+    LIVE_KEY = '-LIVE-'
+    LIVE_STATUS_KEY = '-LIVE-STATUS-'
+    build_start = time.perf_counter()
+    config_stages = database.get_config_stage_dict()
+
+    CHAPTER_NAME_SIZE = (22, 1)
+
+    success_dict = stat_database.get_default_success_dict(config_stages)
+    quit_location = (len(success_dict), 0)  # initially assume the player does not quit
+    stat_layouts = create_session_text_statistics_layout(database, session_id, key=STAT_KEY)
+    stat_texts = get_session_text_statistics(database, session_id)
+
+    # create tab group
+    # displayed[(stage_id, i)] is what chapter i currently shows, so a click only touches the chapters it changes
+    displayed = {}
+    tab_group_layout = []
+    for stage_id in config_stages:
+        # button list for pass/fail
+        chapters_list = config_stages[stage_id]
+        stage_idx = database.get_stage_idx_from_id(stage_id)
+        pass_fail_layout = []
+        for i in range(len(chapters_list)):
+            chapter_text = f'Chapter {i + 1}: {chapters_list[i]}'
+            button_key = f'-{stage_id}-{i}-'
+            display = get_chapter_display(stage_idx, i, success_dict[stage_id][i], quit_location)
+            button_text, escaped, status_text, status_color = display
+            displayed[(stage_id, i)] = display
+            pass_fail_layout.append([sg.Button(button_text, key=button_key, size=(6, 1)),
+                                     sg.Text(chapter_text, size=CHAPTER_NAME_SIZE, key=('-NAME-', stage_id, i),
+                                             text_color='white' if escaped else sg.theme_text_color()),
+                                     sg.Text(status_text, text_color=status_color, size=(6, 1),
+                                             key=('-STATUS-', stage_id, i))])
+
+        # display the session statistics as well
+        stat_layout = stat_layouts[stage_id]
+
+        # merge pass_fail_layout and stat_layout
+        new_layout = []
+        for i in range(len(pass_fail_layout)):
+            new_layout.append(pass_fail_layout[i] + stat_layout[i])
+
+        tab_key = f'-{stage_id}-'
+        row = [sg.Tab(stage_id, new_layout, key=tab_key)]
+        tab_group_layout.append(row)
+
+    # display the current results in this session
+    result_display_strs = [str(result) for result in database.get_session_results(session_id)]
+    listbox = sg.Listbox(values=result_display_strs, size=(40, 20), key='-RESULT-', enable_events=False)
+    result_layout = [[sg.Text('Current Results')],
+                     [listbox],
+                     [sg.pin(sg.Button(POP_RESULT_STR, visible=len(result_display_strs) != 0))]]
+
+    # with a LiveFeed in the config, runs reported by a helper tool are recorded without clicking
+    live_config = database.config.get(constants.CONFIG_LIVE_FEED)
+    live_status = f'Live feed: {live_config.get("Path")}' if live_config is not None else ''
+
+    tab_group = sg.TabGroup(tab_group_layout, enable_events=True, key='-TABGROUP-')
+    layout = [[sg.Column(result_layout),
+               sg.Column([[tab_group],
+                          [sg.Button('Submit'), sg.Button('Finish')],
+                          [sg.pin(sg.Text(live_status, key=LIVE_STATUS_KEY, visible=live_config is not None))]])]]
+
+    window = sg.Window('thstat', layout, finalize=True)
+    stat_profile.record('stat_menu.gameplay_session_creation_menu.build', build_start, time.perf_counter())
+    committed = False
+
+    live_feed = None
+    if live_config is not None:
+        import stat_live  # asyncio is only loaded by configs that read a live feed
+        try:
+            # the feed thread only posts events, the window applies them between clicks
+            live_feed = stat_live.LiveFeed(config_stages, live_config.get('Source', constants.LIVE_SOURCE_TAIL),
+                                           live_config.get('Path'), lambda value: window.write_event_value(LIVE_KEY, value))
+            live_feed.start()
+        except ValueError as e:
+            print(f'The live feed is not read: {e}')
+            window[LIVE_STATUS_KEY].update(f'Live feed off: {e}')
+
+    while True:
+        event, values = window.read()
+        if event in [sg.WIN_CLOSED, 'Finish']:  # if user closes window or clicks cancel
+            break
+        # time from an event to the window showing its outcome
+        with stat_profile.timer('stat_menu.gameplay_session_creation_menu.refresh'):
+            live_value = values[LIVE_KEY] if event == LIVE_KEY else None
+            if event == 'Submit' or (live_value is not None and live_value[0] == stat_live.FEED_RUN):
+                if event == 'Submit':
+                    # handle the case where the player quits in the middle of a game
+                    truncated_dict = stat_database.truncate_result(config_stages, success_dict, quit_location)
+                else:
+                    truncated_dict = live_value[1]  # already cut where the player quit
+
+                database.add_game_result(session_id, truncated_dict)
+                database.commit()
+                committed = True
+                result_display_strs.append(str(truncated_dict))
+                success_dict = stat_database.get_default_success_dict(config_stages)  # don't assume the player still have the same outcome
+                quit_location = (len(success_dict), 0)  # reset the quit location
+                update_chapter_elements(window, database, success_dict, quit_location, displayed)
+                update_result_elements(window, database, session_id, result_display_strs, stat_texts, STAT_KEY)
+            elif live_value is not None and live_value[0] == stat_live.FEED_PROGRESS:
+                # show the run the helper tool is reporting
+                success_dict, quit_location = live_value[1], live_value[2]
+                update_chapter_elements(window, database, success_dict, quit_location, displayed)
+            elif live_value is not None:  # stat_live.FEED_ERROR
+                print(live_value[1])
+                window[LIVE_STATUS_KEY].update(live_value[1])
+            elif event == POP_RESULT_STR:
+                database.pop_game_result(session_id)
+                database.commit()
+                result_display_strs.pop()
+                update_result_elements(window, database, session_id, result_display_strs, stat_texts, STAT_KEY)
+            elif event == '-TABGROUP-':
+                pass
             elif event.startswith('-') and event.endswith('-'):
                 substrs = event.split('-')
                 stage_id, chapter_idx = substrs[1:3]
@@ -261,29 +579,87 @@ def gameplay_session_creation_menu(init_info, database, session_idx):
                 else:  # success_dict[stage_id][chapter_idx] == 0
                     quit_location = (stage_idx, chapter_idx)
                     success_dict[stage_id][chapter_idx] = 1
-                break  # refresh the window
-            elif event == POP_RESULT_STR:
-                break
-        window.close()
+                update_chapter_elements(window, database, success_dict, quit_location, displayed)
+    if live_feed is not None:
+        live_feed.stop(wait=False)
+        while live_feed.is_alive() and event != sg.WIN_CLOSED:
+            window.read(timeout=10)  # lets an event the feed thread is posting through
+    window.close()
+    database.flush()  # make sure the session is on disk once the player is done
+    return committed
 
-        if event == 'Submit':
-            truncated_dict = {}  # handle the case where the player quits in the middle of a game
-            for stage_id in success_dict:
-                stage_idx = database.get_stage_idx_from_id(stage_id)
-                if stage_idx > quit_location[0]:
-                    truncated_dict[stage_id] = []
-                elif stage_idx == quit_location[0]:
-                    truncated_dict[stage_id] = success_dict[stage_id][:quit_location[1]]
-                else:
-                    truncated_dict[stage_id] = success_dict[stage_id].copy()
 
-            database.add_game_result(session_idx, truncated_dict)
-            database.commit()
-            success_dict = get_default_success_dict(config_stages)  # don't assume the player still have the same outcome
-            quit_location = (len(success_dict), 0)  # reset the quit location
-        elif event == POP_RESULT_STR:
-            database.pop_game_result(session_idx)
-            database.commit()
+def get_workspace_rows(workspace):
+    """
+    :param workspace: the Workspace
+    :return: one dashboard table row per config: name, status, sessions, full-game average misses and NN rate
+    """
+    rows = []
+    for config_path in workspace.config_paths:
+        summary = workspace.summaries.get(config_path)
+        if summary is None or 'Error' in summary:
+            name = os.path.basename(config_path)
+            rows.append([name, workspace.get_status(config_path), '', '', ''])
+        else:
+            rows.append([summary['Name'], workspace.get_status(config_path), summary['Sessions'],
+                         f'{summary["AverageMisses"]:.3f}', f'{summary["NNRate"]:.5f}'])
+    return rows
+
+
+def workspace_menu(init_info, workspace):
+    """
+    the dashboard of a workspace: the full-game statistics of every config at once
+    configs load in the background, the table fills in as they finish
+    :param init_info: the ui initialization info
+    :param workspace: the Workspace
+    """
+    ADD_STR = 'Add Config'
+    REMOVE_STR = 'Remove Config'
+    OPEN_STR = 'Open'
+
+    workspace.load_all()
+    layout = [[sg.Text('Workspace')],
+              [sg.Table(values=get_workspace_rows(workspace),
+                        headings=['Config', 'Status', 'Sessions', 'Average misses', 'NN rate'],
+                        auto_size_columns=False, col_widths=[24, 9, 9, 14, 10], num_rows=12,
+                        select_mode=sg.TABLE_SELECT_MODE_BROWSE, key='-TABLE-')],
+              [sg.Button(OPEN_STR), sg.Button(ADD_STR), sg.Button(REMOVE_STR), sg.Button('Back')]]
+
+    window = sg.Window('thstat', layout, finalize=True)
+    while True:
+        event, values = window.read(timeout=constants.WORKSPACE_REFRESH_MS)
+        if event in [sg.WIN_CLOSED, 'Back']:
+            break
+        if event == sg.TIMEOUT_KEY:
+            if workspace.poll():
+                window['-TABLE-'].update(values=get_workspace_rows(workspace))
+            continue
+
+        selected_path = None
+        if len(values['-TABLE-']) != 0:
+            selected_path = workspace.config_paths[values['-TABLE-'][0]]
+        if event == ADD_STR:
+            config_path = sg.popup_get_file('Select a config file', title='thstat')
+            if config_path:
+                workspace.add_config(config_path)
+                init_info.set(constants.KEY_WORKSPACE_CONFIG_PATHS, list(workspace.config_paths))
+        elif selected_path is None:
+            print('No config selected. Please select a config.')
+        elif event == REMOVE_STR:
+            workspace.remove_config(selected_path)
+            init_info.set(constants.KEY_WORKSPACE_CONFIG_PATHS, list(workspace.config_paths))
+        elif event == OPEN_STR:
+            database = workspace.get_database(selected_path)
+            if database is None:
+                print(f'{selected_path} could not be loaded: {workspace.summaries[selected_path]["Error"]}')
+            else:
+                window.hide()
+                main_menu(init_info, database)
+                database.flush()
+                workspace.refresh_summary(selected_path)
+                window.un_hide()
+        window['-TABLE-'].update(values=get_workspace_rows(workspace))
+    window.close()
 
 
 def main_menu(init_info, database):
@@ -294,6 +670,7 @@ def main_menu(init_info, database):
         date_str = time.strftime("%Y-%m-%d", time.localtime())
         CREATE_STR = 'Create a new game session'
         STAT_STR = 'See game statistics'
+        ATTRIBUTE_STAT_STR = 'See statistics by attribute'
         layout = [[sg.Text(f'Current date is {date_str}')]]
 
         legal_values_dict = {}
@@ -312,7 +689,7 @@ def main_menu(init_info, database):
 
         layout.append([[sg.Button(CREATE_STR)],
                        [sg.Text('OR')],
-                       [sg.Button(STAT_STR)]])
+                       [sg.Button(STAT_STR), sg.Button(ATTRIBUTE_STAT_STR)]])
 
         window = sg.Window('thstat', layout)
         while True:
@@ -320,7 +697,7 @@ def main_menu(init_info, database):
             if event in [sg.WIN_CLOSED, 'Cancel']:  # if user closes window or clicks cancel
                 continue_flag = False
                 break
-            if event in [CREATE_STR, STAT_STR]:
+            if event in [CREATE_STR, STAT_STR, ATTRIBUTE_STAT_STR]:
                 attributes = {}
                 for key in database.get_all_dropdown_attribute_name():
                     attr = database.config[key]
@@ -332,12 +709,15 @@ def main_menu(init_info, database):
         window.close()
 
         if event == CREATE_STR:
-            session_idx = database.add_game_session(date_str)
-            database.commit()
-            gameplay_session_creation_menu(init_info, database, session_idx)
+            # the session is saved along with its first result, an empty session is dropped without a write
+            session_id = database.add_game_session(date_str)
+            committed = gameplay_session_creation_menu(init_info, database, session_id)
             # if the session is empty, pop it
-            if len(database.data[constants.DATA_DATA][session_idx][constants.DATA_RESULT]) == 0:
-                database.remove_game_session(session_idx)
-                database.commit()
+            if database.get_session_result_count(session_id) == 0:
+                database.remove_game_session(session_id)
+                if committed:  # its results were submitted and popped again, the file still has the session
+                    database.commit()
         elif event == STAT_STR:
             select_session_menu(init_info, database)
+        elif event == ATTRIBUTE_STAT_STR:
+            attribute_stat_menu(init_info, database)
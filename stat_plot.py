@@ -1,24 +1,111 @@
-import matplotlib
-from matplotlib import pyplot as plt
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-import stat_database
+
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import stat_profile
 
 
 # plt.rcParams['font.sans-serif'] = ['SimHei']
 # plt.rcParams['axes.unicode_minus'] = False
 
+CACHE_SIZE = 64
+WORKER_COUNT = min(4, os.cpu_count() or 1)
+
+# rendering never goes through pyplot: every worker thread draws on its own reusable Agg figure
+thread_local = threading.local()
+executor = None
+executor_lock = threading.Lock()
+
+# LRU cache of rendered charts, (stage_id, session, data version) -> (im_bytes, width, height)
+image_cache = OrderedDict()
+image_cache_lock = threading.Lock()
+
+
+def get_thread_figure():
+    """
+    get the figure owned by the calling thread, creating it on first use
+    :return: the figure
+    """
+    if not hasattr(thread_local, 'figure'):
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        thread_local.figure = figure
+    return thread_local.figure
+
+
+def get_executor():
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=WORKER_COUNT, thread_name_prefix='thstat-plot')
+        return executor
 
+
+@stat_profile.timed
 def plt_im_bytes_session_capture_rates(chapters_list, session_rate):
-    plt.bar(range(1, len(chapters_list) + 1), session_rate)
-    plt.xlabel('session')
-    plt.ylabel('NN rate')
-    plt.ylim(0., 1.)
+    figure = get_thread_figure()
+    figure.clear()
+    ax = figure.add_subplot()
+    ax.bar(range(1, len(chapters_list) + 1), session_rate)
+    ax.set_xlabel('session')
+    ax.set_ylabel('NN rate')
+    ax.set_ylim(0., 1.)
     with BytesIO() as output:
-        plt.savefig(output, format='PNG')
+        figure.savefig(output, format='PNG')
         im_bytes = output.getvalue()
-    fig = plt.gcf()
-    width, height = fig.get_size_inches() * fig.get_dpi()
-    plt.cla()
+    width, height = figure.get_size_inches() * figure.get_dpi()
     return im_bytes, width, height
 
 
+def save_session_capture_rates(path, chapters_list, session_rate):
+    """
+    save a capture rate chart as a PNG file
+    :param path: the path of the image file
+    """
+    im_bytes, width, height = plt_im_bytes_session_capture_rates(chapters_list, session_rate)
+    with open(path, mode='wb') as f:
+        f.write(im_bytes)
+
+
+def get_cached_image(cache_key):
+    with image_cache_lock:
+        if cache_key in image_cache:
+            image_cache.move_to_end(cache_key)
+            return image_cache[cache_key]
+    return None
+
+
+def put_cached_image(cache_key, im_data):
+    with image_cache_lock:
+        image_cache[cache_key] = im_data
+        image_cache.move_to_end(cache_key)
+        while len(image_cache) > CACHE_SIZE:
+            image_cache.popitem(last=False)
+
+
+@stat_profile.timed
+def render_session_capture_rates(jobs):
+    """
+    render the capture rate charts of several stages, reusing cached images and rendering the rest concurrently
+    :param jobs: a dict {cache_key: (chapters_list, session_rate)}, cache_key being (stage_id, session, data version)
+    :return: a dict {cache_key: (im_bytes, width, height)}
+    """
+    results = {}
+    futures = {}
+    for cache_key, (chapters_list, session_rate) in jobs.items():
+        im_data = get_cached_image(cache_key)
+        if im_data is not None:
+            results[cache_key] = im_data
+        else:
+            futures[cache_key] = get_executor().submit(plt_im_bytes_session_capture_rates,
+                                                       chapters_list, session_rate)
+    for cache_key, future in futures.items():
+        im_data = future.result()
+        put_cached_image(cache_key, im_data)
+        results[cache_key] = im_data
+    return results
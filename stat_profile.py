@@ -0,0 +1,146 @@
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import contextlib
+import functools
+
+import constants
+
+
+# opt-in timing instrumentation, enabled by the THSTAT_PROFILE environment variable
+#   THSTAT_PROFILE=1                    print a summary on exit and write it to thstat_profile.json
+#   THSTAT_PROFILE=path/to/file.json    write the summary to that file instead
+# any other value (true, yes, on...) enables profiling with the default file; a value only names the file when it
+# contains a path separator or ends in .json
+# every timed call is also kept as an event of a trace in the Chrome trace format (chrome://tracing, Perfetto),
+# written next to the summary as <file>.trace.json
+# when the variable is not set, timed returns the function itself and timer returns a shared no-op context,
+# so the instrumentation costs nothing
+PROFILE_SETTING = os.environ.get(constants.ENV_PROFILE, '')
+ENABLED = PROFILE_SETTING not in ['', '0']
+DEFAULT_SUMMARY_PATH = 'thstat_profile.json'
+
+stats = {}  # name -> [count, total seconds, min seconds, max seconds]
+trace_events = []
+stats_lock = threading.Lock()
+null_timer = contextlib.nullcontext()
+start_time = time.perf_counter()
+
+
+def record(name, start, end):
+    """
+    record one timed call, does nothing when profiling is disabled
+    :param name: the name of the operation
+    :param start: time.perf_counter() at the start of the call
+    :param end: time.perf_counter() at the end of the call
+    """
+    if not ENABLED:
+        return
+    seconds = end - start
+    with stats_lock:
+        stat = stats.get(name)
+        if stat is None:
+            stats[name] = [1, seconds, seconds, seconds]
+        else:
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = min(stat[2], seconds)
+            stat[3] = max(stat[3], seconds)
+        if len(trace_events) < constants.PROFILE_MAX_TRACE_EVENTS:
+            trace_events.append({'name': name, 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                                 'ts': (start - start_time) * 1e6, 'dur': seconds * 1e6})
+
+
+@contextlib.contextmanager
+def active_timer(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, start, time.perf_counter())
+
+
+def timer(name):
+    """
+    time a block of code
+        with stat_profile.timer('ui.refresh'):
+            ...
+    :param name: the name of the operation
+    :return: a context manager
+    """
+    if not ENABLED:
+        return null_timer
+    return active_timer(name)
+
+
+def timed(function):
+    """
+    decorator that times every call of a function, named module.qualname
+    """
+    if not ENABLED:
+        return function
+    name = f'{function.__module__}.{function.__qualname__}'
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            record(name, start, time.perf_counter())
+    return wrapper
+
+
+def get_summary():
+    """
+    :return: a list of {'name', 'count', 'total', 'mean', 'min', 'max'} in seconds, the most expensive first
+    """
+    with stats_lock:
+        items = [(name, list(stat)) for name, stat in stats.items()]
+    summary = []
+    for name, (count, total, min_seconds, max_seconds) in items:
+        summary.append({'name': name, 'count': count, 'total': total, 'mean': total / count,
+                        'min': min_seconds, 'max': max_seconds})
+    summary.sort(key=lambda entry: entry['total'], reverse=True)
+    return summary
+
+
+def get_summary_path(setting):
+    """
+    :param setting: the value of the THSTAT_PROFILE environment variable
+    :return: the file to write the summary to, the setting itself only if it is a path to a file
+    """
+    separators = [os.sep] + ([os.altsep] if os.altsep else [])
+    if any(separator in setting for separator in separators) or setting.endswith('.json'):
+        return setting
+    return DEFAULT_SUMMARY_PATH
+
+
+def dump():
+    """
+    print the summary and write the summary and trace files
+    """
+    summary = get_summary()
+    if len(summary) == 0:
+        return
+    summary_path = get_summary_path(PROFILE_SETTING)
+    with open(summary_path, mode='w', encoding='UTF-8') as f:
+        json.dump(summary, f, indent=4)
+    with stats_lock:
+        events = list(trace_events)
+    with open(f'{os.path.splitext(summary_path)[0]}.trace.json', mode='w', encoding='UTF-8') as f:
+        json.dump({'traceEvents': events}, f)
+
+    name_width = max(len(entry['name']) for entry in summary)
+    print(f'{"operation":<{name_width}} {"count":>8} {"total ms":>12} {"mean ms":>10} {"max ms":>10}', file=sys.stderr)
+    for entry in summary:
+        print(f'{entry["name"]:<{name_width}} {entry["count"]:>8} {entry["total"] * 1000:>12.2f} '
+              f'{entry["mean"] * 1000:>10.3f} {entry["max"] * 1000:>10.3f}', file=sys.stderr)
+    print(f'profile written to {summary_path}', file=sys.stderr)
+
+
+if ENABLED:
+    atexit.register(dump)
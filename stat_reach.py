@@ -0,0 +1,130 @@
+import math
+
+
+class ReachModel:
+    """
+    A chapter-transition model of the runs, accounting for runs truncated where the player quit.
+    The chapters of every stage are laid end to end, and for each chapter the model counts the runs that
+    reached it, the runs that captured it, and the runs that captured it and went on to the next chapter.
+    From these it estimates P(reach chapter), P(capture | reached) and P(continue | captured), and so the
+    chance that a run is a full no-miss and the expected runs it takes to get one.
+    A count row is a flat list: the run count, then the reach, capture and continue counts of every chapter.
+    Every session keeps its own row, so adding, popping or removing results is O(chapters).
+    """
+    def __init__(self, config_stages):
+        self.stage_slices = {}  # stage_id -> (start, end) of its chapters among all chapters
+        width = 0
+        for stage_id, chapters_list in config_stages.items():
+            self.stage_slices[stage_id] = (width, width + len(chapters_list))
+            width += len(chapters_list)
+        self.width = width
+        self.total_row = [0] * (1 + 3 * width)
+        self.session_rows = {}  # session_rows[session_id] = count row of the session
+
+    def encode_result(self, result):
+        """
+        :param result: a dict {stage_id: list of 0 (fail) or 1 (capture)}, truncated where the player quit
+        :return: a count row of a single result
+        """
+        row = [0] * (1 + 3 * self.width)
+        row[0] = 1
+        reach_offset, capture_offset, continue_offset = 1, 1 + self.width, 1 + 2 * self.width
+        previous_captured = False  # whether the previously reached chapter, in any stage, was captured
+        for stage_id, (start, end) in self.stage_slices.items():
+            success_list = result[stage_id]
+            for j, success in enumerate(success_list):
+                row[reach_offset + start + j] = 1
+                row[capture_offset + start + j] = success
+                if previous_captured:
+                    row[continue_offset + start + j - 1] = 1
+                previous_captured = success == 1
+            if len(success_list) < end - start:
+                break  # the run ended inside this stage
+        return row
+
+    def update(self, session_id, row, sign):
+        for target in (self.session_rows[session_id], self.total_row):
+            for i in range(len(row)):
+                target[i] += sign * row[i]
+
+    def add_session(self, session_id):
+        """
+        add an empty session
+        :param session_id: the id of the session
+        """
+        self.session_rows[session_id] = [0] * (1 + 3 * self.width)
+
+    def remove_session(self, session_id):
+        """
+        remove a session and all of its results
+        :param session_id: the id of the session
+        """
+        row = self.session_rows.pop(session_id)
+        for i in range(len(row)):
+            self.total_row[i] -= row[i]
+
+    def add_result(self, session_id, result):
+        """
+        add a result to a session
+        :param session_id: the id of the session
+        :param result: a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        self.update(session_id, self.encode_result(result), 1)
+
+    def pop_result(self, session_id, result):
+        """
+        remove a result from a session
+        :param session_id: the id of the session
+        :param result: the removed result
+        """
+        self.update(session_id, self.encode_result(result), -1)
+
+    def get_row(self, session_id=None):
+        return self.total_row if session_id is None else self.session_rows[session_id]
+
+    def get_chapter_probabilities(self, session_id=None):
+        """
+        estimate the transition probabilities of every chapter
+        :param session_id: only the runs of this session, or None for every run
+        :return: (reach, capture, continue) lists over all chapters: P(reach chapter), P(capture | reached)
+        and P(reach the next chapter | captured), the last being 1 for the final chapter;
+        probabilities without any observation are 0
+        """
+        row = self.get_row(session_id)
+        run_count = row[0]
+        reach_counts = row[1:1 + self.width]
+        capture_counts = row[1 + self.width:1 + 2 * self.width]
+        continue_counts = row[1 + 2 * self.width:]
+        reach = [count / run_count if run_count > 0 else 0. for count in reach_counts]
+        capture = [capture_counts[k] / reach_counts[k] if reach_counts[k] > 0 else 0. for k in range(self.width)]
+        proceed = [continue_counts[k] / capture_counts[k] if capture_counts[k] > 0 else 0.
+                   for k in range(self.width)]
+        if self.width > 0:
+            proceed[-1] = 1.
+        return reach, capture, proceed
+
+    def get_stage_probabilities(self, stage_id, session_id=None):
+        """
+        :param stage_id: the stage id
+        :param session_id: only the runs of this session, or None for every run
+        :return: (reach, capture, continue) lists over the chapters of the stage, see get_chapter_probabilities
+        """
+        start, end = self.stage_slices[stage_id]
+        return tuple(probabilities[start:end] for probabilities in self.get_chapter_probabilities(session_id))
+
+    def get_no_miss_estimates(self, session_id=None):
+        """
+        estimate how hard a full no-miss run is
+        :param session_id: only the runs of this session, or None for every run
+        :return: (no-miss probability of a run, expected runs until a no-miss, expected chapters played until
+        a no-miss); the expectations are inf when no run could be a no-miss
+        """
+        reach, capture, proceed = self.get_chapter_probabilities(session_id)
+        no_miss_rate = reach[0] if self.width > 0 else 0.
+        for k in range(self.width):
+            no_miss_rate *= capture[k] * proceed[k]
+        if no_miss_rate == 0.:
+            return 0., math.inf, math.inf
+        # every run is an independent attempt, so the runs until a no-miss are geometric (Wald's identity
+        # gives the chapters played)
+        return no_miss_rate, 1. / no_miss_rate, sum(reach) / no_miss_rate
@@ -0,0 +1,208 @@
+import bisect
+
+
+class RollingWindowIndex:
+    """
+    Counts of captures and attempts over every run, with the runs ordered by session date.
+    Each session keeps its runs as one block of run states, one byte per chapter of every stage:
+    0 (not attempted), 1 (failed) or 2 (captured), the layout of build_run_states.
+    On top of the blocks there is a prefix over the session totals, so a window of consecutive runs
+    (the last N runs, a date range) is the difference of two session prefix rows, corrected by counting
+    the states of the runs before each window edge inside its session.
+    A row is a flat list: the captures of every chapter of every stage, followed by the attempts.
+    Editing a session is O(chapters) on its block; the session prefix after it is dropped and extended
+    again on the next query, which is O(sessions).
+    """
+    def __init__(self, config_stages):
+        self.stage_slices = {}  # stage_id -> (start, end) of its chapters in a row
+        width = 0
+        for stage_id, chapters_list in config_stages.items():
+            self.stage_slices[stage_id] = (width, width + len(chapters_list))
+            width += len(chapters_list)
+        self.width = width
+        self.run_count = 0
+
+        # the sessions in timeline order, sorted by date, sessions of the same date in the order they were added
+        self.session_order = []  # session_id
+        self.session_dates = []
+        self.session_starts = []  # index of the first run of the session in the timeline
+        self.session_run_counts = []
+        self.session_blocks = []  # bytearray of run states, runs x width
+        self.session_totals = []  # row of the sums over the runs of the session
+        self.session_prefix = [[0] * (2 * width)]  # session_prefix[p] = sums over the first p sessions, kept lazily
+        self.position_of = {}  # session_id -> position in the timeline
+
+    def get_run_count(self):
+        return self.run_count
+
+    def encode_result(self, result):
+        """
+        :return: the run states of a single result, one byte per chapter
+        """
+        states = bytearray(self.width)
+        for stage_id, (start, end) in self.stage_slices.items():
+            for j, success in enumerate(result[stage_id]):
+                states[start + j] = 1 + success
+        return states
+
+    def count_states(self, block, first_run, end_run, start, end):
+        """
+        count the captures and attempts of the chapters [start, end) over the runs [first_run, end_run) of a block
+        :return: (cap_list, attempt_list)
+        """
+        capture_list = []
+        attempt_list = []
+        for i in range(start, end):
+            column = block[first_run * self.width + i:end_run * self.width:self.width]
+            capture_list.append(column.count(2))
+            attempt_list.append(len(column) - column.count(0))
+        return capture_list, attempt_list
+
+    def invalidate_prefix(self, position):
+        """
+        drop the session prefix rows that include the session at position
+        """
+        del self.session_prefix[position + 1:]
+
+    def get_session_prefix(self, position):
+        """
+        :return: the row of sums over the sessions before position, extending the prefix if needed
+        """
+        prefix = self.session_prefix
+        while len(prefix) <= position:
+            prefix.append([a + b for a, b in zip(prefix[-1], self.session_totals[len(prefix) - 1])])
+        return prefix[position]
+
+    def update_positions(self, first_position):
+        for position in range(first_position, len(self.session_order)):
+            self.position_of[self.session_order[position]] = position
+
+    def add_session(self, session_id, date_str):
+        """
+        add an empty session
+        :param session_id: the id of the session
+        :param date_str: the date of the session
+        """
+        position = bisect.bisect_right(self.session_dates, date_str)
+        if position < len(self.session_order):
+            start = self.session_starts[position]
+        else:
+            start = self.run_count
+        self.session_order.insert(position, session_id)
+        self.session_dates.insert(position, date_str)
+        self.session_starts.insert(position, start)
+        self.session_run_counts.insert(position, 0)
+        self.session_blocks.insert(position, bytearray())
+        self.session_totals.insert(position, [0] * (2 * self.width))
+        self.invalidate_prefix(position)
+        self.update_positions(position)
+
+    def remove_session(self, session_id):
+        """
+        remove a session and its runs
+        :param session_id: the id of the session
+        """
+        position = self.position_of.pop(session_id)
+        run_count = self.session_run_counts[position]
+        for lst in (self.session_order, self.session_dates, self.session_starts, self.session_run_counts,
+                    self.session_blocks, self.session_totals):
+            del lst[position]
+        self.shift_starts(position, -run_count)
+        self.invalidate_prefix(position)
+        self.update_positions(position)
+
+    def add_runs(self, session_id, states):
+        """
+        append runs to a session
+        :param session_id: the id of the session
+        :param states: the run states of the runs, runs x width bytes, e.g. from ColumnarResultStore.run_states
+        """
+        run_count = len(states) // self.width if self.width else 0
+        if run_count == 0:
+            return
+        position = self.position_of[session_id]
+        captures, attempts = self.count_states(states, 0, run_count, 0, self.width)
+        self.session_blocks[position] += states
+        self.session_totals[position] = [a + b for a, b in zip(self.session_totals[position], captures + attempts)]
+        self.session_run_counts[position] += run_count
+        self.shift_starts(position + 1, run_count)
+        self.invalidate_prefix(position)
+
+    def add_result(self, session_id, result):
+        """
+        append a result to a session
+        :param session_id: the id of the session
+        :param result: a dict {stage_id: list of 0 (fail) or 1 (capture)}
+        """
+        self.add_runs(session_id, self.encode_result(result))
+
+    def pop_result(self, session_id):
+        """
+        remove the last result of a session
+        :param session_id: the id of the session
+        """
+        position = self.position_of[session_id]
+        block = self.session_blocks[position]
+        run_count = self.session_run_counts[position]
+        captures, attempts = self.count_states(block, run_count - 1, run_count, 0, self.width)
+        del block[(run_count - 1) * self.width:]
+        self.session_totals[position] = [a - b for a, b in zip(self.session_totals[position], captures + attempts)]
+        self.session_run_counts[position] -= 1
+        self.shift_starts(position + 1, -1)
+        self.invalidate_prefix(position)
+
+    def shift_starts(self, first_position, run_count):
+        """
+        move the first run of the sessions from first_position on by run_count runs
+        """
+        self.run_count += run_count
+        for later_position in range(first_position, len(self.session_starts)):
+            self.session_starts[later_position] += run_count
+
+    def counts_before(self, run, start, end):
+        """
+        count the captures and attempts of the chapters [start, end) over the first run runs of the timeline
+        :return: (cap_list, attempt_list)
+        """
+        position = bisect.bisect_right(self.session_starts, run) - 1
+        if position < 0:
+            return [0] * (end - start), [0] * (end - start)
+        row = self.get_session_prefix(position)
+        capture_list, attempt_list = self.count_states(self.session_blocks[position], 0,
+                                                       run - self.session_starts[position], start, end)
+        capture_list = [a + b for a, b in zip(row[start:end], capture_list)]
+        attempt_list = [a + b for a, b in zip(row[self.width + start:self.width + end], attempt_list)]
+        return capture_list, attempt_list
+
+    def window_counts(self, stage_id, first_run, end_run):
+        """
+        count the captures and attempts of the runs [first_run, end_run) in timeline order
+        :return: (cap_list, attempt_list)
+        """
+        first_run = max(0, min(first_run, self.run_count))
+        end_run = max(first_run, min(end_run, self.run_count))
+        start, end = self.stage_slices[stage_id]
+        first_captures, first_attempts = self.counts_before(first_run, start, end)
+        end_captures, end_attempts = self.counts_before(end_run, start, end)
+        capture_list = [b - a for a, b in zip(first_captures, end_captures)]
+        attempt_list = [b - a for a, b in zip(first_attempts, end_attempts)]
+        return capture_list, attempt_list
+
+    def last_runs_counts(self, stage_id, run_count):
+        """
+        count the captures and attempts of the latest run_count runs
+        """
+        return self.window_counts(stage_id, self.run_count - run_count, self.run_count)
+
+    def date_range_counts(self, stage_id, start_date, end_date):
+        """
+        count the captures and attempts of the sessions dated between start_date and end_date, inclusive
+        dates are compared as 'YYYY-MM-DD' strings
+        """
+        first_position = bisect.bisect_left(self.session_dates, start_date)
+        end_position = bisect.bisect_right(self.session_dates, end_date)
+        if first_position >= end_position:
+            return self.window_counts(stage_id, 0, 0)
+        first_run = self.session_starts[first_position]
+        end_run = self.session_starts[end_position - 1] + self.session_run_counts[end_position - 1]
+        return self.window_counts(stage_id, first_run, end_run)
@@ -0,0 +1,259 @@
+import os
+import re
+import json
+import threading
+import collections
+
+import constants
+import stat_config
+import stat_lazy
+import stat_profile
+
+
+# the layout written by stat_config.serialize_data, reproduced session by session
+SEPARATORS = (',', ':')
+SESSION_INDENT = ' ' * 8
+
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# what the scan keeps of a session that is not decoded: its bytes in the data file, and what the counters need
+StreamedSession = collections.namedtuple('StreamedSession', ['start', 'end', 'date', 'attributes', 'counters'])
+
+
+class JsonStreamReader:
+    """
+    Reads the values of a json text file one at a time, holding only a chunk of the file in memory.
+    Keeps track of the byte offset of every value so it can be read again later.
+    """
+    def __init__(self, f, chunk_size=constants.STREAMING_CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.byte_pos = 0  # byte offset in the file of self.buffer[self.pos]
+        self.eof = False
+
+    def fill(self):
+        """
+        read the next chunk, dropping what was already consumed
+        :return: False at the end of the file
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if chunk == '':
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def advance(self, new_pos):
+        self.byte_pos += len(self.buffer[self.pos:new_pos].encode('UTF-8'))
+        self.pos = new_pos
+
+    def peek(self):
+        """
+        skip whitespace
+        :return: the next character, '' at the end of the file
+        """
+        while True:
+            self.advance(WHITESPACE.match(self.buffer, self.pos).end())
+            if self.pos < len(self.buffer) or not self.fill():
+                break
+        return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'expected {char!r} at byte {self.byte_pos} of the data file')
+        self.advance(self.pos + 1)
+
+    def read_value(self):
+        """
+        decode the next json value
+        :return: (value, start byte, end byte)
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():  # the value goes on in the next chunk
+                    continue
+                raise
+            if end == len(self.buffer) and self.fill():  # a number could still go on
+                continue
+            start = self.byte_pos
+            self.advance(end)
+            return value, start, self.byte_pos
+
+
+class StreamedSessionList(stat_lazy.LazySessionList):
+    """
+    The sessions of a json data file that was scanned instead of loaded.
+    A slot handle is a StreamedSession; the session is read back from the file on first access.
+    """
+    def __init__(self, data_path, handles):
+        self.data_path = data_path
+        # held while a session is read from the file and while the file is replaced, so a reader never uses
+        # the offsets of one file on the other
+        self.file_lock = threading.RLock()
+        super().__init__(handles)
+
+    def load_session(self, handle):
+        with self.file_lock:
+            with open(self.data_path, mode='rb') as f:
+                f.seek(handle.start)
+                session_bytes = f.read(handle.end - handle.start)
+        return json.loads(session_bytes.decode('UTF-8'))
+
+    def count_handle_outcomes(self, handle, config_stages):
+        if list(handle.counters.keys()) != list(config_stages.keys()):
+            return super().count_handle_outcomes(handle, config_stages)
+        return {stage_id: (capture_list.copy(), attempt_list.copy())
+                for stage_id, (capture_list, attempt_list) in handle.counters.items()}
+
+    def get_handle_attributes(self, handle):
+        return handle.attributes
+
+    def get_handle_date(self, handle):
+        return handle.date
+
+    def __getitem__(self, idx):
+        with self.file_lock:
+            return super().__getitem__(idx)
+
+    def peek(self, idx):
+        with self.file_lock:
+            return super().peek(idx)
+
+    def snapshot(self):
+        """
+        copy the structure of the sessions for a save; sessions that are not decoded stay handles
+        :return: a list of session dicts and StreamedSession handles
+        """
+        sessions = []
+        for slot in self.slots:
+            if isinstance(slot, dict):
+                sessions.append({**slot, constants.DATA_RESULT: list(slot[constants.DATA_RESULT])})
+            else:
+                sessions.append(slot)
+        return sessions
+
+    def remap(self, moved):
+        """
+        point the handles at their new place after the data file was rewritten
+        :param moved: a dict {id(old handle): (new start, new end)}
+        """
+        for idx, slot in enumerate(self.slots):
+            if not isinstance(slot, dict) and id(slot) in moved:
+                start, end = moved[id(slot)]
+                self.slots[idx] = slot._replace(start=start, end=end)
+
+
+@stat_profile.timed
+def load_data(data_path, config_stages, materialized_count=constants.STREAMING_MATERIALIZED_SESSIONS):
+    """
+    scan a json data file session by session; only the latest sessions stay decoded
+    the counts of every other session are taken during the scan, so its runs are never all in memory at once
+    :param data_path: the path to the json data file
+    :param config_stages: the Chapters dict of the config
+    :param materialized_count: the number of latest sessions kept decoded
+    :return: the data dict, its sessions in a StreamedSessionList
+    """
+    data = {}
+    slots = []
+    recent = collections.deque()  # (idx, handle) of the decoded sessions that are kept for now
+    with open(data_path, mode='r', encoding='UTF-8', newline='') as f:
+        reader = JsonStreamReader(f)
+        reader.expect('{')
+        while reader.peek() != '}':
+            key = reader.read_value()[0]
+            reader.expect(':')
+            if key != constants.DATA_DATA:
+                data[key] = reader.read_value()[0]
+            else:
+                reader.expect('[')
+                while reader.peek() != ']':
+                    session, start, end = reader.read_value()
+                    handle = StreamedSession(start, end, session['Date'], session['Attributes'],
+                                             stat_lazy.count_session_outcomes(session, config_stages))
+                    recent.append((len(slots), handle))
+                    slots.append(session)
+                    if len(recent) > materialized_count:
+                        idx, old_handle = recent.popleft()
+                        slots[idx] = old_handle
+                    if reader.peek() == ',':
+                        reader.expect(',')
+                reader.expect(']')
+            if reader.peek() == ',':
+                reader.expect(',')
+        reader.expect('}')
+    data[constants.DATA_DATA] = StreamedSessionList(data_path, slots)
+    return data
+
+
+def format_value(value, indent):
+    """
+    :return: the json text of a value nested at the given indentation, as json.dumps of the whole data writes it
+    """
+    text = json.dumps(value, separators=SEPARATORS, indent=4, ensure_ascii=False)
+    return text.replace('\n', '\n' + indent)
+
+
+@stat_profile.timed
+def save_data(config_path, snapshot, session_list):
+    """
+    write a data snapshot without decoding the sessions that are still handles: their bytes are copied
+    from the current data file; the file is replaced atomically and its journal discarded
+    :param config_path: the path to the config file
+    :param snapshot: a data dict whose sessions come from StreamedSessionList.snapshot
+    :param session_list: the StreamedSessionList the handles belong to
+    """
+    data_path = stat_config.get_data_path(config_path)
+    temp_path = f'{data_path}.tmp'
+    moved = {}
+    with open(temp_path, mode='wb') as output, open(data_path, mode='rb') as source:
+        output.write(f'{{\n    {json.dumps(constants.DATA_DATA)}:['.encode('UTF-8'))
+        sessions = snapshot[constants.DATA_DATA]
+        for idx, session in enumerate(sessions):
+            output.write(('\n' + SESSION_INDENT).encode('UTF-8'))
+            start = output.tell()
+            if isinstance(session, dict):
+                output.write(format_value(session, SESSION_INDENT).encode('UTF-8'))
+            else:
+                source.seek(session.start)
+                output.write(source.read(session.end - session.start))
+                moved[id(session)] = (start, output.tell())
+            if idx != len(sessions) - 1:
+                output.write(b',')
+        if len(sessions) != 0:
+            output.write(b'\n    ')
+        output.write(b']')
+        for key, value in snapshot.items():
+            if key != constants.DATA_DATA:
+                output.write(f',\n    {json.dumps(key, ensure_ascii=False)}:{format_value(value, " " * 4)}'
+                             .encode('UTF-8'))
+        output.write(b'\n}')
+        output.flush()
+        os.fsync(output.fileno())
+
+    with session_list.file_lock:
+        os.replace(temp_path, data_path)
+        session_list.remap(moved)
+    stat_config.remove_journal(config_path)
+
+
+def should_stream(config, data_path):
+    """
+    check whether a json data file is scanned instead of loaded whole
+    the Streaming config key decides if present, otherwise large files are streamed
+    :param config: the config dict
+    :param data_path: the path to the json data file
+    :return: True to use load_data
+    """
+    streaming = config.get(constants.CONFIG_STREAMING)
+    if streaming is not None:
+        return streaming
+    return os.path.getsize(data_path) >= constants.STREAMING_MIN_FILE_SIZE
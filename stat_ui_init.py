@@ -1,21 +1,88 @@
 import os
+import sys
+import json
+import threading
+
+import stat_config
+import stat_writer
+import constants
+
+
+def get_settings_dir():
+    """
+    get the per-user directory of the settings, independent of the working directory
+    :return: THSTAT_SETTINGS_DIR if set, else the thstat folder in %APPDATA% on Windows or in $XDG_CONFIG_HOME
+    (~/.config by default) elsewhere
+    """
+    if os.environ.get(constants.ENV_SETTINGS_DIR):
+        return os.environ[constants.ENV_SETTINGS_DIR]
+    if sys.platform == 'win32' and os.environ.get('APPDATA'):
+        base_dir = os.environ['APPDATA']
+    else:
+        base_dir = os.environ.get('XDG_CONFIG_HOME') or os.path.join(os.path.expanduser('~'), '.config')
+    return os.path.join(base_dir, constants.SETTINGS_DIR_NAME)
+
+
+def read_legacy_history(legacy_path):
+    """
+    read the line-based ui.init of older versions, one key:value per line
+    a value that contained a newline was split over several lines; the lines without a key are skipped
+    :param legacy_path: the path to ui.init
+    :return: a dict {key: value}
+    """
+    history = {}
+    with open(legacy_path, mode='r', encoding='UTF-8') as f:
+        for line in f.readlines():
+            if ':' not in line:
+                continue
+            split_idx = line.index(':')
+            history[line[:split_idx]] = line[split_idx + 1:].rstrip('\n')
+    # older versions stored the workspace as a json string
+    if constants.KEY_WORKSPACE_CONFIG_PATHS in history:
+        try:
+            history[constants.KEY_WORKSPACE_CONFIG_PATHS] = json.loads(history[constants.KEY_WORKSPACE_CONFIG_PATHS])
+        except json.JSONDecodeError:
+            del history[constants.KEY_WORKSPACE_CONFIG_PATHS]
+    return history
 
 
 class UIHistory:
-    def __init__(self):
-        if os.path.exists('ui.init'):
-            ui_history_file = open('ui.init', mode='r', encoding='UTF-8')
-            ui_history = {}
-            for line in ui_history_file.readlines():
-                split_idx = line.index(':')
-                key = line[:split_idx]
-                value = line[split_idx + 1:].rstrip('\n')
-                ui_history[key] = value
+    """
+    The values the user last selected in the menus, plus the ui state of the recently used configs.
+    Everything is kept in memory; a change only schedules a write, so a burst of changes becomes a single write
+    by a background thread, which replaces the json settings file atomically.
+    The file lives in the per-user settings directory (see get_settings_dir); the ui.init of older versions,
+    found in the working directory or next to the program, is migrated on the first run.
+    """
+    def __init__(self, settings_dir=None, write_delay=constants.SETTINGS_WRITE_DELAY):
+        if settings_dir is None:
+            settings_dir = get_settings_dir()
+        self.settings_path = os.path.join(settings_dir, constants.SETTINGS_FILE_NAME)
+        # history[key] = value, configs[absolute config path][key] = value, least recently used config first
+        self.history = {}
+        self.configs = {}
+        self.lock = threading.Lock()  # guards history and configs against the writer thread
+
+        migrated = False
+        if os.path.exists(self.settings_path):
+            try:
+                with open(self.settings_path, mode='r', encoding='UTF-8') as f:
+                    settings = json.load(f)
+                self.history = settings.get('History', {})
+                self.configs = settings.get('Configs', {})
+            except (OSError, ValueError) as e:
+                print(f'Failed to read the settings, using the defaults: {type(e).__name__}: {e}')
         else:
-            # use default settings
-            ui_history = {}
+            for legacy_dir in [os.getcwd(), os.path.dirname(os.path.abspath(__file__))]:
+                legacy_path = os.path.join(legacy_dir, constants.LEGACY_UI_HISTORY_FILE_NAME)
+                if os.path.exists(legacy_path):
+                    self.history = read_legacy_history(legacy_path)
+                    migrated = True
+                    break
 
-        self.history = ui_history
+        self.writer = stat_writer.BackgroundWriter(self.write_to_file, coalesce_delay=write_delay)
+        if migrated:
+            self.writer.request()
 
     def has(self, key):
         return key in self.history
@@ -24,10 +91,58 @@ class UIHistory:
         return self.history[key]
 
     def set(self, key, value):
-        self.history[key] = value
-        self.write_to_file()
+        """
+        :param key: the key
+        :param value: any json value
+        """
+        with self.lock:
+            if key in self.history and self.history[key] == value:
+                return
+            self.history[key] = value
+        self.writer.request()
+
+    def get_config_value(self, config_path, key, default=None):
+        """
+        :param config_path: the path to the config file
+        :param key: the key
+        :param default: returned if nothing is stored for the config under the key
+        :return: the stored value
+        """
+        return self.configs.get(os.path.abspath(config_path), {}).get(key, default)
+
+    def set_config_value(self, config_path, key, value):
+        """
+        remember a value for a config, making it the most recently used config
+        :param config_path: the path to the config file
+        :param key: the key
+        :param value: any json value
+        """
+        config_path = os.path.abspath(config_path)
+        with self.lock:
+            config_values = self.configs.pop(config_path, {})
+            config_values[key] = value
+            self.configs[config_path] = config_values
+            while len(self.configs) > constants.SETTINGS_MAX_CONFIGS:
+                del self.configs[next(iter(self.configs))]
+        self.writer.request()
 
     def write_to_file(self):
-        with open('ui.init', mode='w', encoding='UTF-8') as f:
-            for key, value in self.history.items():
-                f.write(f'{key}:{value}\n')
+        """
+        write the settings file, run by the writer thread
+        """
+        with self.lock:
+            text = json.dumps({'History': self.history, 'Configs': self.configs}, ensure_ascii=False, indent=4)
+        os.makedirs(os.path.dirname(self.settings_path), exist_ok=True)
+        stat_config.write_file_atomic(self.settings_path, text)
+
+    def flush(self):
+        """
+        wait until every change has been written
+        """
+        self.writer.flush()
+
+    def close(self):
+        """
+        write the pending changes before the program exits
+        """
+        self.writer.close()
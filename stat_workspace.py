@@ -0,0 +1,163 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import batch_report
+import stat_database
+import constants
+
+
+class Workspace:
+    """
+    Several configs kept open at once, for switching games without restarting.
+    Databases are opened concurrently on a thread pool; finished loads are picked up by poll, which the UI thread
+    calls, so the loaded databases are only ever touched by that thread.
+    At most max_loaded databases stay in memory: the least recently used one is closed once another one loads.
+    A summary report of every config (see batch_report.summarize_database) is kept, also after eviction,
+    so the dashboard can show every config without keeping them all loaded.
+    """
+    def __init__(self, config_paths=(), max_loaded=constants.WORKSPACE_MAX_LOADED,
+                 worker_count=constants.WORKSPACE_LOAD_WORKERS):
+        self.config_paths = []
+        self.max_loaded = max_loaded
+        self.executor = ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix='thstat-load')
+        self.loading = {}  # config path -> future of (database, summary)
+        self.databases = OrderedDict()  # config path -> StatDatabase, least recently used first
+        self.summaries = {}  # config path -> report dict, or a dict with an 'Error' key if the load failed
+        for config_path in config_paths:
+            self.add_config(config_path)
+
+    def add_config(self, config_path):
+        """
+        add a config to the workspace and start loading it in the background
+        :param config_path: the path to the config file
+        """
+        config_path = os.path.abspath(config_path)
+        if config_path not in self.config_paths:
+            self.config_paths.append(config_path)
+        self.load(config_path)
+
+    def remove_config(self, config_path):
+        """
+        remove a config from the workspace, closing its database
+        :param config_path: the path to the config file
+        """
+        self.poll(wait_path=config_path)
+        self.config_paths.remove(config_path)
+        self.summaries.pop(config_path, None)
+        if config_path in self.databases:
+            self.databases.pop(config_path).close()
+
+    def load(self, config_path):
+        """
+        start loading a config in the background unless it is loaded or loading already
+        :param config_path: the path to the config file
+        """
+        if config_path not in self.databases and config_path not in self.loading:
+            self.loading[config_path] = self.executor.submit(load_database, config_path)
+
+    def load_all(self):
+        """
+        start loading every config that has no summary yet, for the dashboard
+        """
+        for config_path in self.config_paths:
+            if config_path not in self.summaries:
+                self.load(config_path)
+
+    def poll(self, wait_path=None):
+        """
+        pick up the loads that have finished and evict the least recently used databases
+        :param wait_path: a config path whose load to wait for
+        :return: True if anything was picked up
+        """
+        if wait_path in self.loading:
+            self.loading[wait_path].exception()  # waits without raising
+        finished = [config_path for config_path, future in self.loading.items() if future.done()]
+        for config_path in finished:
+            future = self.loading.pop(config_path)
+            try:
+                database, summary = future.result()
+            except Exception as e:
+                self.summaries[config_path] = {'ConfigPath': config_path, 'Error': f'{type(e).__name__}: {e}'}
+                continue
+            self.summaries[config_path] = summary
+            self.databases[config_path] = database
+            if config_path == wait_path:
+                self.databases.move_to_end(config_path)
+            else:
+                self.databases.move_to_end(config_path, last=False)  # a background load is not a use
+        self.evict(keep_path=wait_path)
+        return len(finished) != 0
+
+    def evict(self, keep_path=None):
+        """
+        close the least recently used databases beyond max_loaded
+        :param keep_path: a config path that is never evicted
+        """
+        while len(self.databases) > self.max_loaded:
+            config_path = next(iter(self.databases))
+            if config_path == keep_path:
+                if len(self.databases) == 1:
+                    break
+                self.databases.move_to_end(config_path)
+                continue
+            database = self.databases.pop(config_path)
+            self.summaries[config_path] = batch_report.summarize_database(config_path, database)
+            database.close()
+
+    def get_database(self, config_path):
+        """
+        get the database of a config, waiting for its load if needed; it becomes the most recently used
+        :param config_path: the path to the config file
+        :return: the StatDatabase, or None if it could not be loaded
+        """
+        self.load(config_path)
+        self.poll(wait_path=config_path)
+        if config_path not in self.databases:
+            return None
+        self.databases.move_to_end(config_path)
+        return self.databases[config_path]
+
+    def refresh_summary(self, config_path):
+        """
+        recompute the summary of a loaded config after its data changed
+        :param config_path: the path to the config file
+        """
+        if config_path in self.databases:
+            self.summaries[config_path] = batch_report.summarize_database(config_path, self.databases[config_path])
+
+    def get_status(self, config_path):
+        """
+        :param config_path: the path to the config file
+        :return: 'Loading', 'Loaded', 'Failed' or 'Unloaded'
+        """
+        if config_path in self.loading:
+            return 'Loading'
+        if config_path in self.databases:
+            return 'Loaded'
+        if 'Error' in self.summaries.get(config_path, {}):
+            return 'Failed'
+        return 'Unloaded'
+
+    def is_loading(self):
+        return len(self.loading) != 0
+
+    def close(self):
+        """
+        wait for the pending loads and close every database
+        """
+        self.executor.shutdown(wait=True)
+        self.poll()
+        for database in self.databases.values():
+            database.close()
+        self.databases.clear()
+
+
+def load_database(config_path):
+    """
+    open the database of a config and summarize it, run on a worker thread
+    :param config_path: the path to the config file
+    :return: (database, summary report)
+    """
+    database = stat_database.open_database(config_path)
+    return database, batch_report.summarize_database(config_path, database)
@@ -0,0 +1,66 @@
+import time
+import threading
+
+import constants
+
+
+class BackgroundWriter:
+    """
+    Runs a write function on a background thread whenever a write is requested.
+    Requests that arrive while a write is waiting or running are coalesced: the write function reads the
+    latest state itself, so a burst of requests ends in at most one write after the current one.
+    """
+    def __init__(self, write_function, coalesce_delay=constants.COMMIT_COALESCE_DELAY):
+        self.write_function = write_function
+        self.coalesce_delay = coalesce_delay
+        self.condition = threading.Condition()
+        self.requested = False
+        self.writing = False
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name='thstat-writer', daemon=True)
+        self.thread.start()
+
+    def request(self):
+        """
+        ask for a write, without waiting for it
+        """
+        with self.condition:
+            self.requested = True
+            self.condition.notify_all()
+
+    def flush(self):
+        """
+        wait until every requested write has been written
+        """
+        with self.condition:
+            while self.requested or self.writing:
+                self.condition.wait()
+
+    def close(self):
+        """
+        write what is still requested and stop the thread
+        """
+        self.flush()
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.requested and not self.closed:
+                    self.condition.wait()
+                if not self.requested:  # closed with nothing left to write
+                    return
+            time.sleep(self.coalesce_delay)  # let the rest of the burst arrive
+            with self.condition:
+                self.requested = False
+                self.writing = True
+            try:
+                self.write_function()
+            except Exception as e:  # keep the thread alive, the next commit writes the whole state again
+                print(f'Failed to save the data: {type(e).__name__}: {e}')
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
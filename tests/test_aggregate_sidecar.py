@@ -0,0 +1,119 @@
+import os
+import json
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import util
+import stat_config
+import stat_database
+import stat_lazy
+import constants
+
+
+class AggregateSidecarTest(unittest.TestCase):
+    """
+    the counters of a database reopened from its aggregate sidecar match a recount of its results
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='thstat-test-')
+        self.rng = random.Random(24)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def create_config(self, storage):
+        config_path = util.write_config(os.path.join(self.work_dir, storage), storage)
+        stat_config.write_file_atomic(stat_config.get_data_path(config_path),
+                                      json.dumps(util.generate_data(config_path, 12, 6)))
+        database = stat_database.open_database(config_path)  # counts every session and saves the sidecar
+        database.close()
+        self.assertTrue(os.path.exists(stat_config.get_aggregates_path(config_path)))
+        return config_path
+
+    def open_counting(self, config_path):
+        """
+        :return: (the database, the number of sessions counted from their results when it was opened)
+        """
+        with mock.patch('stat_lazy.count_session_outcomes', wraps=stat_lazy.count_session_outcomes) as count:
+            database = stat_database.open_database(config_path)
+        return database, count.call_count
+
+    def check_counts(self, database):
+        for stage_id in database.get_config_stage_dict():
+            (session_caps, session_attempts, _), (total_cap, total_attempt, _) = \
+                database.aggregate_cap_rates(stage_id)
+            self.assertEqual((total_cap, total_attempt), util.recount(database, stage_id))
+            for session_id, session_cap, session_attempt in zip(database.get_session_ids(), session_caps,
+                                                                session_attempts):
+                counts = stat_lazy.count_session_outcomes(database.get_session(session_id),
+                                                          database.get_config_stage_dict())
+                self.assertEqual((session_cap, session_attempt), counts[stage_id])
+
+    def mutate(self, database):
+        """
+        add to and pop from old sessions, remove one and add a new one
+        :return: the number of sessions the changes leave to be counted again
+        """
+        config_stages = database.get_config_stage_dict()
+        session_ids = database.get_session_ids()
+        database.add_game_result(session_ids[0], util.random_result(self.rng, config_stages))
+        database.add_game_result(session_ids[1], util.random_result(self.rng, config_stages))
+        database.pop_game_result(session_ids[1])
+        database.pop_game_result(session_ids[0])
+        database.remove_game_session(session_ids[2])
+        added_id = database.add_game_session('2024-02-01', {})
+        database.add_game_result(added_id, util.random_result(self.rng, config_stages))
+        database.commit()
+        database.flush()
+        return 3
+
+    def test_reopen(self):
+        for storage in [constants.STORAGE_JSON, constants.STORAGE_JOURNAL]:
+            with self.subTest(storage=storage):
+                config_path = self.create_config(storage)
+                database, counted = self.open_counting(config_path)
+                self.assertEqual(counted, 0)
+                self.check_counts(database)
+                self.mutate(database)
+                database.close()  # the data file is rewritten along with its sidecar
+
+                database, counted = self.open_counting(config_path)
+                self.assertEqual(counted, 0)
+                self.check_counts(database)
+                database.close()
+
+    def test_journal_tail(self):
+        config_path = self.create_config(constants.STORAGE_JOURNAL)
+        database = stat_database.open_database(config_path)
+        changed_count = self.mutate(database)
+        # left without close, as after a crash: the changes are only in the journal
+        self.assertNotEqual(len(stat_config.read_journal(config_path)), 0)
+        database, counted = self.open_counting(config_path)
+        self.assertEqual(counted, changed_count)
+        self.check_counts(database)
+        database.close()
+
+    def test_stale_data_hash(self):
+        for storage in [constants.STORAGE_JSON, constants.STORAGE_JOURNAL]:
+            with self.subTest(storage=storage):
+                config_path = self.create_config(storage)
+                # the data file is changed behind the sidecar's back
+                data_path = stat_config.get_data_path(config_path)
+                with open(data_path, mode='r', encoding='UTF-8') as f:
+                    data = json.load(f)
+                sessions = data[constants.DATA_DATA]
+                sessions[0][constants.DATA_RESULT] = sessions[0][constants.DATA_RESULT][1:]
+                sessions.append(util.generate_data(config_path, 1, 6, seed=1)[constants.DATA_DATA][0])
+                stat_config.write_file_atomic(data_path, json.dumps(data))
+
+                database, counted = self.open_counting(config_path)
+                self.assertEqual(counted, len(sessions))
+                self.check_counts(database)
+                database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
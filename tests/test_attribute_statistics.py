@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import util
+import stat_database
+import constants
+
+
+class AttributeStatisticsTest(unittest.TestCase):
+    """
+    the statistics by attribute of a value whose sessions have no outcome in a stage, in every storage
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='thstat-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def create_database(self, storage):
+        return stat_database.open_database(util.write_config(os.path.join(self.work_dir, storage), storage))
+
+    def check_storage(self, storage):
+        database = self.create_database(storage)
+        config_stages = database.get_config_stage_dict()
+        first_stage_id, second_stage_id = list(config_stages)[:2]
+        values = database.config['Keyboards']['Values']
+        # values[0] plays both stages, values[1] quits in the first stage, values[2] only has an empty session
+        played = database.add_game_session('2024-01-01', {'Keyboards': values[0]})
+        database.add_game_result(played, {first_stage_id: [1] * len(config_stages[first_stage_id]),
+                                          second_stage_id: [0, 1]})
+        quit_early = database.add_game_session('2024-01-02', {'Keyboards': values[1]})
+        database.add_game_result(quit_early, {first_stage_id: [1, 0], second_stage_id: []})
+        database.add_game_session('2024-01-03', {'Keyboards': values[2]})
+        database.commit()
+
+        grouped_rates = database.aggregate_cap_rates_by_attribute(second_stage_id, 'Keyboards')
+        self.assertEqual(sorted(grouped_rates), sorted(values))
+        for value in values[1:]:
+            self.assertEqual(grouped_rates[value][1], [0] * len(config_stages[second_stage_id]))
+        self.assertEqual(grouped_rates[values[0]][0][:2], [0, 1])
+        summaries = database.compute_summary_statistics_by_attribute('Keyboards')
+        self.assertEqual(sorted(summaries), sorted(values))
+        database.close()
+        return summaries
+
+    def test_storages_agree(self):
+        expected = self.check_storage(constants.STORAGE_JSON)
+        for storage in [constants.STORAGE_JOURNAL, constants.STORAGE_BINARY, constants.STORAGE_SQLITE]:
+            with self.subTest(storage=storage):
+                self.assertEqual(self.check_storage(storage), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
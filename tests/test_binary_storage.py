@@ -0,0 +1,83 @@
+import os
+import json
+import copy
+import random
+import shutil
+import tempfile
+import unittest
+
+import util
+import stat_binary
+import stat_config
+import stat_database
+import constants
+
+
+class BinaryStorageTest(unittest.TestCase):
+    """
+    binary data files hold the same sessions as the json data they were converted from
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='thstat-test-')
+        self.config_path = util.write_config(self.work_dir, constants.STORAGE_BINARY)
+        self.config_stages = stat_config.load_config_file(self.config_path)[constants.CONFIG_CHAPTERS]
+        self.data = util.generate_data(self.config_path, 8, 6)
+        stat_config.write_file_atomic(stat_config.get_data_path(self.config_path), json.dumps(self.data))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        stat_binary.json_to_binary(self.config_path)
+        os.remove(stat_config.get_data_path(self.config_path))
+        stat_binary.binary_to_json(self.config_path)
+        with open(stat_config.get_data_path(self.config_path), mode='r', encoding='UTF-8') as f:
+            self.assertEqual(json.load(f)[constants.DATA_DATA], self.data[constants.DATA_DATA])
+
+    def test_save_with_undecoded_sessions(self):
+        binary_path = stat_config.get_binary_path(self.config_path)
+        stat_binary.json_to_binary(self.config_path)
+        data = stat_binary.load_data(binary_path)
+        sessions = data[constants.DATA_DATA]
+        expected = copy.deepcopy(self.data[constants.DATA_DATA])
+
+        # decode and change some sessions, leave the others undecoded
+        new_result = util.random_result(random.Random(1), self.config_stages)
+        sessions[1][constants.DATA_RESULT].append(new_result)
+        expected[1][constants.DATA_RESULT].append(new_result)
+        sessions[3]['Attributes'] = {'Keyboards': 'a keyboard added later'}
+        expected[3]['Attributes'] = {'Keyboards': 'a keyboard added later'}
+        del sessions[5]
+        del expected[5]
+        sessions.append({'Date': '2024-02-01', 'Attributes': {}, constants.DATA_RESULT: [new_result]})
+        expected.append({'Date': '2024-02-01', 'Attributes': {}, constants.DATA_RESULT: [new_result]})
+        self.assertFalse(sessions.is_loaded(0))
+
+        stat_binary.save_data(binary_path, self.config_stages, data)
+        self.assertEqual(list(sessions), expected)  # sessions left undecoded still read from the new file
+        sessions.close()
+        saved_sessions = stat_binary.load_data(binary_path)[constants.DATA_DATA]
+        self.assertEqual(list(saved_sessions), expected)
+        saved_sessions.close()
+
+    def test_range_checks(self):
+        binary_path = stat_config.get_binary_path(self.config_path)
+        with self.assertRaises(ValueError):
+            stat_binary.save_data(binary_path, {'stage': [''] * (stat_binary.MAX_CHAPTERS + 1)},
+                                  {constants.DATA_DATA: []})
+        sessions = [{'Date': '2024-01-01', 'Attributes': {'Keyboards': str(i)}, constants.DATA_RESULT: []}
+                    for i in range(stat_binary.MAX_ATTRIBUTE_VALUES + 1)]
+        with self.assertRaises(ValueError):
+            stat_binary.save_data(binary_path, self.config_stages, {constants.DATA_DATA: sessions})
+        self.assertFalse(os.path.exists(binary_path))
+
+    def test_close_releases_the_file(self):
+        database = stat_database.open_database(self.config_path)
+        sessions = database.data[constants.DATA_DATA]
+        database.close()
+        self.assertTrue(sessions.buffer.closed)
+        self.assertTrue(sessions.file.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
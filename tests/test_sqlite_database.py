@@ -0,0 +1,43 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import util
+import stat_config
+import stat_database
+import constants
+
+
+class SqliteSessionTest(unittest.TestCase):
+    """
+    the session dicts of SQLite storage, which keeps no data dict, match those of JSON storage
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='thstat-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def test_sessions_match_json(self):
+        json_path = util.write_config(os.path.join(self.work_dir, 'json'))
+        data = util.generate_data(json_path, 6, 5)
+        stat_config.write_file_atomic(stat_config.get_data_path(json_path), json.dumps(data))
+        sqlite_path = util.write_config(os.path.join(self.work_dir, 'sqlite'), constants.STORAGE_SQLITE)
+        stat_config.write_file_atomic(stat_config.get_data_path(sqlite_path), json.dumps(data))  # migrated on open
+
+        json_database = stat_database.open_database(json_path)
+        sqlite_database = stat_database.open_database(sqlite_path)
+        self.assertEqual(json_database.get_session_ids(), sqlite_database.get_session_ids())
+        for session_id in json_database.get_session_ids():
+            self.assertEqual(sqlite_database.peek_session(session_id), json_database.peek_session(session_id))
+            self.assertEqual(sqlite_database.get_session(session_id), json_database.get_session(session_id))
+        with self.assertRaises(KeyError):
+            sqlite_database.get_session(-1)
+        json_database.close()
+        sqlite_database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import json
+import copy
+import random
+import shutil
+import tempfile
+import unittest
+
+import util
+import stat_config
+import stat_database
+import stat_stream
+import constants
+
+
+class StreamedSaveTest(unittest.TestCase):
+    """
+    saving a streamed data file copies the sessions left undecoded and writes the others, giving the same data
+    """
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp(prefix='thstat-test-')
+        self.config_path = util.write_config(self.work_dir, **{constants.CONFIG_STREAMING: True})
+        self.config_stages = stat_config.load_config_file(self.config_path)[constants.CONFIG_CHAPTERS]
+        self.data = util.generate_data(self.config_path, constants.STREAMING_MATERIALIZED_SESSIONS + 10, 4)
+        self.data_path = stat_config.get_data_path(self.config_path)
+        stat_config.write_file_atomic(self.data_path, stat_config.serialize_data(self.data))
+        self.rng = random.Random(15)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def check_saved(self, expected):
+        with open(self.data_path, mode='r', encoding='UTF-8') as f:
+            saved = json.load(f)
+        self.assertEqual(saved, json.loads(stat_config.serialize_data(expected)))
+
+    def test_save_old_and_new_sessions(self):
+        database = stat_database.open_database(self.config_path)
+        sessions = database.data[constants.DATA_DATA]
+        self.assertIsInstance(sessions, stat_stream.StreamedSessionList)
+        self.assertFalse(sessions.is_loaded(0))
+        expected = copy.deepcopy(self.data)
+        expected[constants.DATA_SESSION_IDS] = list(range(len(expected[constants.DATA_DATA])))
+        expected[constants.DATA_NEXT_SESSION_ID] = len(expected[constants.DATA_DATA])
+        session_ids = database.get_session_ids()
+
+        for round_idx in range(2):  # the second round saves through the handles remapped by the first
+            result = util.random_result(self.rng, self.config_stages)
+            old_id, new_id = session_ids[round_idx], session_ids[-1]
+            database.add_game_result(old_id, result)
+            expected[constants.DATA_DATA][old_id][constants.DATA_RESULT].append(result)
+            database.add_game_result(new_id, result)
+            expected[constants.DATA_DATA][new_id][constants.DATA_RESULT].append(result)
+            if database.get_session_result_count(session_ids[5]) != 0:
+                database.pop_game_result(session_ids[5])
+                expected[constants.DATA_DATA][5][constants.DATA_RESULT].pop()
+            database.commit()
+            database.flush()
+            self.check_saved(expected)
+            self.assertFalse(sessions.is_loaded(8))  # still copied from the file
+
+        added_id = database.add_game_session('2024-02-01', {'Keyboards': 'keyboard 1'})
+        database.add_game_result(added_id, result)
+        database.commit()
+        database.flush()
+        expected[constants.DATA_DATA].append({'Date': '2024-02-01', 'Attributes': {'Keyboards': 'keyboard 1'},
+                                              constants.DATA_RESULT: [result]})
+        expected[constants.DATA_SESSION_IDS].append(added_id)
+        expected[constants.DATA_NEXT_SESSION_ID] = added_id + 1
+        self.check_saved(expected)
+        database.close()
+
+        reopened = stat_database.open_database(self.config_path)
+        self.assertEqual([reopened.peek_session(session_id) for session_id in reopened.get_session_ids()],
+                         expected[constants.DATA_DATA])
+        reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
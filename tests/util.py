@@ -0,0 +1,80 @@
+import os
+import sys
+import json
+import random
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import constants
+
+
+def write_config(directory, storage=None, **config_options):
+    """
+    write a copy of the sample config into a directory
+    :param directory: the directory, created if needed
+    :param storage: the value of the Storage config key, None for the default
+    :param config_options: other config keys to set
+    :return: the path to the config file
+    """
+    with open(os.path.join(REPO_DIR, 'datafiles', 'config.json'), mode='r', encoding='UTF-8') as f:
+        config = json.load(f)
+    if storage is not None:
+        config[constants.CONFIG_STORAGE] = storage
+    config.update(config_options)
+    os.makedirs(directory, exist_ok=True)
+    config_path = os.path.join(directory, 'config.json')
+    with open(config_path, mode='w', encoding='UTF-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    return config_path
+
+
+def random_result(rng, config_stages):
+    """
+    :param rng: a random.Random
+    :param config_stages: the Chapters dict of the config
+    :return: a result that quits at a random chapter, or not at all
+    """
+    result = {}
+    playing = True
+    for stage_id, chapters_list in config_stages.items():
+        outcomes = []
+        for _ in chapters_list:
+            if not playing or rng.random() < 0.08:
+                playing = False
+                break
+            outcomes.append(1 if rng.random() < 0.7 else 0)
+        result[stage_id] = outcomes
+    return result
+
+
+def generate_data(config_path, session_count, run_count, seed=0):
+    """
+    :return: a data dict of session_count sessions of up to run_count random runs, for the config
+    """
+    rng = random.Random(seed)
+    with open(config_path, mode='r', encoding='UTF-8') as f:
+        config = json.load(f)
+    sessions = []
+    for i in range(session_count):
+        sessions.append({
+            'Date': f'2024-01-{1 + i % 28:02d}',
+            'Attributes': {'Keyboards': rng.choice(config['Keyboards']['Values'])},
+            constants.DATA_RESULT: [random_result(rng, config[constants.CONFIG_CHAPTERS])
+                                    for _ in range(rng.randint(0, run_count))],
+        })
+    return {constants.DATA_DATA: sessions}
+
+
+def recount(database, stage_id):
+    """
+    count the captures and attempts of a stage from the results themselves
+    :return: (cap_list, attempt_list)
+    """
+    chapter_count = len(database.get_config_stage_dict()[stage_id])
+    capture_list, attempt_list = [0] * chapter_count, [0] * chapter_count
+    for result in database.iter_game_results():
+        for j, success in enumerate(result[stage_id]):
+            capture_list[j] += success
+            attempt_list[j] += 1
+    return capture_list, attempt_list